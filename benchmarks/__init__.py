@@ -0,0 +1 @@
+name = 'benchmarks'
@@ -0,0 +1,61 @@
+"""
+Measures what keep-alive connection pooling saves when many feeds are fetched
+from one host, against a local HTTPS stand-in server.  Needs `openssl` on the
+path to create a throwaway certificate.
+
+Run from the repository root: `python -m benchmarks.bench_fetch`
+"""
+import asyncio
+import os
+import ssl
+import subprocess
+import tempfile
+from time import perf_counter
+
+from vehicular.fetch import Fetcher
+from tests.stand_in import FeedServer, read_feed
+
+REQUESTS = 200
+CONCURRENCY = 8
+
+
+def make_certificate(directory: str) -> str:
+    """
+    Creates a self-signed certificate for 127.0.0.1, returns the PEM file
+    holding both certificate and key
+    """
+    path = os.path.join(directory, 'stand_in.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+                    '-keyout', path, '-out', path],
+                   check=True, capture_output=True)
+    return path
+
+
+async def run(url: str, context: ssl.SSLContext, pool_size: int):
+    """
+    Fetches url REQUESTS times, returns elapsed seconds and connections opened
+    """
+    async with Fetcher(CONCURRENCY, host_rate=1e6, host_burst=REQUESTS,
+                       pool_size=pool_size, ssl_context=context) as fetcher:
+        start = perf_counter()
+        await asyncio.gather(*(fetcher.fetch(url) for _ in range(REQUESTS)))
+        return perf_counter() - start, fetcher.pool.opened
+
+
+def main() -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        pem = make_certificate(directory)
+        context = ssl.create_default_context(cafile=pem)
+        with FeedServer(pem) as server:
+            server.routes['/feed'] = 200, {}, read_feed('denver_motorcycles.rss')
+            url = server.url('/feed')
+            print(f'{REQUESTS} HTTPS requests, {CONCURRENCY} at a time')
+            print(f'{"mode":<20}{"seconds":>10}{"handshakes":>12}{"req/s":>10}')
+            for label, pool_size in ('no keep-alive', 0), (f'pool of {CONCURRENCY}', CONCURRENCY):
+                elapsed, opened = asyncio.run(run(url, context, pool_size))
+                print(f'{label:<20}{elapsed:>10.3f}{opened:>12}{REQUESTS / elapsed:>10.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,49 @@
+"""
+Measures the memory a big run's new posts take, kept as feedparser's
+entries, as the parser's entry dicts, and as Listings.
+
+Run from the repository root: `python -m benchmarks.bench_listing`
+"""
+from itertools import cycle, islice
+import pickle
+import tracemalloc
+
+import feedparser as fp
+
+from vehicular.listing import Listing
+from vehicular.parser import parse_feed
+from tests.stand_in import read_feed
+
+FEEDS = 'denver_dualsport.rss', 'denver_motorcycles.rss'
+LISTINGS = 4000
+
+
+def measure(build) -> int:
+    """
+    Returns the bytes still allocated by what `build` returns
+    """
+    tracemalloc.start()
+    kept = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del kept
+    return size
+
+
+def main() -> None:
+    bodies = [read_feed(name) for name in FEEDS]
+    # Copies of each entry, as distinct posts would be
+    builds = {'feedparser': lambda: [pickle.loads(pickle.dumps(entry)) for entry in islice(
+                  cycle(entry for body in bodies for entry in fp.parse(body).entries), LISTINGS)],
+              'dict': lambda: [pickle.loads(pickle.dumps(entry)) for entry in islice(
+                  cycle(entry for body in bodies for entry in parse_feed(body)), LISTINGS)],
+              'Listing': lambda: [pickle.loads(pickle.dumps(Listing.from_entry(entry))) for entry in islice(
+                  cycle(entry for body in bodies for entry in parse_feed(body)), LISTINGS)]}
+    print(f'{"record":<12}{"total":>10}{"each":>10}')
+    for name, build in builds.items():
+        size = measure(build)
+        print(f'{name:<12}{size / 1024:>8.0f}kB{size / LISTINGS:>9.0f}B')
+
+
+if __name__ == '__main__':
+    main()
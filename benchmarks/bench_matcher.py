@@ -0,0 +1,91 @@
+"""
+Matches the listings of a recorded feed against 10 to 5000 searches, each
+with make / model and exclude words, checking every search's own patterns
+in turn, and with a single Matcher for all of them.  Matcher's throughput
+is not flat: on the development machine it fell from about 248k listings/s
+at 10 searches to about 119k at 5000, since more searches find more words
+in each listing.  It stays far ahead of checking each search in turn.
+
+Run from the repository root: `python -m benchmarks.bench_matcher`
+"""
+from itertools import cycle, islice
+from random import Random
+import re
+from timeit import repeat
+
+from vehicular.filters import Criteria, Matcher
+from vehicular.parser import parse_listings
+from tests.stand_in import read_feed
+
+SEARCHES = 10, 100, 1000, 5000
+LISTINGS = 200
+# Words listings are made of, which searches pick from
+MAKES = 'suzuki', 'honda', 'kawasaki', 'yamaha', 'ktm', 'husqvarna', 'bmw', 'ducati', 'triumph'
+EXCLUDES = 'parts', 'wanted', 'trade', 'salvage', 'project', 'rebuilt', 'lien', 'missing'
+
+
+def best(func) -> float:
+    """
+    Returns the best time per call, in milliseconds
+    """
+    return min(repeat(func, number=1, repeat=5)) * 1000
+
+
+def searches(count: int, vocabulary: list, random: Random) -> list:
+    """
+    Builds `count` searches, mostly distinct models along with their make
+    """
+    result = []
+    for _ in range(count):
+        model = random.choice(vocabulary)
+        result.append(Criteria({'auto_make_model': f'{random.choice(MAKES)} {model}',
+                                'exclude': ' '.join(random.sample(EXCLUDES, 2))}))
+    return result
+
+
+def each(criteria: list, listings: list) -> int:
+    """
+    Checks every search with its own patterns, one search at a time
+    """
+    patterns = [(re.compile(''.join(f'(?=.*?{re.escape(word)})' for word in search.keywords),
+                            re.IGNORECASE | re.DOTALL),
+                 re.compile(r'\b(?:' + '|'.join(map(re.escape, search.exclude)) + ')', re.IGNORECASE))
+                for search in criteria]
+    matches = 0
+    for listing in listings:
+        text = f'{listing.title}\n{listing.summary}'
+        for keywords, exclude in patterns:
+            if keywords.match(text) and not exclude.search(text):
+                matches += 1
+    return matches
+
+
+def combined(criteria: list, listings: list) -> int:
+    """
+    Checks every search at once with a Matcher
+    """
+    matcher = Matcher(criteria)
+    return sum(len(matcher.match(listing)) for listing in listings)
+
+
+def main() -> None:
+    random = Random(0)
+    feed = parse_listings(read_feed('denver_motorcycles.rss'))
+    listings = list(islice(cycle(feed), LISTINGS))
+    # Model names from the feed, plus made up ones, as there'd be for thousands of searches
+    vocabulary = sorted({word.lower() for listing in feed for word in listing.title.split()[2:-1]})
+    vocabulary += [f'{prefix}{number}' for prefix in ('rx', 'gs', 'vt', 'cr', 'yz')
+                   for number in range(100, 2000, 5)]
+    print(f'{"searches":>8}{"each":>12}{"combined":>12}{"listings/s":>14}')
+    for count in SEARCHES:
+        criteria = searches(count, vocabulary, random)
+        assert each(criteria, listings) == combined(criteria, listings)
+        matcher = Matcher(criteria)
+        elapsed = best(lambda: [matcher.match(listing) for listing in listings])
+        print(f'{count:>8}{best(lambda: each(criteria, listings)):>10.1f}ms'
+              f'{best(lambda: combined(criteria, listings)):>10.1f}ms'
+              f'{LISTINGS / elapsed * 1000:>14.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Parses a run's worth of feeds on the event loop's thread and in a ParsePool.
+The fast parser is switched off, since feedparser is what the pool is for.
+
+Run from the repository root: `python -m benchmarks.bench_parse_pool`
+"""
+import asyncio
+import os
+from time import perf_counter
+
+from vehicular.parser import ParsePool
+from tests.stand_in import read_feed
+
+FEEDS = 200
+
+
+async def run(pool: ParsePool, body: bytes) -> float:
+    """
+    Returns the time taken to parse FEEDS copies of body, in seconds
+    """
+    start = perf_counter()
+    await asyncio.gather(*(pool.parse(body) for _ in range(FEEDS)))
+    return perf_counter() - start
+
+
+def main() -> None:
+    body = read_feed('denver_motorcycles.rss')
+    print(f'{FEEDS} feeds, {os.cpu_count()} cores')
+    for processes in 0, os.cpu_count():
+        with ParsePool(processes, fast_parser=False) as pool:
+            # Start the workers before timing
+            asyncio.run(run(pool, body))
+            print(f'{processes:>3} processes: {asyncio.run(run(pool, body)):.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,37 @@
+"""
+Compares the streaming craigslist parser against feedparser on recorded feeds.
+
+Run from the repository root: `python -m benchmarks.bench_parser`
+"""
+from timeit import repeat
+
+import feedparser as fp
+
+from vehicular.parser import parse_feed
+from tests.stand_in import read_feed
+
+FEEDS = 'denver_dualsport.rss', 'denver_motorcycles.rss'
+NUMBER = 50
+
+
+def best(func) -> float:
+    """
+    Returns the best time per call, in milliseconds
+    """
+    return min(repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1000
+
+
+def main() -> None:
+    print(f'{"feed":<26}{"entries":>8}{"feedparser":>12}{"fast":>10}{"fast, 1 new":>13}')
+    for name in FEEDS:
+        body = read_feed(name)
+        ids = [entry['id'] for entry in parse_feed(body)]
+        seen = set(ids[1:])
+        feedparser_ms = best(lambda: fp.parse(body))
+        fast_ms = best(lambda: parse_feed(body))
+        early_ms = best(lambda: parse_feed(body, known=seen.__contains__))
+        print(f'{name:<26}{len(ids):>8}{feedparser_ms:>10.2f}ms{fast_ms:>8.2f}ms{early_ms:>11.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
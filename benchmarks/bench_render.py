@@ -0,0 +1,58 @@
+"""
+Renders both email bodies for 10, 100 and 1000 listings, building a fresh
+jinja2 Environment per message as Message used to, and with the shared,
+cached environment.
+
+Run from the repository root: `python -m benchmarks.bench_render`
+"""
+from itertools import cycle, islice
+from timeit import repeat
+
+from jinja2 import Environment, PackageLoader, select_autoescape
+
+from vehicular.message import Message, environment
+from vehicular.parser import parse_listings
+from tests.stand_in import read_feed
+
+SIZES = 10, 100, 1000
+NUMBER = 10
+
+
+def best(func) -> float:
+    """
+    Returns the best time per call, in milliseconds
+    """
+    return min(repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1000
+
+
+def fresh(listings: list) -> None:
+    """
+    Renders both bodies the way Message did before the environment was shared
+    """
+    for name in 'base.html', 'base.txt':
+        env = Environment(loader=PackageLoader('vehicular', 'templates'),
+                          autoescape=select_autoescape(['html', 'xml', 'txt']))
+        env.get_template(name).render(listings=listings)
+
+
+def cached(listings: list) -> None:
+    """
+    Renders both bodies with the shared environment
+    """
+    message = Message('sender', 'password', 'recipient', listings)
+    message.render_html()
+    message.render_text()
+
+
+def main() -> None:
+    feed = parse_listings(read_feed('denver_motorcycles.rss'))
+    environment()
+    print(f'{"listings":>8}{"fresh":>12}{"cached":>12}')
+    for size in SIZES:
+        listings = list(islice(cycle(feed), size))
+        print(f'{size:>8}{best(lambda: fresh(listings)):>10.2f}ms'
+              f'{best(lambda: cached(listings)):>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
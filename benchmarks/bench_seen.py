@@ -0,0 +1,83 @@
+"""
+Compares a search with a long history stored as post urls in the hits table,
+as before version 6, against the same history as a seen BLOB: database size,
+and the cost of a run's lookups, which load the whole history to stop
+parsing early and check each new post against it.
+
+Run from the repository root: `python -m benchmarks.bench_seen`
+"""
+import os
+from tempfile import TemporaryDirectory
+from time import time
+from timeit import repeat
+
+from vehicular.database import Database
+from vehicular.seen import SeenSet
+
+HISTORY = 1000, 10000, 100000
+FEED = 25
+URL = 'https://denver.craigslist.org/search/mca?format=rss'
+NUMBER = 20
+
+
+def post(number: int) -> str:
+    """
+    Returns the url of a craigslist post
+    """
+    return f'https://denver.craigslist.org/mcy/d/suzuki-drz400s/{6600000000 + number}.html'
+
+
+def best(func) -> float:
+    """
+    Returns the best time per call, in milliseconds
+    """
+    return min(repeat(func, number=NUMBER, repeat=5)) / NUMBER * 1000
+
+
+def size(path: str) -> int:
+    """
+    Returns the size of a database file once vacuumed
+    """
+    with Database(path) as db:
+        db.cursor.execute('VACUUM')
+    return os.path.getsize(path)
+
+
+def main() -> None:
+    print(f'{"history":>8}{"urls":>10}{"blob":>10}{"urls run":>12}{"blob run":>12}')
+    with TemporaryDirectory() as directory:
+        for count in HISTORY:
+            urls, blob = os.path.join(directory, f'urls{count}.db'), os.path.join(directory, f'blob{count}.db')
+            feed = [post(number) for number in range(count - FEED // 2, count + FEED // 2)]
+            with Database(urls) as db:
+                db.create_database()
+                db.add_search(URL, 'search')
+                db.cursor.executemany('INSERT INTO hits (search_id, post_id, first_seen) VALUES (1, ?, ?)',
+                                      ((post(number), int(time())) for number in range(count)))
+                db._connection.commit()
+
+                def lookup_urls():
+                    db.cursor.execute('SELECT post_id FROM hits WHERE search_id = 1')
+                    known = {row[0] for row in db.cursor.fetchall()}
+                    return [url for url in feed if url not in known]
+                urls_ms = best(lookup_urls)
+                expected = lookup_urls()
+            with Database(blob) as db:
+                db.create_database()
+                db.add_search(URL, 'search')
+                seen = SeenSet()
+                seen.add(post(number) for number in range(count))
+                db.cursor.execute('INSERT INTO seen (search_id, post_ids) VALUES (1, ?)', (seen.to_blob(),))
+                db._connection.commit()
+
+                def lookup_blob():
+                    known = db.get_seen(1)
+                    return [url for url in feed if url not in known]
+                assert expected == lookup_blob()
+                blob_ms = best(lookup_blob)
+            print(f'{count:>8}{size(urls) / 1024:>8.0f}kB{size(blob) / 1024:>8.0f}kB'
+                  f'{urls_ms:>10.2f}ms{blob_ms:>10.2f}ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+Measures how long vehicular takes to import, with `python -X importtime`,
+and fails if an entry point goes over its budget.  Heavy dependencies are
+imported on first use, so these only cover what every start pays for.
+
+Run from the repository root: `python -m benchmarks.bench_startup`
+"""
+import subprocess
+import sys
+
+# Entry point module to its budget, in milliseconds
+BUDGETS = {'vehicular.__main__': 30,    # cron-style commands and the daemon
+           'vehicular.main': 80}        # the interactive shell
+RUNS = 5
+
+
+def import_time(module: str) -> float:
+    """
+    Returns the cumulative import time of module in a fresh interpreter, in milliseconds
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            stderr=subprocess.PIPE, check=True, universal_newlines=True)
+    for line in result.stderr.splitlines():
+        _, _, cumulative, name = (part.strip() for part in line.replace(':', '|', 1).split('|'))
+        if name == module:
+            return int(cumulative) / 1000
+    raise ValueError(f'{module} not found in importtime output')
+
+
+def main() -> int:
+    status = 0
+    print(f'{"module":<22}{"best":>10}{"budget":>10}')
+    for module, budget in BUDGETS.items():
+        best = min(import_time(module) for _ in range(RUNS))
+        print(f'{module:<22}{best:>8.1f}ms{budget:>8}ms')
+        if best > budget:
+            status = 1
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
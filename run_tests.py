@@ -1,11 +1,27 @@
 import unittest
 
 from tests.integration_test import WetRunOrCommaFuckTheMan as Command
+from tests.test_cli import TestCli
+from tests.test_daemon import TestDaemon
 from tests.test_database import TestDatabase
+from tests.test_fetch import TestFetcher, TestRunSearch
+from tests.test_filters import TestFilters
+from tests.test_main import TestRun
+from tests.test_message import TestMessage, TestSMTPSession
+from tests.test_parser import TestParser
+from tests.test_scheduler import TestScheduler
+from tests.test_seen import TestSeen
+from tests.test_sender import TestSender
+from tests.test_shell import TestShell
+from tests.test_startup import TestStartup
+from tests.test_utilities import TestUtilities
 
 if __name__ == '__main__':
     # Add additional test classes to this tuple
-    test_classes = Command, TestDatabase
+    test_classes = Command, TestDatabase, TestFetcher, TestRunSearch, TestScheduler, \
+        TestDaemon, TestRun, TestUtilities, TestParser, TestMessage, \
+        TestSMTPSession, TestSender, TestStartup, \
+        TestCli, TestShell, TestFilters, TestSeen
 
     loader = unittest.TestLoader()
 
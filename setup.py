@@ -15,13 +15,18 @@ setuptools.setup(
     url='https://github.com/jakkso/vehicular',
     packages=setuptools.find_packages(),
     install_requires=requirements,
+    python_requires='>=3.7',
     include_package_data=True,
     data_files=[('vehicular/templates', ['vehicular/templates/base.txt',
                                          'vehicular/templates/base.html',
                                          'vehicular/templates/_listing.html'])],
     classifiers=(
         "Development Status :: 4 - Beta",
-        "Programming Language :: Python :: 3.6",
+        "Programming Language :: Python :: 3.7",
+        "Programming Language :: Python :: 3.8",
+        "Programming Language :: Python :: 3.9",
+        "Programming Language :: Python :: 3.10",
+        "Programming Language :: Python :: 3.11",
         "License :: OSI Approved :: GNU General Public License v3 (GPLv3)",
         "Operating System :: MacOS",
         "Operating System :: POSIX :: Linux",
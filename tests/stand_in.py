@@ -0,0 +1,160 @@
+"""
+Local stand-in servers, so tests don't depend on craigslist being reachable
+"""
+from base64 import b64decode
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import os
+import socket
+from socketserver import StreamRequestHandler, ThreadingTCPServer
+import ssl
+import threading
+
+DATA = os.path.join(os.path.dirname(__file__), 'data')
+
+
+def read_feed(name: str) -> bytes:
+    """
+    Returns the contents of a recorded feed from tests/data
+    """
+    with open(os.path.join(DATA, name), 'rb') as file:
+        return file.read()
+
+
+class FeedHandler(BaseHTTPRequestHandler):
+    """
+    Serves whatever has been registered in the server's `routes` dict, which
+    maps a path (query string included) to a tuple of status, headers and body
+    """
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self) -> None:
+        self.server.requests.append((self.path, dict(self.headers)))
+        status, headers, body = self.server.routes.get(self.path, (404, {}, b''))
+        if callable(body):
+            status, headers, body = body(self)
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        if 'Transfer-Encoding' not in headers:
+            self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+class FeedServer(ThreadingHTTPServer):
+    """
+    HTTP server running in a background thread.  Use as a context manager.
+    Serves HTTPS when given a certificate chain.
+    """
+    daemon_threads = True
+
+    def __init__(self, certfile: str = None, keyfile: str = None):
+        super(FeedServer, self).__init__(('127.0.0.1', 0), FeedHandler)
+        self.scheme = 'http'
+        if certfile:
+            context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            context.load_cert_chain(certfile, keyfile)
+            self.socket = context.wrap_socket(self.socket, server_side=True)
+            self.scheme = 'https'
+        self.routes = {}
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown()
+        self.server_close()
+
+    def url(self, path: str) -> str:
+        """
+        Returns the absolute url for path
+        """
+        return f'{self.scheme}://127.0.0.1:{self.server_port}{path}'
+
+
+class SMTPHandler(StreamRequestHandler):
+    """
+    Speaks just enough SMTP for smtplib: EHLO, AUTH PLAIN, MAIL, RCPT, DATA,
+    RSET, NOOP and QUIT.  Accepted messages are appended to the server's
+    `messages` list as (sender, recipients, data) tuples.
+    """
+
+    def reply(self, *lines: str) -> None:
+        for line in lines[:-1]:
+            self.wfile.write(f'{line[:3]}-{line[4:]}\r\n'.encode())
+        self.wfile.write(f'{lines[-1]}\r\n'.encode())
+
+    def handle(self) -> None:
+        self.server.connections.append(self.connection)
+        self.reply('220 stand-in ESMTP')
+        sender, recipients = None, []
+        for line in self.rfile:
+            verb, _, arg = line.decode().strip().partition(' ')
+            verb = verb.upper()
+            if verb in ('EHLO', 'HELO'):
+                self.reply('250 stand-in', '250 AUTH PLAIN')
+            elif verb == 'AUTH':
+                _, user, password = b64decode(arg.split()[1]).decode().split('\0')
+                self.server.logins += 1
+                if (user, password) == self.server.credentials:
+                    self.reply('235 2.7.0 Authentication successful')
+                else:
+                    self.reply('535 5.7.8 Authentication credentials invalid')
+            elif verb == 'MAIL':
+                sender, recipients = arg.partition(':')[2].strip('<>'), []
+                self.reply('250 OK')
+            elif verb == 'RCPT':
+                recipients.append(arg.partition(':')[2].strip('<>'))
+                self.reply('250 OK')
+            elif verb == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = b''.join(iter(self.rfile.readline, b'.\r\n'))
+                self.server.messages.append((sender, recipients, data.decode()))
+                self.reply('250 OK')
+            elif verb in ('RSET', 'NOOP'):
+                self.reply('250 OK')
+            elif verb == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+
+class SMTPServer(ThreadingTCPServer):
+    """
+    SMTP server running in a background thread.  Use as a context manager.
+    """
+    daemon_threads = True
+
+    def __init__(self, user: str = 'sender', password: str = 'password'):
+        super(SMTPServer, self).__init__(('127.0.0.1', 0), SMTPHandler)
+        self.credentials = user, password
+        self.connections = []
+        self.logins = 0
+        self.messages = []
+        self._thread = threading.Thread(target=self.serve_forever, args=(0.05,), daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.drop()
+        self.shutdown()
+        self.server_close()
+
+    def drop(self) -> None:
+        """
+        Hangs up on every client, the way servers do with idle connections
+        """
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
@@ -0,0 +1,127 @@
+from contextlib import redirect_stderr, redirect_stdout
+import io
+import json
+import os
+from time import sleep
+import unittest
+from unittest import mock
+
+from vehicular.__main__ import launch
+from vehicular.config import Config
+from vehicular.database import Database
+from tests.stand_in import FeedServer, SMTPServer, read_feed
+
+DB = 'test_db.db'
+
+
+class TestCli(unittest.TestCase):
+    """
+    Drives the batch commands the way a script would
+    """
+
+    def tearDown(self) -> None:
+        os.remove(DB)
+
+    def launch(self, *argv) -> tuple:
+        """
+        Runs a command, returning its exit status and parsed output
+        """
+        output = io.StringIO()
+        with redirect_stdout(output), self.assertRaises(SystemExit) as exit_:
+            launch(['--database', DB, *argv])
+        return exit_.exception.code, json.loads(output.getvalue())
+
+    def test_add_list(self) -> None:
+        """
+        Searches are validated like in the shell, and failures exit non-zero
+        """
+        status, search = self.launch('add', '--city', 'denver', '--vehicle-type', 'motorcycle',
+                                     '--make-model', 'drz 400', '--has-images')
+        self.assertEqual(0, status)
+        self.assertEqual({'name': 'drz 400',
+                          'urls': ['https://denver.craigslist.org/search/mca?'
+                                   'auto_make_model=drz+400&format=rss&hasPic=1']}, search)
+        self.assertEqual((1, {'error': 'Each search must be unique!'}),
+                         self.launch('add', '--city', 'denver', '--vehicle-type', 'motorcycle',
+                                     '--make-model', 'drz 400', '--has-images'))
+        status, result = self.launch('add', '--city', 'denver', '--vehicle-type', 'motorcycle',
+                                     '--make-model', 'klx', '--min-price', 'cheap')
+        self.assertEqual((1, {'error': 'Invalid price: `cheap`.'}), (status, result))
+        status, result = self.launch('add', '--city', 'denver', '--make-model', 'klx')
+        self.assertEqual(1, status)
+        self.assertIn('At a minimum', result['error'])
+        # Another city makes another search, listed with the url of each of its cities
+        status, both = self.launch('add', '--cities', 'denver boulder', '--vehicle-type', 'motorcycle',
+                                   '--make-model', 'drz 400', '--has-images')
+        self.assertEqual(0, status)
+        self.assertEqual([search['urls'][0].replace('denver', 'boulder'), search['urls'][0]], both['urls'])
+        self.assertEqual((0, [search, both]), self.launch('list'))
+
+    def test_run(self) -> None:
+        """
+        Due searches are run and their hits sent
+        """
+        with FeedServer() as feeds, SMTPServer() as smtp, \
+                mock.patch.multiple(Config, hostname='127.0.0.1', port=smtp.server_address[1],
+                                    starttls=False):
+            feeds.routes['/search/mca?format=rss'] = 200, {}, read_feed('denver_dualsport.rss')
+            self.assertEqual(1, self.launch('run')[0])
+            with Database(DB) as db:
+                db.set_credentials('sender', 'password', 'recipient')
+                db.add_search(feeds.url('/search/mca?format=rss'), 'dualsport')
+            status, result = self.launch('run')
+            self.assertEqual(0, status)
+            self.assertEqual((5, 5), (result['hits'], result['sent']))
+            self.assertEqual('2006 Suzuki DRZ400S $3500', result['listings'][0]['title'])
+            self.assertEqual(1, len(smtp.messages))
+
+    def test_run_several_cities(self) -> None:
+        """
+        A search spanning several cities is sent in one email, even though
+        its feeds come in one at a time
+        """
+        def slow(handler):
+            sleep(0.5)
+            return 200, {}, read_feed('denver_motorcycles.rss')
+        with FeedServer() as feeds, SMTPServer() as smtp, \
+                mock.patch.multiple(Config, hostname='127.0.0.1', port=smtp.server_address[1],
+                                    starttls=False):
+            feeds.routes['/search/mca?format=rss'] = 200, {}, read_feed('denver_dualsport.rss')
+            feeds.routes['/search/mcd?format=rss'] = 200, {}, slow
+            with Database(DB) as db:
+                db.create_database()
+                db.set_credentials('sender', 'password', 'recipient')
+                db.add_search([feeds.url('/search/mca?format=rss'), feeds.url('/search/mcd?format=rss')],
+                              'both')
+            status, result = self.launch('run')
+            self.assertEqual(0, status)
+            self.assertGreater(result['hits'], 5)
+            self.assertEqual(result['hits'], result['sent'])
+            self.assertEqual(1, len(smtp.messages))
+
+    def test_run_failed_feed(self) -> None:
+        """
+        A feed that can't be downloaded is reported in the output, not mixed
+        into it, and the run exits non-zero
+        """
+        with FeedServer() as feeds, SMTPServer() as smtp, \
+                mock.patch.multiple(Config, hostname='127.0.0.1', port=smtp.server_address[1],
+                                    starttls=False):
+            feeds.routes['/search/mca?format=rss'] = 200, {}, read_feed('denver_dualsport.rss')
+            with Database(DB) as db:
+                db.create_database()
+                db.set_credentials('sender', 'password', 'recipient')
+                db.add_search(feeds.url('/search/mca?format=rss'), 'dualsport')
+                db.add_search('http://127.0.0.1:1/search/mca?format=rss', 'refused')
+            errors = io.StringIO()
+            with redirect_stderr(errors):
+                status, result = self.launch('run')
+            self.assertEqual(1, status)
+            self.assertEqual((5, 5), (result['hits'], result['sent']))
+            self.assertEqual(['http://127.0.0.1:1/search/mca?format=rss'], list(result['failed_feeds']))
+            self.assertEqual([], result['send_errors'])
+            self.assertIn('Error fetching http://127.0.0.1:1/', errors.getvalue())
+
+
+if __name__ == '__main__':
+    unittest.main()
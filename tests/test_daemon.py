@@ -0,0 +1,113 @@
+import asyncio
+import os
+from time import time
+import unittest
+from unittest import mock
+
+from vehicular.config import Config
+from vehicular.daemon import Daemon
+from vehicular.database import Database
+from vehicular.fetch import Fetcher
+from vehicular.parser import ParsePool
+from tests.stand_in import FeedServer, SMTPServer, read_feed
+
+DB = 'test_db.db'
+FEED = read_feed('denver_dualsport.rss')
+
+
+class TestDaemon(unittest.TestCase):
+    """
+    Contains tests for the long-running daemon
+    """
+
+    def setUp(self) -> None:
+        self.server = FeedServer().__enter__()
+        self.server.routes['/search/mca?format=rss'] = 200, {}, FEED
+        self.url = self.server.url('/search/mca?format=rss')
+        with Database(DB) as db:
+            db.create_database()
+            db.set_credentials('sender', 'password', 'recipient')
+            self.search_id = db.add_search(self.url, 'dualsport')
+            self.later = db.add_search('later', 'later')
+            db.cursor.execute('UPDATE searches SET next_due = ? WHERE id = ?', (time() + 600, self.later))
+
+    def tearDown(self) -> None:
+        self.server.__exit__(None, None, None)
+        os.remove(DB)
+
+    def test_schedule(self) -> None:
+        """
+        Tests the heap: only due searches are popped and sleeps end when the next one is due
+        """
+        with Daemon(DB) as daemon:
+            daemon.reload()
+            now = time()
+            self.assertEqual([self.search_id], daemon.pop_due(now))
+            self.assertEqual([], daemon.pop_due(now))
+            self.assertAlmostEqual(60, daemon.sleep_time(now), delta=1)
+            self.assertEqual([self.later], daemon.pop_due(now + 600))
+            # Searches added from elsewhere are noticed
+            version = daemon.database.data_version
+            with Database(DB) as db:
+                db.add_search('new', 'new')
+            self.assertNotEqual(version, daemon.database.data_version)
+
+    def test_run(self) -> None:
+        """
+        Runs the daemon until the due search has been polled and its hits
+        emailed, then stops it
+        """
+        sent = []
+
+        async def notify():
+            sent.append(await original())
+            if sent[-1]:
+                daemon.stop()
+
+        with SMTPServer() as smtp, \
+                mock.patch.multiple(Config, hostname='127.0.0.1', port=smtp.server_address[1],
+                                    starttls=False), \
+                Daemon(DB) as daemon:
+            original = daemon.notify
+            with mock.patch.object(daemon, 'notify', notify):
+                asyncio.run(asyncio.wait_for(daemon.run(), 10))
+            self.assertEqual(5, sum(sent))
+            self.assertEqual(1, len(smtp.messages))
+            self.assertIn('2006 Suzuki DRZ400S $3500', smtp.messages[0][2])
+            self.assertEqual({}, daemon._in_flight)
+            self.assertEqual((0, None, None), daemon.database.get_outbox_summary())
+            # Rescheduled rather than due again
+            self.assertEqual([], daemon.pop_due(time()))
+
+    def test_failed_poll(self) -> None:
+        """
+        A search whose feed can't be downloaded isn't due again after a reload,
+        such as the one the sender's commits trigger
+        """
+        del self.server.routes['/search/mca?format=rss']
+
+        async def poll():
+            daemon._in_flight.update(dict.fromkeys(due))
+            await daemon.dispatch(due, Fetcher(), ParsePool(0))
+
+        with Daemon(DB) as daemon:
+            daemon.reload()
+            due = daemon.pop_due(time())
+            self.assertEqual([self.search_id], due)
+            asyncio.run(poll())
+            daemon.reload()
+            self.assertEqual([], daemon.pop_due(time()))
+            self.assertGreater(daemon.database.get_next_due(self.search_id), time() + Config.min_interval - 5)
+
+    def test_missing_credentials(self) -> None:
+        """
+        The daemon refuses to start without credentials
+        """
+        with Database(DB) as db:
+            db.set_credentials('', '', '')
+        with Daemon(DB) as daemon:
+            self.assertEqual(1, daemon.start())
+
+
+if __name__ == '__main__':
+    unittest.main()
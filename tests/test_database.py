@@ -1,13 +1,34 @@
 import os
 import sqlite3
+from threading import Timer
+from time import time
 import unittest
 
-from vehicular.database import Database, FPIntegration
+from vehicular.config import Config
+from vehicular.database import Database, FPIntegration, MIGRATIONS, Writer
+from vehicular.filters import plan_feed
+from vehicular.listing import Listing
+from vehicular.seen import SeenSet
 
 DB = 'test_db.db'
 URL = 'google.com'
 RSS = 'feed:https://denver.craigslist.org/search/cta?auto_make_model=f150&format=rss'
 RSS2 = 'feed:https://denver.craigslist.org/search/cta?auto_make_model=dodge%20ram&format=rss'
+POST = 'https://denver.craigslist.org/mcy/d/suzuki-drz400s/6631427810.html'
+
+
+def old_database(version: int) -> sqlite3.Connection:
+    """
+    Returns a connection to a database as the given schema version left it
+    """
+    os.remove(DB)
+    connection = sqlite3.connect(DB)
+    cursor = connection.cursor()
+    cursor.execute('CREATE TABLE searches (url TEXT UNIQUE, name TEXT, updated INTEGER, hits TEXT)')
+    for migration in MIGRATIONS[:version]:
+        migration(cursor)
+    cursor.execute(f'PRAGMA user_version = {version}')
+    return connection
 
 
 class TestDatabase(unittest.TestCase):
@@ -27,61 +48,94 @@ class TestDatabase(unittest.TestCase):
         Tests adding search to database
         """
         with Database(DB) as db:
-            db.add_search('google.com', 'test_name')
+            search_id = db.add_search('google.com', 'test_name')
             with self.assertRaises(sqlite3.IntegrityError):
                 db.add_search('google.com', 'test_name')
-            db.cursor.execute('SELECT url, name FROM searches')
-            url, name = db.cursor.fetchone()
-        self.assertEqual('google.com', url)
-        self.assertEqual('test_name', name)
+            db.cursor.execute('SELECT id, name FROM searches')
+            self.assertEqual((search_id, 'test_name'), db.cursor.fetchone())
+            self.assertEqual({search_id: ['google.com']}, db.get_cities())
+
+    def test_add_cities(self) -> None:
+        """
+        A search spanning several cities is stored once, unique by its set of
+        cities whatever order they're given in
+        """
+        with Database(DB) as db:
+            both = db.add_search(['yahoo.com', 'google.com'], 'both')
+            with self.assertRaises(sqlite3.IntegrityError):
+                db.add_search(['google.com', 'yahoo.com', 'google.com'], 'again')
+            # Either city on its own, or with another, is a different search
+            single = db.add_search('google.com', 'single')
+            self.assertEqual(1, db.add_searches([(['google.com', 'yahoo.com'], 'again'),
+                                                 (['google.com', 'msn.com'], 'other'),
+                                                 (['msn.com', 'google.com'], 'other again')]))
+            self.assertEqual([(both, 'both', ['google.com', 'yahoo.com']),
+                              (single, 'single', ['google.com']),
+                              (single + 1, 'other', ['google.com', 'msn.com'])],
+                             db.get_searches())
+            self.assertEqual({single: ['google.com']}, db.get_cities([single]))
+            db.remove_search(both)
+            db.cursor.execute('SELECT COUNT(*) FROM cities')
+            self.assertEqual(3, db.cursor.fetchone()[0])
 
     def test_remove_search(self) -> None:
         """
         Tests removing searches
         """
         with Database(DB) as db:
-            db.add_search('google.com', 'test_name')
-            db.add_search('yahoo.com', 'second_test')
+            google = db.add_search('google.com', 'test_name')
+            yahoo = db.add_search('yahoo.com', 'second_test')
             db.add_search('yahoo1.com', 'second_test')
-            db.remove_search('google.com')
+            db.update_hits(google, 'a', 'b')
+            db.update_hits(yahoo, 'a')
+            db.remove_search(google)
             db.cursor.execute('SELECT * from searches')
             self.assertEqual(2, len(db.cursor.fetchall()))
+            db.cursor.execute('SELECT COUNT(*) from hits')
+            self.assertEqual(1, db.cursor.fetchone()[0])
 
     def test_get_hits(self) -> None:
         """
         Confirms that the fetch searches method works as expected
         """
         with Database(DB) as db:
-            db.add_search('google.com', 'test_name')
-            self.assertEqual([], db.get_hits('google.com'))
-            db.cursor.execute('UPDATE searches SET hits = ? WHERE url = ?', ('hello,friend', 'google.com'))
-            self.assertEqual(['hello', 'friend'], db.get_hits('google.com'))
+            search_id = db.add_search('google.com', 'test_name')
+            self.assertEqual(set(), db.get_hits(search_id))
+            db.update_hits(search_id, 'hello', 'friend')
+            self.assertEqual({'hello', 'friend'}, db.get_hits(search_id))
+            self.assertEqual({'friend'}, db.get_hits(search_id, ['friend', 'stranger']))
+            self.assertEqual(set(), db.get_hits(search_id, []))
 
     def test_update_hits(self) -> None:
         """
         Tests that updating hits works properly
         """
         with Database(DB) as db:
-            db.add_search(URL, 'test_name')
-            db.update_hits(URL, '123', '456', '789')
-            db.cursor.execute('SELECT hits FROM searches WHERE url = ?', (URL,))
-            self.assertEqual('123,456,789', db.cursor.fetchone()[0])
-            db.update_hits(URL, '10', '11', '12')
-            db.cursor.execute('SELECT hits FROM searches WHERE url = ?', (URL,))
-            self.assertEqual('123,456,789,10,11,12', db.cursor.fetchone()[0])
+            search_id = db.add_search(URL, 'test_name')
+            other = db.add_search('other', 'other_name')
+            db.update_hits(search_id, '123', '456', '789')
+            db.cursor.execute('SELECT post_id FROM hits ORDER BY rowid')
+            self.assertEqual(['123', '456', '789'], [row[0] for row in db.cursor.fetchall()])
+            # Hits already stored for the search are ignored, other searches are unaffected
+            db.update_hits(search_id, '10', '11', '123')
+            db.update_hits(other, '123')
+            db.cursor.execute('SELECT post_id FROM hits ORDER BY rowid')
+            self.assertEqual(['123', '456', '789', '10', '11', '123'],
+                             [row[0] for row in db.cursor.fetchall()])
+            self.assertEqual({'123', '456', '789', '10', '11'}, db.get_hits(search_id))
 
-    def test_get_url_name(self) -> None:
+    def test_get_searches(self) -> None:
         """
-        Tests getting name / URLs from database
+        Tests getting ids / names / URLs from database
         """
         with Database(DB) as db:
             db.add_search(URL, 'test_name')
             db.add_search('youtube', 'asdf')
             db.add_search('4chan', 'cuck')
-            res = db.get_url_name()
-            self.assertEqual([(URL, 'test_name'),
-                              ('youtube', 'asdf'),
-                              ('4chan', 'cuck')],
+            res = db.get_searches()
+            self.assertEqual([(1, 'test_name', [URL]),
+                              (2, 'asdf', ['youtube']),
+                              (3, 'cuck', ['4chan'])],
                              res)
 
     def test_update_time(self) -> None:
@@ -89,35 +143,222 @@ class TestDatabase(unittest.TestCase):
         Tests time update incrementation
         """
         with Database(DB) as db:
-            db.add_search(URL, 'test_name')
-            db.cursor.execute('SELECT updated FROM searches WHERE url = ?', (URL,))
+            search_id = db.add_search(URL, 'test_name')
+            db.cursor.execute('SELECT updated FROM searches WHERE id = ?', (search_id,))
             time_1 = db.cursor.fetchone()[0]
-            db.update_time(URL)
-            db.cursor.execute('SELECT updated FROM searches WHERE url = ?', (URL,))
+            db.update_time(search_id)
+            db.cursor.execute('SELECT updated FROM searches WHERE id = ?', (search_id,))
             time_2 = db.cursor.fetchone()[0]
             self.assertGreater(time_2, time_1)
 
-    def test_get_urls_time_limited(self)-> None:
+    def test_get_due_time_limited(self)-> None:
         """
-        Database.get_urls() is time limited to only return URLs that have been not been updated
+        Database.get_due() is time limited to only return searches that have been not been updated
         in the last hour, this is testing that functionality
         :return:
         """
         with Database(DB) as db:
-            db.add_search(URL, 'test_name')
-            db.add_search('yahoo', 'name2')
-            db.add_search('msn.com', 'name3')
-            urls = db.get_urls()
-            self.assertEqual([URL, 'yahoo', 'msn.com'], urls)
-            db.update_time(URL)
-            urls = db.get_urls()
-            self.assertEqual(['yahoo', 'msn.com'], urls)
-            db.update_time('msn.com')
-            urls = db.get_urls()
-            self.assertEqual(['yahoo'], urls)
-            db.update_time('yahoo')
-            urls = db.get_urls()
-            self.assertEqual([], urls)
+            google = db.add_search(URL, 'test_name')
+            yahoo = db.add_search('yahoo', 'name2')
+            msn = db.add_search('msn.com', 'name3')
+            self.assertEqual([google, yahoo, msn], db.get_due())
+            db.update_time(google)
+            self.assertEqual([yahoo, msn], db.get_due())
+            db.update_time(msn)
+            self.assertEqual([yahoo], db.get_due())
+            db.update_time(yahoo)
+            self.assertEqual([], db.get_due())
+
+    def test_cache(self) -> None:
+        """
+        Tests saving and fetching conditional GET validators
+        """
+        with Database(DB) as db:
+            search_id = db.add_search(URL, 'test_name')
+            self.assertEqual((None, None, None), db.get_cache(search_id, URL))
+            self.assertEqual((None, None, None), db.get_cache(search_id + 1, URL))
+            db.update_cache(search_id, URL, '"abc"', 'Fri, 20 Jul 2018 16:20:30 GMT', 'f00')
+            self.assertEqual(('"abc"', 'Fri, 20 Jul 2018 16:20:30 GMT', 'f00'),
+                             db.get_cache(search_id, URL))
+            self.assertEqual((None, None, None), db.get_cache(search_id, 'other'))
+
+    def test_migrate(self) -> None:
+        """
+        Tests that a database created by the original release is brought up to date
+        """
+        connection = old_database(0)
+        connection.execute('INSERT INTO searches VALUES (?, ?, ?, ?)', (URL, 'test_name', 0, None))
+        connection.execute('INSERT INTO searches VALUES (?, ?, ?, ?)',
+                           ('yahoo', 'name2', 10, f'a,b,c,{POST}'))
+        connection.commit()
+        connection.close()
+        with Database(DB) as db:
+            db.create_database()
+            db.cursor.execute('PRAGMA user_version')
+            self.assertEqual(len(MIGRATIONS), db.cursor.fetchone()[0])
+            self.assertEqual((None, None, None), db.get_cache(1, URL))
+            self.assertEqual([(1, 'test_name', [URL]), (2, 'name2', ['yahoo'])], db.get_searches())
+            self.assertEqual(set(), db.get_hits(1))
+            self.assertEqual({'a', 'b', 'c', '6631427810'}, db.get_hits(2))
+            self.assertIn(POST, db.get_seen(2))
+            db.cursor.execute('SELECT DISTINCT first_seen FROM hits')
+            self.assertEqual([(10,)], db.cursor.fetchall())
+            # Numeric post IDs are packed into the seen BLOB instead
+            db.cursor.execute('SELECT COUNT(*) FROM hits')
+            self.assertEqual(3, db.cursor.fetchone()[0])
+            db.cursor.execute('SELECT LENGTH(post_ids) FROM seen')
+            self.assertEqual([(8,)], db.cursor.fetchall())
+            # Running it again is a no-op
+            db.create_database()
+
+    def test_canonicalize_urls(self) -> None:
+        """
+        Searches stored before urls were canonicalized are brought into line,
+        and ones that turn out to be the same are merged
+        """
+        canonical = 'https://denver.craigslist.org/search/mca?auto_make_model=drz&format=rss'
+        other = 'https://denver.craigslist.org/search/mca?format=rss&hasPic=1'
+        connection = old_database(6)
+        old = 'feed:https://Denver.craigslist.org/search/mca?format=rss&auto_make_model=drz'
+        connection.executemany('INSERT INTO searches (id, url, name) VALUES (?, ?, ?)',
+                               [(1, old, 'old'),
+                                (2, canonical, 'new'),
+                                (3, other, 'other')])
+        seen = SeenSet()
+        seen.add([POST])
+        connection.execute('INSERT INTO seen VALUES (1, ?)', (seen.to_blob(),))
+        connection.executemany('INSERT INTO hits (search_id, post_id) VALUES (?, ?)',
+                               [(1, 'a'), (2, 'a'), (2, 'b')])
+        connection.commit()
+        connection.close()
+        with Database(DB) as db:
+            db.create_database()
+            self.assertEqual([(2, 'new', [canonical]), (3, 'other', [other])], db.get_searches())
+            self.assertEqual({'a', 'b', '6631427810'}, db.get_hits(2))
+            db.cursor.execute('SELECT COUNT(*) FROM seen')
+            self.assertEqual(1, db.cursor.fetchone()[0])
+
+    def test_split_cities(self) -> None:
+        """
+        Searches spanning several cities, stored as their feed urls joined by
+        spaces, get a row per city, and validators all move to the feeds table
+        """
+        denver = 'https://denver.craigslist.org/search/mca?auto_make_model=drz&format=rss'
+        boulder = 'https://boulder.craigslist.org/search/mca?auto_make_model=drz&format=rss'
+        connection = old_database(7)
+        connection.executemany('INSERT INTO searches (id, url, name, etag, next_due) VALUES (?, ?, ?, ?, ?)',
+                               [(1, denver, 'single', '"v1"', 5),
+                                (2, f'{boulder} {denver}', 'both', None, 6)])
+        connection.execute('INSERT INTO feeds (search_id, url, etag) VALUES (2, ?, ?)',
+                           (plan_feed(boulder), '"v2"'))
+        connection.commit()
+        connection.close()
+        with Database(DB) as db:
+            db.create_database()
+            self.assertEqual([(1, 'single', [denver]), (2, 'both', [boulder, denver])], db.get_searches())
+            self.assertEqual('"v1"', db.get_cache(1, plan_feed(denver))[0])
+            self.assertEqual('"v2"', db.get_cache(2, plan_feed(boulder))[0])
+            self.assertEqual([(1, 5), (2, 6)], db.get_schedule())
+            # Only the cities decide whether a search is already stored
+            with self.assertRaises(sqlite3.IntegrityError):
+                db.add_search([denver, boulder], 'again')
+            db.cursor.execute("SELECT name FROM sqlite_master WHERE sql LIKE '%searches_v%'")
+            self.assertEqual([], db.cursor.fetchall())
+
+    def test_record_poll(self) -> None:
+        """
+        Tests that polls reschedule searches according to how busy they are
+        """
+        with Database(DB) as db:
+            busy_id = db.add_search(URL, 'busy')
+            quiet_id = db.add_search('yahoo', 'quiet')
+            # First polls only set the schedule going
+            db.record_poll(busy_id, 25)
+            db.record_poll(quiet_id, 25)
+            db.cursor.execute('SELECT interval, rate, last_hits FROM searches ORDER BY id')
+            self.assertEqual([(Config.default_interval, None, 25)] * 2, db.cursor.fetchall())
+            db.cursor.execute('UPDATE searches SET updated = updated - 3600')
+            db.record_poll(busy_id, 10)
+            db.record_poll(quiet_id, 0)
+            db.cursor.execute('SELECT interval, next_due - updated FROM searches ORDER BY id')
+            (busy, busy_due), (quiet, quiet_due) = db.cursor.fetchall()
+            self.assertEqual(Config.min_interval, busy)
+            self.assertEqual(Config.max_interval, quiet)
+            self.assertAlmostEqual(busy, busy_due)
+            self.assertAlmostEqual(quiet, quiet_due)
+            self.assertEqual([], db.get_due())
+
+    def test_writer(self) -> None:
+        """
+        Tests that a run's writes are only visible once flushed, all at once
+        """
+        with Database(DB) as db:
+            db.cursor.execute('PRAGMA journal_mode')
+            self.assertEqual('wal', db.cursor.fetchone()[0])
+            google = db.add_search(URL, 'test_name')
+            yahoo = db.add_search('yahoo', 'name2')
+            writer = Writer(db)
+            writer.update_hits(google, 'a', 'b')
+            writer.update_hits(yahoo, 'a')
+            writer.record_poll(google, 2)
+            writer.record_poll(yahoo, 1)
+            writer.update_cache(google, URL, '"abc"', None, 'f00')
+            with Database(DB) as other:
+                self.assertEqual(set(), other.get_hits(google))
+                self.assertEqual([google, yahoo], other.get_due())
+            writer.flush()
+            self.assertEqual(([], {}, {}), (writer.hits, writer.polls, writer.caches))
+            with Database(DB) as other:
+                self.assertEqual({'a', 'b'}, other.get_hits(google))
+                self.assertEqual({'a'}, other.get_hits(yahoo))
+                self.assertEqual([], other.get_due())
+                self.assertEqual(('"abc"', None, 'f00'), other.get_cache(google, URL))
+
+    def test_write_lock(self) -> None:
+        """
+        Write batches take the write lock before reading anything, so they
+        can't be handed a snapshot another process has since written past
+        """
+        with Database(DB) as db:
+            search_id = db.add_search(URL, 'test_name')
+            statements = []
+            db._connection.set_trace_callback(statements.append)
+            db.update_hits(search_id, POST)
+            self.assertEqual('BEGIN IMMEDIATE', statements[0])
+            # Other writers are waited out rather than failing the batch
+            other = sqlite3.connect(DB, isolation_level=None, check_same_thread=False)
+            other.execute('BEGIN IMMEDIATE')
+            other.execute('UPDATE searches SET name = ?', ('renamed',))
+            timer = Timer(0.2, other.commit)
+            timer.start()
+            db.update_hits(search_id, 'a')
+            timer.join()
+            other.close()
+            self.assertEqual({'a', '6631427810'}, db.get_hits(search_id))
+
+    def test_writer_searches(self) -> None:
+        """
+        Flushing some searches leaves the rest queued, and a listing several
+        searches found is only queued for sending once
+        """
+        with Database(DB) as db:
+            google = db.add_search(URL, 'test_name')
+            yahoo = db.add_search('yahoo', 'name2')
+            writer = Writer(db)
+            listing = Listing(POST, 'Suzuki')
+            for search_id in google, yahoo:
+                writer.update_hits(search_id, POST)
+                writer.enqueue(listing, search_id=search_id)
+                writer.update_cache(search_id, URL, None, None, 'f00')
+            writer.flush(polls=False, search_ids=[google])
+            self.assertEqual({'6631427810'}, db.get_hits(google))
+            self.assertEqual(set(), db.get_hits(yahoo))
+            self.assertEqual((None, None, None), db.get_cache(yahoo, URL))
+            db.remove_outbox(row_id for row_id, _ in db.get_outbox(time()))
+            writer.flush()
+            self.assertEqual({'6631427810'}, db.get_hits(yahoo))
+            self.assertEqual('f00', db.get_cache(yahoo, URL)[2])
+            self.assertEqual([], db.get_outbox(time()))
 
     def test_get_credentials(self):
         """
@@ -139,8 +380,8 @@ class TestParser(TestDatabase):
             orig_hits = par.run_search()
             self.assertGreater(len(orig_hits), 0)
             # Change time to ensure that the search is actually run again.  Otherwise,
-            # since the time has been updated, Parser.get_urls will return no URLs
-            par.cursor.execute('UPDATE searches SET updated = 0 WHERE url = ?', (RSS,))
+            # since the time has been updated, Parser.get_due will return no searches
+            par.cursor.execute('UPDATE searches SET next_due = 0 WHERE id = 1')
             second_run = par.run_search()
             self.assertEqual([], second_run)
 
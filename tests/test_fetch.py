@@ -0,0 +1,365 @@
+import asyncio
+import gzip
+import os
+from time import monotonic, sleep, time
+import unittest
+from unittest import mock
+
+from vehicular.config import Config
+from vehicular.database import Database, iter_search, run_search
+from vehicular.fetch import Fetcher, FetchError, TokenBucket, feed_url, interleave
+from vehicular.parser import ParsePool
+from tests.stand_in import FeedServer, read_feed
+
+DB = 'test_db.db'
+FEED = read_feed('denver_dualsport.rss')
+RSS_HEADERS = {'Content-Type': 'application/rss+xml; charset=utf-8'}
+
+
+def fetch(url: str, **kwargs):
+    """
+    Runs Fetcher.fetch to completion
+    """
+    async def main():
+        return await Fetcher(**kwargs).fetch(url)
+    return asyncio.run(main())
+
+
+class TestFetcher(unittest.TestCase):
+    """
+    Contains tests for the asyncio fetch engine
+    """
+
+    def test_fetch(self) -> None:
+        """
+        Tests a plain Content-Length framed download
+        """
+        with FeedServer() as server:
+            server.routes['/feed?format=rss'] = 200, RSS_HEADERS, FEED
+            response = fetch(server.url('/feed?format=rss'))
+        self.assertEqual(200, response.status)
+        self.assertEqual(FEED, response.body)
+        self.assertEqual('application/rss+xml; charset=utf-8', response.headers['content-type'])
+
+    def test_chunked_gzip(self) -> None:
+        """
+        Tests that chunked transfer encoding and gzip content encoding are undone
+        """
+        compressed = gzip.compress(FEED)
+        chunked = b''.join(b'%x\r\n%s\r\n' % (len(compressed[i:i + 100]), compressed[i:i + 100])
+                           for i in range(0, len(compressed), 100)) + b'0\r\n\r\n'
+        headers = {'Transfer-Encoding': 'chunked', 'Content-Encoding': 'gzip'}
+        with FeedServer() as server:
+            server.routes['/feed'] = 200, headers, chunked
+            response = fetch(server.url('/feed'))
+        self.assertEqual(FEED, response.body)
+
+    def test_redirect(self) -> None:
+        """
+        Tests that redirects are followed
+        """
+        with FeedServer() as server:
+            server.routes['/old'] = 301, {'Location': '/new'}, b''
+            server.routes['/new'] = 200, RSS_HEADERS, FEED
+            response = fetch(server.url('/old'))
+        self.assertEqual(FEED, response.body)
+        self.assertTrue(response.url.endswith('/new'))
+
+    def test_errors(self) -> None:
+        """
+        Tests that network failures and bad urls surface as FetchError
+        """
+        with FeedServer() as server:
+            url = server.url('/feed')
+        with self.assertRaises(FetchError):
+            fetch(url)
+        with self.assertRaises(FetchError):
+            fetch('ftp://example.com/feed')
+
+    def test_keep_alive(self) -> None:
+        """
+        Tests that sequential requests to a host reuse one connection
+        """
+        async def main(urls, **kwargs):
+            async with Fetcher(**kwargs) as fetcher:
+                for url in urls:
+                    self.assertEqual(FEED, (await fetcher.fetch(url)).body)
+                return fetcher.pool.opened
+        with FeedServer() as server:
+            server.routes['/feed'] = 200, RSS_HEADERS, FEED
+            self.assertEqual(1, asyncio.run(main([server.url('/feed')] * 5)))
+            self.assertEqual(5, asyncio.run(main([server.url('/feed')] * 5, pool_size=0)))
+            self.assertEqual('close', server.requests[-1][1]['Connection'])
+
+    def test_dropped_connection(self) -> None:
+        """
+        Tests that a connection the server closed after responding isn't a failure
+        """
+        def hang_up(handler):
+            handler.close_connection = True
+            return 200, RSS_HEADERS, FEED
+
+        async def main(url):
+            async with Fetcher() as fetcher:
+                for _ in range(3):
+                    self.assertEqual(FEED, (await fetcher.fetch(url)).body)
+                return fetcher.pool.opened
+        with FeedServer() as server:
+            server.routes['/feed'] = 200, {}, hang_up
+            self.assertEqual(3, asyncio.run(main(server.url('/feed'))))
+
+    def test_pool_limits(self) -> None:
+        """
+        Tests the per-host connection cap and idle timeout
+        """
+        async def main(url):
+            fetcher = Fetcher(pool_size=2, host_burst=6)
+            await fetcher.fetch_all([url] * 6)
+            idle = sum(len(connections) for connections in fetcher.pool._idle.values())
+            fetcher.pool.idle_timeout = 0
+            fetcher.pool.prune()
+            pruned = sum(len(connections) for connections in fetcher.pool._idle.values())
+            fetcher.close()
+            return fetcher.pool.opened, idle, pruned
+        with FeedServer() as server:
+            server.routes['/feed'] = 200, RSS_HEADERS, FEED
+            opened, idle, pruned = asyncio.run(main(server.url('/feed')))
+        self.assertLessEqual(opened, 2)
+        self.assertEqual(opened, idle)
+        self.assertEqual(0, pruned)
+
+    def test_token_bucket(self) -> None:
+        """
+        Tests that a bucket allows its burst straight away, then meters out the rest
+        """
+        async def main():
+            bucket = TokenBucket(rate=50, burst=3)
+            start = monotonic()
+            for _ in range(3):
+                await bucket.acquire()
+            burst = monotonic() - start
+            for _ in range(5):
+                await bucket.acquire()
+            return burst, monotonic() - start
+        burst, total = asyncio.run(main())
+        self.assertLess(burst, 0.02)
+        self.assertGreaterEqual(total, 5 / 50 - 0.01)
+
+    def test_host_limit(self) -> None:
+        """
+        Tests that each host is limited separately
+        """
+        async def main(urls):
+            fetcher = Fetcher(host_rate=20, host_burst=1)
+            start = monotonic()
+            await fetcher.fetch_all(urls)
+            return monotonic() - start
+        with FeedServer() as server:
+            server.routes['/feed'] = 200, {}, b''
+            local = server.url('/feed')
+            other = local.replace('127.0.0.1', 'localhost')
+            self.assertGreaterEqual(asyncio.run(main([local] * 4)), 3 / 20 - 0.01)
+            self.assertLess(asyncio.run(main([local, other])), 1 / 20)
+
+    def test_interleave(self) -> None:
+        """
+        Tests round-robin ordering across hosts
+        """
+        urls = ['https://a.org/1', 'https://a.org/2', 'https://a.org/3', 'feed:https://b.org/1',
+                'https://c.org/1', 'https://b.org/2']
+        self.assertEqual(['https://a.org/1', 'feed:https://b.org/1', 'https://c.org/1',
+                          'https://a.org/2', 'https://b.org/2', 'https://a.org/3'],
+                         interleave(urls))
+
+    def test_feed_url(self) -> None:
+        """
+        Tests stripping the feed: pseudo-scheme
+        """
+        self.assertEqual('https://a.com/b', feed_url('feed:https://a.com/b'))
+        self.assertEqual('http://a.com/b', feed_url('feed://a.com/b'))
+        self.assertEqual('https://a.com/b', feed_url('https://a.com/b'))
+
+
+class TestRunSearch(unittest.TestCase):
+    """
+    Runs database.run_search against the local stand-in server
+    """
+
+    def setUp(self) -> None:
+        self.server = FeedServer().__enter__()
+        self.server.routes['/search/mca?format=rss'] = 200, RSS_HEADERS, FEED
+        with Database(DB) as db:
+            db.create_database()
+            db.add_search(self.server.url('/search/mca?format=rss'), 'dualsport')
+
+    def tearDown(self) -> None:
+        self.server.__exit__(None, None, None)
+        os.remove(DB)
+
+    def test_run_search(self) -> None:
+        """
+        First run returns every entry, a repeated run returns nothing new
+        """
+        hits = run_search(DB)
+        self.assertEqual(5, len(hits))
+        self.assertEqual('2006 Suzuki DRZ400S $3500', hits[0].title)
+        with Database(DB) as db:
+            # Queued for the sender along with being recorded
+            self.assertEqual(hits, [listing for _, listing in db.get_outbox(time())])
+            db.cursor.execute('UPDATE searches SET next_due = 0')
+        self.assertEqual([], run_search(DB))
+
+    def test_iter_search(self) -> None:
+        """
+        Each feed's hits are committed and yielded as soon as it's done,
+        without waiting for slower feeds
+        """
+        def slow(handler):
+            sleep(1)
+            return 200, RSS_HEADERS, read_feed('denver_motorcycles.rss')
+        self.server.routes['/search/mcd?format=rss'] = 200, {}, slow
+        with Database(DB) as db:
+            db.add_search(self.server.url('/search/mcd?format=rss'), 'slow')
+        batches = iter_search(DB)
+        start = monotonic()
+        first = next(batches)
+        self.assertLess(monotonic() - start, 1)
+        self.assertEqual('2006 Suzuki DRZ400S $3500', first[0].title)
+        with Database(DB) as db:
+            self.assertEqual(first, [listing for _, listing in db.get_outbox(time())])
+        self.assertEqual(1, len(list(batches)))
+        with Database(DB) as db:
+            self.assertEqual([], db.get_due())
+
+    def test_coalescing(self) -> None:
+        """
+        Searches that only differ in parameter order share a single download
+        """
+        self.server.routes['/search/mca?auto_make_model=drz&format=rss'] = 200, RSS_HEADERS, FEED
+        with Database(DB) as db:
+            db.add_search(self.server.url('/search/mca?format=rss&auto_make_model=drz'), 'drz')
+            db.add_search(self.server.url('/search/mca?auto_make_model=drz&format=rss'), 'drz again')
+        with mock.patch.object(ParsePool, 'parse', autospec=True, side_effect=ParsePool.parse) as parse:
+            hits = run_search(DB)
+        self.assertEqual(2, len(self.server.requests))
+        self.assertEqual(2, parse.call_count)
+        # Listings the searches have in common are only reported once
+        self.assertEqual(5, len(hits))
+        with Database(DB) as db:
+            self.assertEqual([], db.get_due())
+            self.assertEqual(15, sum(len(db.get_seen(search_id)) for search_id, _, _ in db.get_searches()))
+
+    def test_several_cities(self) -> None:
+        """
+        A search spanning several cities downloads each of their feeds, keeps
+        validators for each, and is recorded and rescheduled as one search
+        """
+        def conditional(handler):
+            if handler.headers.get('If-None-Match') == '"v1"':
+                return 304, {}, b''
+            return 200, dict(RSS_HEADERS, ETag='"v1"'), read_feed('denver_motorcycles.rss')
+        self.server.routes['/search/mcd?format=rss'] = 200, {}, conditional
+        urls = [self.server.url('/search/mcd?format=rss'), self.server.url('/search/mca?format=rss')]
+        with Database(DB) as db:
+            db.remove_search(1)
+            search_id = db.add_search(urls, 'both')
+            self.assertEqual([(search_id, 'both', sorted(urls))], db.get_searches())
+        hits = run_search(DB)
+        self.assertEqual(2, len(self.server.requests))
+        with Database(DB) as db:
+            self.assertEqual(len(hits), len(db.get_hits(search_id)))
+            self.assertEqual(len(hits), len(db.get_outbox(time())))
+            self.assertEqual('"v1"', db.get_cache(search_id, self.server.url('/search/mcd?format=rss'))[0])
+            self.assertIsNone(db.get_cache(search_id, self.server.url('/search/mca?format=rss'))[0])
+            db.cursor.execute('SELECT last_hits FROM searches WHERE id = ?', (search_id,))
+            self.assertEqual(len(hits), db.cursor.fetchone()[0])
+            self.assertGreater(len(hits), 5)
+            db.cursor.execute('UPDATE searches SET next_due = 0')
+        self.assertEqual([], run_search(DB))
+        headers = dict(self.server.requests[2:])
+        self.assertEqual('"v1"', headers['/search/mcd?format=rss'].get('If-None-Match'))
+        self.assertNotIn('If-None-Match', headers['/search/mca?format=rss'])
+        with Database(DB) as db:
+            db.remove_search(search_id)
+            db.cursor.execute('SELECT COUNT(*) FROM feeds')
+            self.assertEqual(0, db.cursor.fetchone()[0])
+
+    def test_broad_feeds(self) -> None:
+        """
+        With the broad planner, searches that only differ in make, model, price
+        or year share one download and are filtered locally
+        """
+        self.server.routes['/search/mca?format=rss'] = 200, RSS_HEADERS, read_feed('denver_motorcycles.rss')
+        with Database(DB) as db:
+            db.add_search(self.server.url('/search/mca?auto_make_model=suzuki&format=rss'
+                                          '&max_price=10000'), 'suzuki')
+            db.add_search(self.server.url('/search/mca?auto_make_model=ktm&exclude=enduro'
+                                          '&format=rss'), 'ktm')
+        with mock.patch.object(Config, 'broad_feeds', True):
+            hits = run_search(DB)
+        self.assertEqual(['/search/mca?format=rss'], [path for path, _ in self.server.requests])
+        self.assertEqual(25, len(hits))
+        with Database(DB) as db:
+            for search_id, name, _ in db.get_searches():
+                if name == 'suzuki':
+                    self.assertEqual(2, len(db.get_hits(search_id)))
+                elif name == 'ktm':
+                    self.assertEqual(1, len(db.get_hits(search_id)))
+
+    def test_not_modified(self) -> None:
+        """
+        Validators are sent back, and a 304 answer isn't parsed
+        """
+        def conditional(handler):
+            if handler.headers.get('If-None-Match') == '"v1"':
+                return 304, {}, b''
+            return 200, dict(RSS_HEADERS, ETag='"v1"'), FEED
+        self.server.routes['/search/mca?format=rss'] = 200, {}, conditional
+        self.assertEqual(5, len(run_search(DB)))
+        with Database(DB) as db:
+            db.cursor.execute('UPDATE searches SET next_due = 0')
+        with mock.patch.object(ParsePool, 'parse') as parse:
+            self.assertEqual([], run_search(DB))
+        parse.assert_not_called()
+        self.assertEqual('"v1"', self.server.requests[-1][1]['If-None-Match'])
+
+    def test_unchanged_body(self) -> None:
+        """
+        A body that hashes the same as last time isn't parsed, though the
+        validators it came with are kept for the next poll
+        """
+        etags = iter(['"v1"', '"v2"', '"v3"'])
+
+        def reissued(_):
+            return 200, dict(RSS_HEADERS, ETag=next(etags)), FEED
+        self.server.routes['/search/mca?format=rss'] = 200, {}, reissued
+        self.assertEqual(5, len(run_search(DB)))
+        with Database(DB) as db:
+            db.cursor.execute('UPDATE searches SET next_due = 0')
+        with mock.patch.object(ParsePool, 'parse') as parse:
+            self.assertEqual([], run_search(DB))
+        parse.assert_not_called()
+        self.assertEqual('"v1"', self.server.requests[-1][1]['If-None-Match'])
+        with Database(DB) as db:
+            db.cursor.execute('UPDATE searches SET next_due = 0')
+        run_search(DB)
+        self.assertEqual('"v2"', self.server.requests[-1][1]['If-None-Match'])
+
+    def test_unreachable_feed(self) -> None:
+        """
+        A feed that can't be downloaded yields no hits, and its search is
+        retried after Config.min_interval rather than straight away
+        """
+        with Database(DB) as db:
+            failing = [db.add_search(self.server.url('/missing'), 'missing'),
+                       db.add_search('http://127.0.0.1:1/refused', 'refused')]
+        start = time()
+        self.assertEqual(5, len(run_search(DB)))
+        with Database(DB) as db:
+            self.assertEqual([], db.get_due())
+            for search_id in failing:
+                self.assertAlmostEqual(start + Config.min_interval, db.get_next_due(search_id), delta=5)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+from random import Random
+import re
+import unittest
+
+from vehicular.filters import Criteria, Matcher, criteria, parse_year, plan_feed
+from vehicular.listing import Listing
+
+URL = 'https://denver.craigslist.org/search/mca?auto_make_model=drz+400&exclude=parts&' \
+      'format=rss&max_auto_year=2010&min_price=1000'
+BROAD = 'https://denver.craigslist.org/search/mca?format=rss'
+
+
+def post(title: str, summary: str = '') -> Listing:
+    """
+    Builds a listing the way the parser would
+    """
+    return Listing.from_entry({'id': 'https://denver.craigslist.org/mcy/d/1.html',
+                               'title': title, 'summary': summary})
+
+
+class TestFilters(unittest.TestCase):
+    """
+    Contains tests for the local filter stage
+    """
+
+    def test_plan_feed(self) -> None:
+        """
+        Local parameters never reach craigslist; the broad planner drops the rest too
+        """
+        self.assertEqual('https://denver.craigslist.org/search/mca?auto_make_model=drz+400'
+                         '&format=rss&max_auto_year=2010&min_price=1000',
+                         plan_feed(URL, broad=False))
+        self.assertEqual(BROAD, plan_feed(URL, broad=True))
+        self.assertEqual(BROAD, plan_feed(BROAD, broad=True))
+
+    def test_parse(self) -> None:
+        """
+        Price and year come from the title first, then the summary
+        """
+        self.assertEqual(3500, post('2006 Suzuki DRZ400S $3500').price)
+        self.assertEqual(12500, post('KTM', 'Asking $12,500 obo').price)
+        self.assertIsNone(post('KTM', '').price)
+        self.assertEqual(2006, parse_year(post('2006 Suzuki DRZ400S $3500')))
+        self.assertIsNone(parse_year(post('Honda XR650R $2900')))
+
+    def test_criteria(self) -> None:
+        """
+        Only what the downloaded feed leaves out is checked
+        """
+        self.assertEqual({'exclude': 'parts'}, criteria(URL).params)
+        self.assertEqual({'exclude': 'parts', 'auto_make_model': 'drz 400', 'max_auto_year': '2010',
+                          'min_price': '1000'}, criteria(URL, BROAD).params)
+        self.assertFalse(criteria(BROAD))
+        broad = criteria(URL, BROAD)
+        self.assertTrue(broad.matches(post('2006 Suzuki DRZ400S $3500')))
+        # Limits pass listings they can't be read from
+        self.assertTrue(broad.matches(post('Suzuki DRZ 400', 'runs great')))
+        self.assertFalse(broad.matches(post('2012 KTM 500 EXC $6800')))
+        self.assertFalse(broad.matches(post('2011 Suzuki DRZ400S $3500')))
+        self.assertFalse(broad.matches(post('2006 Suzuki DRZ400S $900')))
+        self.assertFalse(broad.matches(post('WANTED: DRZ400', 'Parts bike')))
+
+    def test_filter(self) -> None:
+        """
+        Empty criteria pass everything through untouched
+        """
+        listings = [post('Honda XR650R $2900'), post('XR650R for parts')]
+        self.assertIs(listings, Criteria({}).filter(listings))
+        self.assertEqual(listings[:1], Criteria({'exclude': 'part'}).filter(listings))
+
+    def test_matcher(self) -> None:
+        """
+        Words that overlap or are prefixes of each other are all found
+        """
+        searches = [Criteria({'auto_make_model': 'drz'}),
+                    Criteria({'auto_make_model': 'drz400 suzuki'}),
+                    Criteria({'auto_make_model': 'drz', 'exclude': 'part wanted'}),
+                    Criteria({'exclude': 'drz'}),
+                    Criteria({'min_price': '5000'})]
+        matcher = Matcher(searches)
+        self.assertEqual([0, 1, 2], matcher.match(post('2006 Suzuki DRZ400S $3500')))
+        self.assertEqual([0, 3, 4], matcher.match(post('XDRZ $9000', 'Parts')))
+        self.assertEqual([0], matcher.match(post('DRZ parts bike $500')))
+        # No price to hold against the limit
+        self.assertEqual([3, 4], matcher.match(post('Honda', '')))
+        self.assertEqual([[], [], [], [post('KLX')], [post('KLX')]],
+                         matcher.select([post('KLX')]))
+
+    def test_matcher_agrees(self) -> None:
+        """
+        Thousands of searches in one Matcher match the same as checking each on its own
+        """
+        random = Random(5)
+        vocabulary = ['drz', 'drz400', 'dr', 'klx', 'klx250', 'ktm', 'exc', 'parts', 'part',
+                      'wanted', 'trade', 'salvage', 'honda', 'xr', 'xr650', 'r']
+        searches = [Criteria({'auto_make_model': ' '.join(random.sample(vocabulary, random.randint(0, 2))),
+                              'exclude': ' '.join(random.sample(vocabulary, random.randint(0, 2)))})
+                    for _ in range(2000)]
+        listings = [post(' '.join(random.choice([word, word.upper(), f'x{word}', f'{word}s'])
+                                  for word in random.sample(vocabulary, 4)))
+                    for _ in range(200)]
+        matcher = Matcher(searches)
+        for listing in listings:
+            text = listing.title.lower()
+            expected = [index for index, search in enumerate(searches)
+                        if all(word in text for word in search.keywords)
+                        and not any(re.search(rf'\b{word}', text) for word in search.exclude)]
+            self.assertEqual(expected, matcher.match(listing))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,147 @@
+from contextlib import redirect_stdout
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from vehicular.main import Run
+
+DB = 'test_db.db'
+
+
+class TestRun(unittest.TestCase):
+    """
+    Contains tests for the search building side of Run
+    """
+
+    def setUp(self) -> None:
+        self.run = Run(DB)
+
+    def tearDown(self) -> None:
+        self.run.database.__exit__(None, None, None)
+        os.remove(DB)
+
+    def configure(self, commands) -> list:
+        """
+        Feeds shell commands to Run and returns the resulting search urls
+        """
+        with mock.patch('builtins.print'):
+            for command in commands:
+                self.run.onecmd(command)
+            return self.run.search_urls
+
+    def test_search_urls(self) -> None:
+        """
+        Every option makes it into the url, whatever order they were set in
+        """
+        first = self.configure(['city denver', 'vehicle_type motorcycle', 'make_model drz 400',
+                                'has_images', 'min_price 1000', 'condition good'])
+        self.run.reset_search_options()
+        second = self.configure(['condition good', 'min_price 1000', 'has_images',
+                                 'make_model drz 400', 'vehicle_type motorcycle', 'city denver'])
+        self.assertEqual(['https://denver.craigslist.org/search/mca?auto_make_model=drz+400&condition=40'
+                          '&format=rss&hasPic=1&min_price=1000'], first)
+        self.assertEqual(first, second)
+        # The database path isn't a search option, even if it looks like one
+        self.run.db_file = 'data=1.db'
+        self.assertEqual(first, self.run.search_urls)
+
+    def test_several_cities(self) -> None:
+        """
+        A search spanning several cities is stored as one, whatever order they're given in
+        """
+        first = self.configure(['cities denver boulder', 'vehicle_type motorcycle',
+                                'make_model drz 400'])
+        self.run.reset_search_options()
+        second = self.configure(['cities boulder denver', 'make_model drz 400'])
+        self.assertEqual(['https://boulder.craigslist.org/search/mca?auto_make_model=drz+400&format=rss',
+                          'https://denver.craigslist.org/search/mca?auto_make_model=drz+400&format=rss'],
+                         first)
+        self.assertEqual(first, second)
+        with mock.patch('builtins.print'):
+            self.run.onecmd('add_search')
+        self.assertEqual([(1, 'drz 400', first)], self.run.database.get_searches())
+        urls = self.configure(['region colorado', 'make_model drz 400'])
+        self.assertEqual(8, len(urls))
+
+    def import_searches(self, name: str, contents: str) -> list:
+        """
+        Imports searches from a temporary file, returning what was printed
+        """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, name)
+            with open(path, 'w') as file:
+                file.write(contents)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                self.run.onecmd(f'import_searches {path}')
+        return output.getvalue().splitlines()
+
+    def test_import_searches(self) -> None:
+        """
+        CSV, JSON and TOML files are validated, de-duplicated and imported
+        """
+        self.configure(['city boston'])
+        printed = self.import_searches('searches.csv', 'city,vehicle_type,make_model,has_images,name\n'
+                                                       'denver,motorcycle,drz 400,yes,\n'
+                                                       'denver,motorcycle,klx,no,kawasaki\n'
+                                                       'denver,motorcycle,drz 400,x,\n')
+        self.assertEqual(['Skipped 1 duplicate searches: drz 400', 'Imported 2 searches.'], printed)
+        self.assertEqual('boston', self.run.city)
+        self.assertEqual([(1, 'drz 400', ['https://denver.craigslist.org/search/mca?auto_make_model=drz+400'
+                                          '&format=rss&hasPic=1']),
+                          (2, 'kawasaki', ['https://denver.craigslist.org/search/mca?auto_make_model=klx'
+                                           '&format=rss'])],
+                         self.run.database.get_searches())
+        searches = [{'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'klx'},
+                    {'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'xr650',
+                     'min_price': 2000}]
+        printed = self.import_searches('searches.json', json.dumps(searches))
+        self.assertEqual(['Skipped 1 duplicate searches: klx', 'Imported 1 searches.'], printed)
+        printed = self.import_searches('searches.toml', '[[searches]]\ncity = "denver"\n'
+                                                        'vehicle_type = "motorcycle"\n'
+                                                        'make_model = "dr650"\nposted_today = true\n')
+        self.assertEqual(['Imported 1 searches.'], printed)
+        self.assertEqual(4, len(self.run.database.get_searches()))
+
+    def test_import_invalid(self) -> None:
+        """
+        One invalid search stops the whole import
+        """
+        printed = self.import_searches('searches.json', json.dumps(
+            [{'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'klx'},
+             {'city': 'denvr', 'vehicle_type': 'motorcycle', 'make_model': 'klx'},
+             {'city': 'denver', 'make_model': 'klx', 'wheels': 2}]))
+        self.assertEqual(['Search 2: Invalid city: `denvr`.  Be sure to enter exactly what is suggested',
+                          'Search 3: Unknown search option: `wheels`.',
+                          'Nothing imported.  Fix the searches above and try again.'], printed)
+        self.assertEqual([], self.run.database.get_searches())
+        printed = self.import_searches('searches.yaml', '')
+        self.assertIn('Unsupported file type', printed[0])
+        printed = self.import_searches('searches.csv', 'city,vehicle_type,make_model\n'
+                                                       'denver,motorcycle,klx,extra\n')
+        self.assertIn('Search 1 has more cells than the header.', printed[0])
+        printed = self.import_searches('searches.json', json.dumps(
+            [{'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'klx', 'has_images': 'maybe'}]))
+        self.assertIn('invalid value for `has_images`', printed[0])
+        self.assertEqual([], self.run.database.get_searches())
+
+    def test_import_toggles(self) -> None:
+        """
+        Toggles are read the same way in every format
+        """
+        printed = self.import_searches('searches.json', json.dumps(
+            [{'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'klx', 'has_images': 'no'},
+             {'city': 'denver', 'vehicle_type': 'motorcycle', 'make_model': 'xr650',
+              'has_images': 'false', 'posted_today': 'yes'}]))
+        self.assertEqual(['Imported 2 searches.'], printed)
+        self.assertEqual(sorted(['https://denver.craigslist.org/search/mca?auto_make_model=klx&format=rss',
+                                 'https://denver.craigslist.org/search/mca?auto_make_model=xr650'
+                                 '&format=rss&postToday=1']),
+                         sorted(url for _, _, (url,) in self.run.database.get_searches()))
+
+
+if __name__ == '__main__':
+    unittest.main()
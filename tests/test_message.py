@@ -0,0 +1,122 @@
+import os
+import smtplib
+import tempfile
+import unittest
+from unittest import mock
+
+from jinja2 import Environment, PackageLoader, select_autoescape
+
+from vehicular.config import Config
+from vehicular.message import Message, SMTPPool, SMTPSession, environment, precompile
+from vehicular.listing import Listing
+from vehicular.parser import parse_listings
+from vehicular.utilities import credential_validation
+from tests.stand_in import SMTPServer, read_feed
+
+LISTINGS = parse_listings(read_feed('denver_dualsport.rss'))
+
+
+class TestMessage(unittest.TestCase):
+    """
+    Contains tests for rendering email bodies
+    """
+
+    def setUp(self) -> None:
+        self.cache = tempfile.TemporaryDirectory()
+        patcher = mock.patch.object(Config, 'template_cache', self.cache.name)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        environment.cache_clear()
+        self.addCleanup(environment.cache_clear)
+
+    def tearDown(self) -> None:
+        self.cache.cleanup()
+
+    def test_render(self) -> None:
+        """
+        Both bodies render the same as with a freshly built environment
+        """
+        listings = LISTINGS + [Listing.from_dict(dict(LISTINGS[0].to_dict(), title='<b>Tom & Jerry</b>'))]
+        message = Message('sender', 'password', 'recipient', listings)
+        message.render_html()
+        message.render_text()
+        fresh = Environment(loader=PackageLoader('vehicular', 'templates'),
+                            autoescape=select_autoescape(['html', 'xml', 'txt']))
+        self.assertEqual(fresh.get_template('base.html').render(listings=listings), message.html)
+        self.assertEqual(fresh.get_template('base.txt').render(listings=listings), message.text)
+        self.assertIn('&lt;b&gt;Tom &amp; Jerry&lt;/b&gt;', message.html)
+
+    def test_precompile(self) -> None:
+        """
+        Templates are compiled once per process and cached on disk
+        """
+        self.assertIs(environment(), environment())
+        self.assertEqual(['_listing.html', 'base.html', 'base.txt'], precompile())
+        self.assertEqual(3, len(os.listdir(self.cache.name)))
+        template = environment().get_template('base.html')
+        Message('sender', 'password', 'recipient', LISTINGS).render_html()
+        self.assertIs(template, environment().get_template('base.html'))
+        # A new process loads bytecode rather than compiling
+        environment.cache_clear()
+        with mock.patch.object(Environment, 'compile') as compile_:
+            precompile()
+        compile_.assert_not_called()
+
+
+class TestSMTPSession(unittest.TestCase):
+    """
+    Sends messages to the local SMTP stand-in
+    """
+
+    def setUp(self) -> None:
+        self.server = SMTPServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        for name, value in ('hostname', '127.0.0.1'), ('port', self.server.server_address[1]), \
+                           ('starttls', False):
+            patcher = mock.patch.object(Config, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_send(self) -> None:
+        """
+        Messages sent over a session share a single connection and login
+        """
+        with SMTPSession('sender', 'password') as session:
+            for recipient in 'a', 'b', 'c':
+                Message('sender', 'password', recipient, LISTINGS).send(session)
+        self.assertEqual(1, self.server.logins)
+        self.assertEqual(1, len(self.server.connections))
+        self.assertEqual([('sender', [recipient], mock.ANY) for recipient in 'abc'], self.server.messages)
+        self.assertIn('2006 Suzuki DRZ400S $3500', self.server.messages[0][2])
+        # Without a session, each message gets its own connection
+        Message('sender', 'password', 'd', LISTINGS).send()
+        self.assertEqual(2, self.server.logins)
+
+    def test_reconnect(self) -> None:
+        """
+        A dropped connection is reopened transparently
+        """
+        pool = SMTPPool()
+        session = pool.session('sender', 'password')
+        self.assertIs(session, pool.session('sender', 'password'))
+        session.send('sender', 'a', 'first')
+        self.server.drop()
+        session.send('sender', 'b', 'second')
+        pool.close()
+        self.assertEqual(2, session.connections)
+        self.assertEqual(['first', 'second'], [data.strip() for *_, data in self.server.messages])
+
+    def test_credentials(self) -> None:
+        """
+        Bad credentials fail the login rather than being retried
+        """
+        self.assertTrue(credential_validation('sender', 'password'))
+        self.assertFalse(credential_validation('sender', 'wrong'))
+        with SMTPSession('sender', 'wrong') as session, \
+                self.assertRaises(smtplib.SMTPAuthenticationError):
+            session.send('sender', 'a', 'message')
+        self.assertEqual([], self.server.messages)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import asyncio
+import unittest
+from unittest import mock
+
+import feedparser as fp
+
+from vehicular.config import Config
+from vehicular.listing import FIELDS, Listing
+from vehicular.parser import ParsePool, parse_entries, parse_feed, parse_listings
+from tests.stand_in import read_feed
+
+FEEDS = 'denver_dualsport.rss', 'denver_motorcycles.rss'
+RSS2 = b'''<?xml version="1.0"?>
+<rss version="2.0"><channel><title>t</title>
+<item><title>Honda</title><link>https://a.com/1.html</link><guid>https://a.com/1.html</guid></item>
+</channel></rss>'''
+
+
+class TestParser(unittest.TestCase):
+    """
+    Contains tests for the streaming craigslist parser
+    """
+
+    def test_matches_feedparser(self) -> None:
+        """
+        The fast path yields the same fields feedparser does for recorded feeds
+        """
+        for name in FEEDS:
+            body = read_feed(name)
+            expected = fp.parse(body).entries
+            entries = parse_feed(body)
+            self.assertEqual(len(expected), len(entries))
+            for entry, reference in zip(entries, expected):
+                for key in 'id', 'title', 'link', 'summary':
+                    self.assertEqual(reference[key], entry[key])
+                self.assertEqual('enc_enclosure' in reference, 'enc_enclosure' in entry)
+                if 'enc_enclosure' in entry:
+                    self.assertEqual(reference['enc_enclosure']['resource'],
+                                     entry['enc_enclosure']['resource'])
+
+    def test_early_termination(self) -> None:
+        """
+        Parsing stops after Config.known_run posts in a row that have already
+        been seen, so a renewed old post at the top doesn't hide new ones below it
+        """
+        body = read_feed('denver_motorcycles.rss')
+        ids = [entry['id'] for entry in parse_feed(body)]
+        seen = set(ids[3:])
+        known = mock.Mock(side_effect=seen.__contains__)
+        entries = parse_feed(body, known=known)
+        self.assertEqual(ids[:3], [entry['id'] for entry in entries])
+        self.assertEqual(3 + Config.known_run, known.call_count)
+        self.assertEqual([], parse_feed(body, known=lambda post_id: True))
+        # A bumped post first, then new posts, then posts already seen
+        seen = {ids[0], *ids[4:]}
+        entries = parse_feed(body, known=seen.__contains__)
+        self.assertEqual(ids[1:4], [entry['id'] for entry in entries])
+        # Which stopping at the first known post would have missed
+        self.assertEqual([], parse_feed(body, seen.__contains__, known_run=1))
+
+    def test_fallback(self) -> None:
+        """
+        Feeds that aren't craigslist shaped go to feedparser
+        """
+        self.assertIsNone(parse_feed(RSS2))
+        self.assertIsNone(parse_feed(b'<rdf:RDF xmlns:rdf="oops'))
+        self.assertIsNone(parse_feed(b''))
+        entries = parse_entries(RSS2)
+        self.assertEqual(['https://a.com/1.html'], [entry['id'] for entry in entries])
+        self.assertEqual([], parse_entries(b'not a feed'))
+
+    def test_parse_pool(self) -> None:
+        """
+        Worker processes return the same compact listing records as parsing in-process
+        """
+        body = read_feed('denver_motorcycles.rss')
+        ids = [entry['id'] for entry in parse_feed(body)]
+        listings = parse_listings(body, known=set(ids[3:]))
+        self.assertEqual(ids[:3], [listing.id for listing in listings])
+        for listing in listings:
+            self.assertIs(Listing, type(listing))
+            self.assertTrue(all(getattr(listing, field) for field in FIELDS))
+        listing = parse_listings(read_feed('denver_dualsport.rss'))[0]
+        self.assertEqual('2006 Suzuki DRZ400S $3500', listing.title)
+        self.assertEqual(3500, listing.price)
+        self.assertIsInstance(listing.post_id, int)
+        self.assertTrue(listing.id.endswith(f'/{listing.post_id}.html'))
+        self.assertEqual(listing, Listing.from_dict(listing.to_dict()))
+        self.assertEqual(Listing('https://a.com/1.html', 'Old'),
+                         Listing.from_dict({'id': 'https://a.com/1.html', 'title': 'Old'}))
+
+        async def main(processes):
+            with ParsePool(processes) as pool:
+                return await pool.parse(body, {}, set(ids[3:]))
+        self.assertEqual(listings, asyncio.run(main(0)))
+        self.assertEqual(listings, asyncio.run(main(2)))
+
+    def test_parse_pool_settings(self) -> None:
+        """
+        Workers aren't forked, and get the pool's parser settings rather than
+        whatever the parent's Config held when they started
+        """
+        body = read_feed('denver_motorcycles.rss')
+        ids = [entry['id'] for entry in parse_feed(body)]
+
+        async def main(**settings):
+            with ParsePool(1, **settings) as pool:
+                with mock.patch.object(Config, 'known_run', 100):
+                    listings = await pool.parse(body, {}, {ids[0]})
+                self.assertNotEqual('fork', pool._executor._mp_context.get_start_method())
+                return [listing.id for listing in listings]
+        self.assertEqual([], asyncio.run(main(known_run=1)))
+        # feedparser doesn't skip known posts
+        self.assertEqual(ids, asyncio.run(main(fast_parser=False, known_run=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
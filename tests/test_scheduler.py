@@ -0,0 +1,34 @@
+import unittest
+
+from vehicular.config import Config
+from vehicular.scheduler import poll_interval, poll_rate
+
+
+class TestScheduler(unittest.TestCase):
+    """
+    Contains tests for the adaptive polling schedule
+    """
+
+    def test_poll_rate(self) -> None:
+        """
+        Tests smoothing of the rate of new posts
+        """
+        self.assertIsNone(poll_rate(None, 5, 0))
+        self.assertEqual(2 / 3600, poll_rate(None, 2, 3600))
+        rate = poll_rate(2 / 3600, 0, 3600)
+        self.assertAlmostEqual((1 - Config.rate_smoothing) * 2 / 3600, rate)
+        self.assertLess(poll_rate(rate, 0, 3600), rate)
+
+    def test_poll_interval(self) -> None:
+        """
+        Tests that intervals track the rate and stay within the configured bounds
+        """
+        self.assertEqual(Config.default_interval, poll_interval(None))
+        self.assertEqual(Config.max_interval, poll_interval(0))
+        self.assertEqual(Config.min_interval, poll_interval(1))
+        self.assertEqual(2 * 3600, poll_interval(Config.target_hits / 7200))
+        self.assertGreater(poll_interval(1 / 7200), poll_interval(1 / 3600))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import pickle
+import unittest
+
+from vehicular.database import Database
+from vehicular.seen import SeenSet, post_number
+
+DB = 'test_db.db'
+URL = 'google.com'
+
+
+def post(number: int) -> str:
+    """
+    Returns the url of a craigslist post
+    """
+    return f'https://denver.craigslist.org/mcy/d/suzuki-drz400s/{number}.html'
+
+
+class TestSeen(unittest.TestCase):
+    """
+    Contains tests for SeenSet and how searches store it
+    """
+
+    def tearDown(self) -> None:
+        if os.path.exists(DB):
+            os.remove(DB)
+
+    def test_post_number(self) -> None:
+        """
+        Numeric post IDs are read from post urls, if they fit in 64 bits
+        """
+        self.assertEqual(6631427810, post_number(post(6631427810)))
+        self.assertIsNone(post_number('hello'))
+        self.assertIsNone(post_number(post(2 ** 63)))
+
+    def test_add(self) -> None:
+        """
+        Posts are merged in sorted, without duplicates, and survive the BLOB
+        """
+        seen = SeenSet()
+        seen.add([post(30), post(10), 'other', post(10)])
+        seen.add([post(20), post(40)])
+        seen.add(post(number) for number in range(100, 200))
+        self.assertEqual([10, 20, 30, 40], list(seen.ids[:4]))
+        self.assertEqual(list(range(100, 200)), list(seen.ids[4:]))
+        self.assertEqual(105, len(seen))
+        self.assertIn(post(20), seen)
+        self.assertIn('other', seen)
+        self.assertNotIn(post(25), seen)
+        self.assertNotIn('stranger', seen)
+        copy = SeenSet(seen.to_blob(), seen.others)
+        self.assertEqual(8 * 104, len(copy.to_blob()))
+        self.assertEqual(set(seen), set(copy))
+        self.assertEqual(set(seen), set(pickle.loads(pickle.dumps(seen))))
+
+    def test_intersection(self) -> None:
+        """
+        Only posts every set has seen are in their intersection
+        """
+        first, second = SeenSet(), SeenSet()
+        first.add([post(1), post(2), 'a', 'b'])
+        second.add([post(2), post(3), 'b'])
+        common = first.intersection(second)
+        self.assertEqual({'2', 'b'}, set(common))
+        self.assertIs(first, first.intersection())
+
+    def test_database(self) -> None:
+        """
+        Numeric post IDs are stored in one BLOB per search, and other IDs in the hits table
+        """
+        with Database(DB) as db:
+            db.create_database()
+            search_id = db.add_search(URL, 'test_name')
+            db.update_hits(search_id, post(20), post(10), 'hello')
+            db.update_hits(search_id, post(10), post(15))
+            seen = db.get_seen(search_id)
+            self.assertEqual([10, 15, 20], list(seen.ids))
+            self.assertEqual({'hello'}, seen.others)
+            self.assertEqual({post(10), 'hello'}, db.get_hits(search_id, [post(10), post(11), 'hello']))
+            db.cursor.execute('SELECT LENGTH(post_ids) FROM seen')
+            self.assertEqual([(24,)], db.cursor.fetchall())
+            db.remove_search(search_id)
+            db.cursor.execute('SELECT COUNT(*) FROM seen')
+            self.assertEqual(0, db.cursor.fetchone()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
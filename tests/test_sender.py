@@ -0,0 +1,119 @@
+import os
+from time import time
+import unittest
+from unittest import mock
+
+from vehicular.config import Config
+from vehicular.database import Database, Writer
+from vehicular.listing import Listing
+from vehicular.parser import parse_listings
+from vehicular.sender import Sender
+from tests.stand_in import SMTPServer, read_feed
+
+DB = 'test_db.db'
+LISTINGS = parse_listings(read_feed('denver_dualsport.rss'))
+
+
+class TestSender(unittest.TestCase):
+    """
+    Drains the outbox to the local SMTP stand-in
+    """
+
+    def setUp(self) -> None:
+        self.server = SMTPServer().__enter__()
+        self.addCleanup(self.server.__exit__, None, None, None)
+        patcher = mock.patch.multiple(Config, hostname='127.0.0.1', port=self.server.server_address[1],
+                                      starttls=False, outbox_batch=2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with Database(DB) as db:
+            db.create_database()
+            db.set_credentials('sender', 'password', 'recipient')
+            writer = Writer(db)
+            writer.enqueue(*LISTINGS)
+            # Listings shared by several searches are only queued once
+            writer.enqueue(LISTINGS[0])
+            writer.flush()
+        self.sender = Sender(DB)
+        self.addCleanup(self.sender.smtp.close)
+
+    def tearDown(self) -> None:
+        os.remove(DB)
+
+    def test_drain(self) -> None:
+        """
+        Queued listings go out in batches over one connection, oldest first
+        """
+        self.assertEqual(5, self.sender.drain())
+        self.assertEqual(3, len(self.server.messages))
+        self.assertEqual(1, self.server.logins)
+        self.assertIn(LISTINGS[0].title, self.server.messages[0][2])
+        self.assertIn(LISTINGS[4].title, self.server.messages[2][2])
+        self.assertEqual(0, self.sender.drain())
+        self.sender.start()
+        self.sender.join()
+        self.assertEqual(3, len(self.server.messages))
+
+    def test_start(self) -> None:
+        """
+        Starting the sender while it's draining in the background has it drain
+        once more instead of starting another thread
+        """
+        self.sender.start()
+        self.sender.start()
+        self.sender.join()
+        self.assertEqual(5, self.sender.sent)
+        self.assertEqual(3, len(self.server.messages))
+        self.assertIsNone(self.sender._thread)
+
+    def test_retry(self) -> None:
+        """
+        Failed sends stay queued and back off exponentially
+        """
+        with Database(DB) as db:
+            db.set_credentials('sender', 'wrong', 'recipient')
+        with mock.patch('builtins.print'):
+            self.assertEqual(0, self.sender.drain())
+        with Database(DB) as db:
+            first = db.get_outbox_summary()[2] - time()
+            self.assertAlmostEqual(Config.retry_delay, first, delta=1)
+            # Nothing is retried before the backoff is up
+            self.assertEqual([], db.get_outbox(time()))
+            db.defer_outbox(time() + first)
+            self.assertAlmostEqual(first + 2 * Config.retry_delay, db.get_outbox_summary()[2] - time(),
+                                   delta=1)
+            # A long outage keeps backing off rather than overflowing the shift
+            for attempts in 20, 58, 63, 1000:
+                db.cursor.execute('UPDATE outbox SET attempts = ?, next_attempt = 0', (attempts,))
+                now = time()
+                db.defer_outbox(now)
+                self.assertAlmostEqual(now + Config.max_retry_delay, db.get_outbox_summary()[2], delta=1)
+            db.cursor.execute('UPDATE outbox SET next_attempt = 0')
+            db.set_credentials('sender', 'password', 'recipient')
+        self.assertEqual(5, self.sender.drain())
+        with Database(DB) as db:
+            self.assertEqual((0, None, None), db.get_outbox_summary())
+
+    def test_digest(self) -> None:
+        """
+        Hits wait for the digest window to close, then go out in one email
+        """
+        with mock.patch.multiple(Config, digest_interval=900, digest_size=20, outbox_batch=100):
+            self.assertEqual(0, self.sender.drain())
+            with Database(DB) as db:
+                self.assertAlmostEqual(time() + 900, Sender.next_send(db), delta=1)
+            with mock.patch.object(Config, 'digest_size', 5):
+                self.assertEqual(5, self.sender.drain())
+            self.assertEqual(1, len(self.server.messages))
+            with Database(DB) as db:
+                self.assertIsNone(Sender.next_send(db))
+                writer = Writer(db)
+                writer.enqueue(Listing.from_dict(dict(LISTINGS[0].to_dict(), id='new')))
+                writer.flush()
+                db.cursor.execute('UPDATE outbox SET queued = queued - 900')
+            self.assertEqual(1, self.sender.drain())
+        self.assertEqual(2, len(self.server.messages))
+
+
+if __name__ == '__main__':
+    unittest.main()
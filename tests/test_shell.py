@@ -0,0 +1,68 @@
+import unittest
+from unittest import mock
+
+from vehicular.dicts import CITIES, REGIONS
+from vehicular.shell import CarShell, PrefixIndex
+
+
+class TestShell(unittest.TestCase):
+    """
+    Contains tests for option completion and validation
+    """
+
+    def test_prefix_index(self) -> None:
+        """
+        Completions match a scan of every value
+        """
+        index = PrefixIndex(CITIES)
+        for prefix in '', 's', 'san', 'san_', 'denver', 'zzz', 'new':
+            self.assertEqual(sorted(city for city in CITIES if city.startswith(prefix)),
+                             index.complete(prefix))
+        self.assertIn('denver', index)
+        self.assertNotIn('denve', index)
+        self.assertEqual(list(CITIES), list(index))
+        self.assertEqual('denver', index.suggest('denvre')[0])
+        self.assertEqual([], index.suggest('xyzzy'))
+
+    def test_complete(self) -> None:
+        """
+        Every complete_* method goes through its index
+        """
+        shell = CarShell()
+        self.assertEqual(['san_antonio', 'san_diego'],
+                         [city for city in shell.complete_city('san_', '', 0, 0)
+                          if city in ('san_antonio', 'san_diego')])
+        self.assertEqual(['full-size'], shell.complete_car_size('f', '', 0, 0))
+        self.assertEqual(['10', '12'], shell.complete_cylinders('1', '', 0, 0))
+        self.assertEqual(list(shell.SELLER_TYPES), sorted(shell.complete_seller_type('', '', 0, 0),
+                                                          key=list(shell.SELLER_TYPES).index))
+        with mock.patch('builtins.print') as print_:
+            shell.do_city('denvr')
+        self.assertIsNone(shell.city)
+        self.assertIn('denver', print_.call_args[0][0])
+
+    def test_regions(self) -> None:
+        """
+        Every city belongs to exactly one region, and regions set the cities searched
+        """
+        self.assertEqual(list(CITIES), [city for cities in REGIONS.values() for city in cities])
+        self.assertEqual(('boulder', 'colorado_springs', 'denver', 'eastern_CO',
+                          'fort_collins_/_north_CO', 'high_rockies', 'pueblo', 'western_slope'),
+                         REGIONS['colorado'])
+        shell = CarShell()
+        with mock.patch('builtins.print'):
+            shell.do_city('denver')
+            shell.do_region('colorado')
+            self.assertIsNone(shell.city)
+            self.assertEqual(list(REGIONS['colorado']), shell.cities)
+            shell.do_cities('denver, boulder denver')
+            self.assertEqual(['denver', 'boulder'], shell.cities)
+            shell.do_cities('denver bouldr')
+            self.assertEqual(['denver', 'boulder'], shell.cities)
+            shell.do_city('denver')
+        self.assertIsNone(shell.cities)
+        self.assertEqual(['colorado'], shell.complete_region('colo', '', 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,34 @@
+import subprocess
+import sys
+import unittest
+
+HEAVY = 'asyncio', 'ssl', 'feedparser', 'jinja2', 'smtplib', 'email.mime', 'concurrent.futures', \
+        'readline', 'gnureadline'
+
+
+class TestStartup(unittest.TestCase):
+    """
+    Heavy dependencies are only imported on first use
+    """
+
+    def imported(self, module: str) -> set:
+        """
+        Returns which of HEAVY importing module pulls in, in a fresh interpreter
+        """
+        code = f'import sys, {module}; print(" ".join(sys.modules))'
+        output = subprocess.run([sys.executable, '-c', code], stdout=subprocess.PIPE,
+                                check=True, universal_newlines=True).stdout
+        return set(HEAVY) & set(output.split())
+
+    def test_lazy_imports(self) -> None:
+        """
+        Neither the command line entry point nor the shell imports heavy dependencies
+        """
+        self.assertEqual(set(), self.imported('vehicular.__main__'))
+        self.assertEqual(set(), self.imported('vehicular.main'))
+        # Sanity check: they are imported once a search runs
+        self.assertIn('asyncio', self.imported('vehicular.fetch'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,25 @@
+import unittest
+
+from vehicular.utilities import canonical_url
+
+
+class TestUtilities(unittest.TestCase):
+    """
+    Contains tests for utility functions
+    """
+
+    def test_canonical_url(self) -> None:
+        """
+        Tests that equivalent search urls canonicalize to the same string
+        """
+        expected = 'https://denver.craigslist.org/search/mca?auto_make_model=harley+davidson&format=rss&hasPic=1'
+        for url in ('https://denver.craigslist.org/search/mca?format=rss&hasPic=1&auto_make_model=harley+davidson',
+                    'feed:https://Denver.craigslist.org:443/search/mca?hasPic=1&auto_make_model=harley%20davidson&format=rss',
+                    'https://denver.craigslist.org/search/mca?auto_make_model=harley+davidson&min_price=&format=rss&hasPic=1&hasPic=1'):
+            self.assertEqual(expected, canonical_url(url))
+        self.assertEqual('http://127.0.0.1:8080/feed?a=1', canonical_url('http://127.0.0.1:8080/feed?a=1'))
+        self.assertEqual('google.com', canonical_url('google.com'))
+
+
+if __name__ == '__main__':
+    unittest.main()
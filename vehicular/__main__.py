@@ -17,14 +17,58 @@
     along with this program.  If not, see <https://www.gnu.org/licenses/>.
 
 """
-from vehicular.main import Run
+import argparse
+import sys
 
+from vehicular import cli
+from vehicular.cli import FLAG_OPTIONS, VALUE_OPTIONS
+from vehicular.config import Config
 
-def launch():
+
+def parse_args(argv: list = None) -> argparse.Namespace:
+    """
+    Parses command line arguments.  With no command, the interactive shell is
+    started.
+    """
+    parser = argparse.ArgumentParser(prog='vehicular',
+                                     description='Search craigslist for vehicles.')
+    parser.add_argument('--database', default=Config.database,
+                        help='sqlite3 database file')
+    commands = parser.add_subparsers(dest='command')
+    commands.add_parser('run', help='run due searches and send new hits, printing JSON')
+    add = commands.add_parser('add', help='add a search, printing JSON',
+                              description='Options take the same values as the shell commands '
+                                          'of the same name.  city (or cities or region), '
+                                          'vehicle_type and make_model are required.')
+    add.add_argument('--name', help='search name, by default the make_model')
+    for option in VALUE_OPTIONS:
+        add.add_argument(f'--{option.replace("_", "-")}', dest=option)
+    for option in FLAG_OPTIONS:
+        add.add_argument(f'--{option.replace("_", "-")}', dest=option, action='store_true')
+    commands.add_parser('list', help='list searches as JSON')
+    commands.add_parser('daemon', help='keep running, polling each search as it comes due')
+    commands.add_parser('precompile', help='compile the email templates ahead of time')
+    return parser.parse_args(argv)
+
+
+def launch(argv: list = None) -> None:
     """
     Launch script.
     """
-    with Run() as run:
+    args = parse_args(argv)
+    if args.command == 'run':
+        sys.exit(cli.run(args.database))
+    if args.command == 'add':
+        options = {option: getattr(args, option) for option in VALUE_OPTIONS + FLAG_OPTIONS}
+        sys.exit(cli.add(options, args.name, args.database))
+    if args.command == 'list':
+        sys.exit(cli.list_searches(args.database))
+    if args.command == 'daemon':
+        sys.exit(daemon(args.database))
+    if args.command == 'precompile':
+        sys.exit(precompile())
+    from vehicular.main import Run
+    with Run(args.database) as run:
         if not run.credentials:
             print('This looks to be your first time running the progam: set '
                   'your credentials first.')
@@ -32,5 +76,25 @@ def launch():
         run.cmdloop()
 
 
+def daemon(database: str = Config.database) -> int:
+    """
+    Runs vehicular as a long-lived daemon, see vehicular.daemon.Daemon
+    :return: exit status
+    """
+    from vehicular.daemon import Daemon
+    with Daemon(database) as runner:
+        return runner.start()
+
+
+def precompile() -> int:
+    """
+    Fills the template bytecode cache, e.g. after installing
+    :return: exit status
+    """
+    from vehicular.message import precompile
+    print(f'Compiled {", ".join(precompile())}.')
+    return 0
+
+
 if __name__ == '__main__':
     launch()
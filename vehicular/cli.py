@@ -0,0 +1,100 @@
+"""
+Contains the batch commands: run, add and list.  They skip the interactive
+shell, print JSON and return an exit status, so vehicular can be driven by
+scripts and schedulers without a TTY.  Like the rest of the entry point,
+only what a command needs is imported.
+"""
+import json
+from typing import Dict
+
+from vehicular.config import Config
+
+# Search options that take a value, and toggles, which are switched on by
+# name.  Each one is a shell command of the same name.
+VALUE_OPTIONS = ('city', 'cities', 'region', 'vehicle_type', 'seller_type', 'make_model',
+                 'postal_code', 'distance_from_postal', 'min_price', 'max_price', 'min_miles', 'max_miles',
+                 'min_year', 'max_year', 'condition', 'title_status', 'fuel', 'color',
+                 'transmission', 'cylinders', 'drive_train', 'type', 'car_size', 'exclude')
+FLAG_OPTIONS = 'has_images', 'posted_today', 'crypto', 'titles_only', 'nearby_areas'
+
+
+def output(result) -> None:
+    """
+    Prints a command's result as JSON
+    """
+    print(json.dumps(result))
+
+
+def error(message: str) -> int:
+    """
+    Prints an error as JSON
+    :return: exit status for failed commands
+    """
+    output({'error': message})
+    return 1
+
+
+def run(database: str = Config.database) -> int:
+    """
+    Runs every due search and sends whatever's ready in the outbox.  Prints
+    the number of new hits and sent listings, the new listings themselves,
+    and the feeds that couldn't be downloaded and sends that failed.
+    :return: exit status, 1 if anything failed
+    """
+    from vehicular.database import Database, iter_search
+    from vehicular.sender import Sender
+    with Database(database) as db:
+        db.create_database()
+        credentials = db.credentials
+    if not credentials or not all(credentials):
+        return error('Ensure that credentials have been set successfully first.')
+    sender = Sender(database)
+    hits, errors = [], {}
+    # Each feed's hits are sent while the slower feeds are still downloading
+    for batch in iter_search(database, errors=errors):
+        hits.extend(batch)
+        sender.start()
+    # Also retries anything a previous send failed on
+    sender.start()
+    sender.join()
+    sender.smtp.close()
+    output({'hits': len(hits), 'sent': sender.sent, 'listings': [hit.to_dict() for hit in hits],
+            'failed_feeds': errors, 'send_errors': sender.errors})
+    return 1 if errors or sender.errors else 0
+
+
+def add(options: Dict[str, str or bool], name: str = None, database: str = Config.database) -> int:
+    """
+    Adds a search, built and validated the same way as in the shell.  Prints
+    the new search's name and the url of each of its cities.
+    :param options: search options, see Run.configure
+    :param name: search name, by default taken from the make_model
+    :return: exit status
+    """
+    import sqlite3
+    from vehicular.main import Run
+    with Run(database) as shell:
+        try:
+            urls = shell.configure(options)
+        except ValueError as exc:
+            return error(str(exc))
+        name = name or shell.search_name
+        try:
+            shell.database.add_search(urls, name)
+        except sqlite3.IntegrityError:
+            return error('Each search must be unique!')
+    output({'name': name, 'urls': urls})
+    return 0
+
+
+def list_searches(database: str = Config.database) -> int:
+    """
+    Prints every search's name and the url of each of its cities
+    :return: exit status
+    """
+    from vehicular.database import Database
+    with Database(database) as db:
+        db.create_database()
+        output([{'name': name, 'urls': urls} for _, name, urls in db.get_searches()])
+    return 0
+
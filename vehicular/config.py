@@ -11,4 +11,57 @@ class Config:
     """
     hostname = 'smtp.gmail.com'
     port = 587
+    starttls = True
+    # Directory compiled email templates are cached in, None for a private
+    # directory under the system's temp directory
+    template_cache = None
+    # Most listings sent in one email, and the wait before retrying a failed
+    # send, in seconds, which doubles with each failure up to max_retry_delay
+    outbox_batch = 100
+    retry_delay = 60
+    max_retry_delay = 60 * 60
+    # Digest window: new hits wait in the outbox until the oldest has waited
+    # digest_interval seconds or digest_size have piled up, then go out
+    # together.  0 sends every run's hits straight away.
+    digest_interval = 0
+    digest_size = 20
     database = os.path.join(os.path.dirname(__file__), 'data.db')
+    # Seconds a connection waits for another one's write lock
+    busy_timeout = 10
+    # Feed downloads
+    concurrency = 20
+    timeout = 30
+    max_redirects = 5
+    user_agent = 'vehicular/0.1.0 (+https://github.com/jakkso/vehicular)'
+    # Politeness towards each craigslist subdomain: sustained requests per
+    # second, and how many may be sent back to back
+    host_rate = 1.0
+    host_burst = 5
+    # Keep-alive connections kept per host, and seconds an idle one is kept open
+    pool_size = 4
+    idle_timeout = 30
+    # Adaptive polling, all intervals in seconds
+    min_interval = 15 * 60
+    max_interval = 6 * 60 * 60
+    default_interval = 60 * 60
+    # New posts a poll should turn up on average
+    target_hits = 1
+    # Weight given to the latest poll in the smoothed rate of new posts
+    rate_smoothing = 0.3
+    # Longest the daemon sleeps before checking the database for changes
+    reload_interval = 60
+    # Parse craigslist feeds with the streaming parser in vehicular.parser,
+    # stopping once known_run posts in a row have already been seen.  More
+    # than one, since a renewed old post can sit above new ones.
+    fast_parser = True
+    known_run = 5
+    # Worker processes feeds are parsed in, 0 to parse on the event loop's thread
+    parse_processes = os.cpu_count() or 1
+    # How the workers are started.  By then the run has threads going, such as
+    # the sender's, which fork would copy mid-flight; forkserver forks them
+    # from a clean process instead.  spawn is used where it isn't available.
+    parse_start_method = 'forkserver'
+    # Download one feed per city and category, and apply make / model, price
+    # and year locally, see vehicular.filters.plan_feed.  Fewer downloads for
+    # many similar searches, at the risk of quiet searches missing posts.
+    broad_feeds = False
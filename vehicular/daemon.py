@@ -0,0 +1,205 @@
+"""
+Contains Daemon, which keeps a single process polling searches as they come due
+"""
+import asyncio
+import heapq
+import signal
+from time import time
+from typing import List, Tuple
+
+from vehicular.config import Config
+from vehicular.database import Database, stream_searches
+from vehicular.fetch import Fetcher
+from vehicular.message import SMTPPool, precompile
+from vehicular.parser import ParsePool
+from vehicular.sender import Sender
+
+
+class Daemon:
+    """
+    Long-running alternative to launching `run_search` from cron.  Searches
+    are held in a heap keyed by the time they're next due and dispatched as
+    they come due, so startup costs are paid once and every search is polled
+    on its own schedule.  The heap is rebuilt whenever another process
+    commits to the database, e.g. after adding a search from the shell.
+    New hits are emailed by a separate sender task that drains the outbox, so
+    a slow SMTP server never holds up polling.  SIGTERM and SIGINT stop the
+    daemon after in-flight searches finish and the outbox has been drained.
+    """
+
+    def __init__(self, database: str = Config.database, concurrency: int = Config.concurrency):
+        """
+        :param database: sqlite3 database file
+        :param concurrency: max number of simultaneous feed downloads
+        """
+        self.db_file = database
+        self.concurrency = concurrency
+        self.database = Database(self.db_file)
+        self.database.create_database()
+        self._heap = []
+        self._in_flight = {}
+        self._data_version = None
+        self._stop = None
+        self._wake = None
+        self.smtp = SMTPPool()
+        self.sender = Sender(self.db_file, self.smtp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.smtp.close()
+        self.database.__exit__(exc_type, exc_val, exc_tb)
+
+    def start(self) -> int:
+        """
+        Runs the daemon until it's signalled to stop
+        :return: exit status
+        """
+        if not self.credentials:
+            print('Ensure that credentials have been set successfully first.')
+            return 1
+        precompile()
+        asyncio.run(self.run())
+        return 0
+
+    @property
+    def credentials(self) -> Tuple[str, str, str] or None:
+        """
+        Returns sender, password and recipient if they've all been set
+        """
+        credentials = self.database.credentials
+        if credentials and all(credentials):
+            return credentials
+
+    def stop(self) -> None:
+        """
+        Asks the main loop to finish
+        """
+        self._stop.set()
+
+    async def run(self) -> None:
+        """
+        Main loop.  Sleeps until the next search is due, the database changes,
+        or the daemon is stopped, whichever comes first.
+        """
+        loop = asyncio.get_running_loop()
+        self._stop = asyncio.Event()
+        self._wake = asyncio.Event()
+        for sig in signal.SIGTERM, signal.SIGINT:
+            loop.add_signal_handler(sig, self.stop)
+        fetcher = Fetcher(self.concurrency)
+        parser = ParsePool()
+        sending = loop.create_task(self.send_outbox())
+        print('Daemon started.')
+        try:
+            while not self._stop.is_set():
+                fetcher.pool.prune()
+                if self.database.data_version != self._data_version:
+                    self.reload()
+                due = self.pop_due(time())
+                if due:
+                    task = loop.create_task(self.dispatch(due, fetcher, parser))
+                    self._in_flight.update(dict.fromkeys(due, task))
+                try:
+                    await asyncio.wait_for(self._stop.wait(), self.sleep_time(time()))
+                except asyncio.TimeoutError:
+                    pass
+            if self._in_flight:
+                await asyncio.gather(*set(self._in_flight.values()), return_exceptions=True)
+            self._wake.set()
+            await sending
+        finally:
+            sending.cancel()
+            fetcher.close()
+            parser.close()
+            for sig in signal.SIGTERM, signal.SIGINT:
+                loop.remove_signal_handler(sig)
+        print('Daemon stopped.')
+
+    def reload(self) -> None:
+        """
+        Rebuilds the heap from the searches table.  Searches that are currently
+        being polled are left out; they're pushed back when they finish.
+        """
+        self._data_version = self.database.data_version
+        self._heap = [(next_due or 0, search_id) for search_id, next_due in self.database.get_schedule()
+                      if search_id not in self._in_flight]
+        heapq.heapify(self._heap)
+
+    def pop_due(self, now: float) -> List[str]:
+        """
+        Pops every search that's due at `now`
+        :param now: unix time
+        :return: list of search ids, most overdue first
+        """
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[1])
+        return due
+
+    def sleep_time(self, now: float) -> float:
+        """
+        Returns how long to sleep before the next search is due, capped at
+        Config.reload_interval so outside changes are noticed
+        """
+        if not self._heap:
+            return Config.reload_interval
+        return max(0, min(Config.reload_interval, self._heap[0][0] - now))
+
+    async def dispatch(self, search_ids: List[int], fetcher: Fetcher, parser: ParsePool) -> None:
+        """
+        Polls searches that came due together, wakes the sender as each feed
+        turns up new hits and reschedules them.  Searches are polled as one
+        run, so that a search spanning several cities is only rescheduled once
+        all of its feeds are done.
+        """
+        try:
+            hits = 0
+            async for batch in stream_searches(self.database, search_ids, fetcher, parser):
+                hits += len(batch)
+                self._wake.set()
+            if hits:
+                print(f'{hits} new hits for {len(search_ids)} searches')
+        finally:
+            for search_id in search_ids:
+                del self._in_flight[search_id]
+                next_due = self.database.get_next_due(search_id)
+                # The search may have been deleted while it was being polled.  A poll
+                # that raised leaves it due, so hold off on retrying for a while.
+                # Failed downloads are pushed back in the database, so reloads keep that.
+                if next_due is not None:
+                    heapq.heappush(self._heap, (max(next_due, time() + Config.min_interval), search_id))
+
+    async def send_outbox(self) -> None:
+        """
+        Sender loop.  Drains the outbox whenever a poll queues new hits, a
+        digest window closes or a failed send is due to be retried, and one
+        last time once the daemon is stopped and in-flight polls are done.
+        """
+        while True:
+            self._wake.clear()
+            await self.notify()
+            if self._stop.is_set() and not self._in_flight:
+                return
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.send_time(time()))
+            except asyncio.TimeoutError:
+                pass
+
+    def send_time(self, now: float) -> float:
+        """
+        Returns how long until the outbox should next be drained, capped at
+        Config.reload_interval
+        """
+        next_send = self.sender.next_send(self.database)
+        if next_send is None:
+            return Config.reload_interval
+        return max(0, min(Config.reload_interval, next_send - now))
+
+    async def notify(self) -> int:
+        """
+        Drains the outbox without blocking the event loop
+        :return: number of listings sent
+        """
+        return await asyncio.get_running_loop().run_in_executor(None, self.sender.drain)
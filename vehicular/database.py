@@ -1,16 +1,30 @@
 """
 Contains classes that define database usage methods
 """
-from itertools import chain
+# The fetch engine, parsers and feedparser are only imported once a search
+# actually runs, so the shell and other quick commands start fast
+from __future__ import annotations
 
-from multiprocessing.dummy import Pool as ThreadPool
+from hashlib import sha1
+from itertools import chain
+import json
 import sqlite3
+import sys
 from time import time
-from typing import List, Tuple
-
-import feedparser as fp
+from typing import TYPE_CHECKING, AsyncIterator, Container, Dict, Iterable, Iterator, List, Set, Tuple
 
 from vehicular.config import Config
+from vehicular.filters import matcher, plan_feed
+from vehicular.listing import Listing
+from vehicular.scheduler import poll_interval, poll_rate
+from vehicular.seen import SeenSet, post_number
+from vehicular.utilities import canonical_url
+
+if TYPE_CHECKING:
+    import feedparser as fp
+
+    from vehicular.fetch import Fetcher, Response
+    from vehicular.parser import ParsePool
 
 
 class Database:
@@ -23,15 +37,19 @@ class Database:
         :param database: sqlite3 database file.  By default it's located in the same directory as this file.
         """
         self._database = database
-        self._connection = sqlite3.connect(self._database)
+        self._connection = sqlite3.connect(self._database, timeout=Config.busy_timeout)
         self.cursor = self._connection.cursor()
+        # WAL lets the shell and the daemon read while a run is writing, and
+        # NORMAL only syncs at checkpoints, which WAL keeps crash safe
+        self.cursor.execute('PRAGMA journal_mode = WAL')
+        self.cursor.execute('PRAGMA synchronous = NORMAL')
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         if exc_type is not None:
-            print(f'Error: {exc_val}\n{exc_tb}')
+            print(f'Error: {exc_val}\n{exc_tb}', file=sys.stderr)
             self._connection.rollback()
             self._connection.close()
         else:
@@ -45,7 +63,8 @@ class Database:
         """
         Used to init database file.
 
-        url - CL RSS feed URL
+        url - CL RSS feed URL.  Moved into the cities table by the migration to
+            version 8.
 
         name - Human readable name of the make_model search.
 
@@ -54,9 +73,30 @@ class Database:
             run searches when at least one hour has elapsed since the last search.
 
         hits - CSV string of search ID's (Which are actually just the URLs for each
-            individual CL post).  When fetched, they're split into a list.  Could just
-            use foreign keys, but this is (slightly) easier to deal with.  Given that
-            this is just a little hobby project, I figure that it doesn't really matter.
+            individual CL post).  Superseded by the hits table, which the migration
+            to version 2 converts this column into.
+
+        Columns and tables added after the initial release are created by
+        Database.migrate, see MIGRATIONS.  Notably:
+
+        searches.id - stable primary key, referenced by hits.search_id
+
+        searches.next_due, interval, rate, last_hits - adaptive polling schedule.
+            rate is a smoothed count of new posts per second, from which interval
+            is derived; see vehicular.scheduler.
+
+        hits - one row per (search_id, post_id), where post_id is the post URL and
+            first_seen the unix time it was found.  A unique index on the pair makes
+            membership checks and inserts cheap however long a search has been running.
+            Only holds posts without a numeric craigslist post ID since version 6.
+
+        seen - numeric post IDs each search has seen, as a sorted array of 64 bit
+            ints in a single BLOB per search; see vehicular.seen.SeenSet.
+
+        feeds - validators of each feed a search downloads, one row per city.
+
+        cities - feed url of each city a search covers, one row per city.  A
+            search is unique by its set of cities, see Database.add_search.
 
         :return: None
         """
@@ -70,85 +110,383 @@ class Database:
                             'sender TEXT, '
                             'password TEXT, '
                             'recipient TEXT)')
+        self.migrate()
 
-    def add_search(self, url: str, name: str) -> None:
+    def migrate(self) -> None:
         """
-        Adds search URL to database, along with name associated with each search.
-        :param url: search URL to store in database
+        Brings a database created by an older version up to date.  The schema
+        version is kept in sqlite's user_version pragma; each function in
+        MIGRATIONS upgrades it by one.
+        :return: None
+        """
+        self.cursor.execute('PRAGMA user_version')
+        current = self.cursor.fetchone()[0]
+        if current >= len(MIGRATIONS):
+            return
+        # One transaction, so a failed migration leaves the old schema intact.
+        # The version is read again under the write lock, in case another
+        # process migrated in the meantime.
+        self._connection.commit()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        self.cursor.execute('PRAGMA user_version')
+        current = self.cursor.fetchone()[0]
+        for version, migration in enumerate(MIGRATIONS[current:], start=current + 1):
+            migration(self.cursor)
+            self.cursor.execute(f'PRAGMA user_version = {version}')
+        self._connection.commit()
+
+    def add_search(self, urls: str or Iterable[str], name: str) -> int:
+        """
+        Adds search to database, along with name associated with each search.
+        :param urls: feed url of each city the search covers, or the url of a
+            search in a single city
         :param name: search name, human readable name.  Taken from the make_model
-        :return:
+        :return: id of the new search
+        :raises sqlite3.IntegrityError: if a search with the same cities is already stored
         """
-        self.cursor.execute('INSERT INTO searches (url, name, updated) VALUES (?,?,?)',
-                            (url, name, 0))
+        urls = self._urls(urls)
+        if self._find(urls) is not None:
+            raise sqlite3.IntegrityError('UNIQUE constraint failed: search already stored')
+        search_id = self._insert(urls, name)
         self._connection.commit()
+        return search_id
 
-    def remove_search(self, url: str) -> None:
+    def add_searches(self, searches: Iterable[Tuple[Iterable[str], str]]) -> int:
+        """
+        Adds many searches in a single transaction.  Searches whose cities are
+        already stored are skipped.
+        :param searches: (urls, name) tuples, see add_search
+        :return: number of searches added
         """
-        Removes search from database, based on RSS feed url
-        :param url: RSS feed url
+        added = 0
+        try:
+            for urls, name in searches:
+                urls = self._urls(urls)
+                if self._find(urls) is None:
+                    self._insert(urls, name)
+                    added += 1
+        except sqlite3.Error:
+            self._connection.rollback()
+            raise
+        self._connection.commit()
+        return added
+
+    @staticmethod
+    def _urls(urls: str or Iterable[str]) -> List[str]:
+        """
+        Returns the feed urls of a search, sorted, so the same cities make the
+        same search whatever order they're given in
+        """
+        return [urls] if isinstance(urls, str) else sorted(set(urls))
+
+    def _find(self, urls: List[str]) -> int or None:
+        """
+        Returns the id of the search covering exactly these feed urls, None if there isn't one
+        """
+        self.cursor.execute('SELECT search_id FROM cities GROUP BY search_id '
+                            f'HAVING COUNT(*) = ? AND SUM(url IN ({", ".join("?" * len(urls))})) = ?',
+                            (len(urls), *urls, len(urls)))
+        row = self.cursor.fetchone()
+        return row and row[0]
+
+    def _insert(self, urls: List[str], name: str) -> int:
+        """
+        Inserts a search and its cities, without committing
+        """
+        self.cursor.execute('INSERT INTO searches (name, updated, next_due, interval) '
+                            'VALUES (?,?,?,?)',
+                            (name, 0, 0, Config.default_interval))
+        search_id = self.cursor.lastrowid
+        self.cursor.executemany('INSERT INTO cities (search_id, url) VALUES (?, ?)',
+                                ((search_id, url) for url in urls))
+        return search_id
+
+    def remove_search(self, search_id: int) -> None:
+        """
+        Removes search from database, along with everything stored for it
+        :param search_id: search id
         :return:
         """
-        self.cursor.execute('DELETE FROM searches WHERE url = ?', (url,))
+        for table in 'hits', 'seen', 'feeds', 'cities':
+            self.cursor.execute(f'DELETE FROM {table} WHERE search_id = ?', (search_id,))
+        self.cursor.execute('DELETE FROM searches WHERE id = ?', (search_id,))
         self._connection.commit()
 
-    def get_url_name(self) -> List[Tuple[str, str]]:
+    def get_searches(self) -> List[Tuple[int, str, List[str]]]:
         """
-        Returns list of tuples of search urls and names
+        Returns list of tuples of search ids, names and the feed url of each
+        city the search covers
 
         example return:
-         [('example.rss.feed.url.1.craigslist.org', 'Human readable name 1),
-         ('example.rss.feed.url.2.craigslist.org', 'Human readable name 2)]
+         [(1, 'Human readable name 1', ['example.rss.feed.url.1.craigslist.org']),
+         (2, 'Human readable name 2', ['example.rss.feed.url.2.craigslist.org',
+                                       'example.rss.feed.url.3.craigslist.org'])]
 
         """
-        self.cursor.execute('SELECT url, name FROM searches')
-        return self.cursor.fetchall()
+        self.cursor.execute('SELECT id, name FROM searches ORDER BY id')
+        searches = self.cursor.fetchall()
+        cities = self.get_cities()
+        return [(search_id, name, cities.get(search_id, [])) for search_id, name in searches]
 
-    def get_urls(self) -> List[str]:
+    def get_cities(self, search_ids: Iterable[int] = None) -> Dict[int, List[str]]:
         """
-        Returns a list of search urls that need to be updated.  CL only updates the
-        RSS feeds once per hour.  This method returns urls that haven't been updated in the last hour
+        Returns the feed url of each city of every search
+        :param search_ids: only these searches, by default every one
+        :return: dict of search id to sorted feed urls
+        """
+        self.cursor.execute('SELECT search_id, url FROM cities ORDER BY search_id, url')
+        wanted = None if search_ids is None else set(search_ids)
+        cities = {}
+        for search_id, url in self.cursor.fetchall():
+            if wanted is None or search_id in wanted:
+                cities.setdefault(search_id, []).append(url)
+        return cities
+
+    def get_due(self) -> List[int]:
+        """
+        Returns a list of ids of searches that need to be updated, most overdue first.
+        Each search is polled on its own interval, see Database.record_poll.
         """
         now = time()
-        self.cursor.execute('SELECT url FROM searches WHERE ? >= updated + 3600', (now,))
+        self.cursor.execute('SELECT id FROM searches WHERE ? >= next_due ORDER BY next_due, id', (now,))
         return [item[0] for item in self.cursor.fetchall()]
 
-    def get_hits(self, url: str) -> List or List[str]:
+    def get_seen(self, search_id: int) -> SeenSet:
         """
-        Returns list of search hits associated with a rss search
-        :param url: rss search url
+        Returns every post a search has seen.  Numeric post IDs are read as a
+        single BLOB, which is only decoded once it's used.
+        :param search_id: search id
         """
-        self.cursor.execute('SELECT hits FROM searches WHERE url = ?', (url,))
-        try:
-            res = self.cursor.fetchone()[0].split(',')
-        # .split() doesn't work on None results
-        except AttributeError:
-            res = []
-        return res
+        blob = self._blob(search_id)
+        self.cursor.execute('SELECT post_id FROM hits WHERE search_id = ?', (search_id,))
+        return SeenSet(blob, (row[0] for row in self.cursor.fetchall()))
+
+    def get_hits(self, search_id: int, post_ids: Iterable[str] = None) -> Set[str]:
+        """
+        Returns set of search hits associated with a search
+        :param search_id: search id
+        :param post_ids: if given, only these post IDs are looked up
+        :return: post IDs.  Without `post_ids`, numeric post IDs are returned as
+            strings rather than post urls, see get_seen.
+        """
+        seen = self.get_seen(search_id)
+        if post_ids is None:
+            return set(seen)
+        return {post_id for post_id in post_ids if post_id in seen}
 
-    def update_hits(self, url: str, *hits) -> None:
+    def update_hits(self, search_id: int, *hits) -> None:
         """
-        Gets previous hits from database, combines all new hits (Which are CL urls)
-        into a single string, which is then stored in the row associated with its
-        rss url
+        Appends new hits (Which are CL urls) to the hits table.  Hits that are
+        already stored for this search are ignored.
 
-        :param url: search URL
+        :param search_id: search id
         :param hits: list of search hit IDs
         :return: None
         """
-        previous_hits = self.get_hits(url)
-        for hit in hits:
-            previous_hits.append(hit)
-        self.cursor.execute('UPDATE searches SET hits = ? WHERE url = ?', (','.join(previous_hits), url))
+        self.write_batch(hits=[(search_id, hit) for hit in hits])
+
+    def update_time(self, search_id: int) -> None:
+        """
+        Updates updated to current time.time for the specified search and
+        pushes next_due back by the search's current polling interval
+        :param search_id: search id
+        :return: None
+        """
+        now = time()
+        self.cursor.execute('UPDATE searches SET updated = ?, next_due = ? + interval WHERE id = ?',
+                            (now, now, search_id))
+
+    def record_poll(self, search_id: int, new_hits: int) -> None:
+        """
+        Records the outcome of a successful poll and reschedules the search.  The
+        first poll of a search is ignored for rate purposes, since everything in
+        the feed is new to it.
+        :param search_id: search id
+        :param new_hits: number of new posts the poll found
+        :return: None
+        """
+        self.write_batch(polls={search_id: new_hits})
+
+    def write_batch(self,
+                    hits: Iterable[Tuple[int, str]] = (),
+                    polls: Dict[int, int] = None,
+                    caches: Dict[Tuple[int, str], Tuple[str, str, str]] = None,
+                    outbox: Iterable[Listing] = (),
+                    failures: Iterable[int] = ()) -> None:
+        """
+        Applies a batch of writes in a single transaction.  Every write goes
+        through here, see Writer.
+        :param hits: (search id, post ID) pairs to add to the seen set of each search.
+            Numeric post IDs are merged into its BLOB, other IDs go in the hits table.
+        :param polls: search id to the number of new posts its poll found
+        :param caches: search id and feed, see get_cache, to the etag, last-modified
+            and digest of the feed
+        :param outbox: Listings to queue for sending.  Posts already
+            waiting in the outbox aren't queued twice.
+        :param failures: ids of searches a feed couldn't be downloaded for.  They're
+            retried after Config.min_interval, so hosts that are down or refuse
+            us aren't hammered.
+        :return: None
+        """
+        now = time()
+        numeric, others = {}, []
+        for search_id, post_id in hits:
+            if post_number(post_id) is None:
+                others.append((search_id, post_id, int(now)))
+            else:
+                numeric.setdefault(search_id, []).append(post_id)
+        try:
+            if not self._connection.in_transaction:
+                # Takes the write lock before the seen BLOBs are read.  Under WAL a
+                # deferred transaction can't upgrade its read snapshot once another
+                # connection has written, and busy_timeout doesn't retry that.
+                self.cursor.execute('BEGIN IMMEDIATE')
+            self.cursor.executemany('INSERT OR IGNORE INTO hits (search_id, post_id, first_seen) '
+                                    'VALUES (?, ?, ?)', others)
+            for search_id, post_ids in numeric.items():
+                seen = SeenSet(self._blob(search_id))
+                seen.add(post_ids)
+                self.cursor.execute('INSERT OR REPLACE INTO seen (search_id, post_ids) '
+                                    'VALUES (?, ?)', (search_id, seen.to_blob()))
+            self.cursor.executemany('UPDATE searches SET updated = ?, next_due = ?, interval = ?, '
+                                    'rate = ?, last_hits = ? WHERE id = ?',
+                                    self._schedule(polls or {}, now))
+            self.cursor.executemany('UPDATE searches SET next_due = ? WHERE id = ?',
+                                    ((now + Config.min_interval, search_id) for search_id in failures))
+            self.cursor.executemany('INSERT OR REPLACE INTO feeds '
+                                    '(search_id, url, etag, modified, digest) '
+                                    'VALUES (?, ?, ?, ?, ?)',
+                                    ((search_id, feed, *cache)
+                                     for (search_id, feed), cache in (caches or {}).items()))
+            self.cursor.executemany('INSERT OR IGNORE INTO outbox (post_id, listing, queued) '
+                                    'VALUES (?, ?, ?)',
+                                    ((listing.id, json.dumps(listing.to_dict()), int(now))
+                                     for listing in outbox))
+        except sqlite3.Error:
+            self._connection.rollback()
+            raise
         self._connection.commit()
-        self.update_time(url)
 
-    def update_time(self, url: str) -> None:
+    def _blob(self, search_id: int) -> bytes or None:
+        """
+        Returns the seen BLOB of a search, None if it hasn't seen any numeric post IDs
+        """
+        self.cursor.execute('SELECT post_ids FROM seen WHERE search_id = ?', (search_id,))
+        row = self.cursor.fetchone()
+        return row and row[0]
+
+    def _schedule(self, polls: Dict[int, int], now: float) -> List[tuple]:
+        """
+        Works out the new polling rate and interval of each polled search
+        :return: list of parameters for write_batch's searches UPDATE
+        """
+        rows = []
+        for search_id, new_hits in polls.items():
+            self.cursor.execute('SELECT updated, rate FROM searches WHERE id = ?', (search_id,))
+            row = self.cursor.fetchone()
+            if row is None:
+                continue
+            updated, rate = row
+            if updated:
+                rate = poll_rate(rate, new_hits, now - updated)
+            interval = poll_interval(rate)
+            rows.append((now, now + interval, interval, rate, new_hits, search_id))
+        return rows
+
+    def get_schedule(self) -> List[Tuple[int, float]]:
+        """
+        Returns every search id along with the time it's next due
+        """
+        self.cursor.execute('SELECT id, next_due FROM searches')
+        return self.cursor.fetchall()
+
+    def get_next_due(self, search_id: int) -> float or None:
         """
-        Updates updated to current time.time for the specified rss feed url
-        :param url: rss feed URL
+        Returns the time a search is next due, None if it doesn't exist
+        """
+        self.cursor.execute('SELECT next_due FROM searches WHERE id = ?', (search_id,))
+        row = self.cursor.fetchone()
+        return None if row is None else row[0] or 0
+
+    @property
+    def data_version(self) -> int:
+        """
+        sqlite's data_version, which changes whenever another connection commits
+        to the database file.  Used to notice searches added or removed from
+        outside the running process.
+        """
+        self.cursor.execute('PRAGMA data_version')
+        return self.cursor.fetchone()[0]
+
+    def get_cache(self, search_id: int, feed: str) -> Tuple[str, str, str]:
+        """
+        Returns the validators a search saved from the last download of a feed
+        :param search_id: search id
+        :param feed: canonical feed url, see filters.plan_feed
+        :return: tuple of etag, last-modified and sha1 hex digest of the body.
+            Each is None if the feed hasn't been downloaded yet.
+        """
+        self.cursor.execute('SELECT etag, modified, digest FROM feeds WHERE search_id = ? AND url = ?',
+                            (search_id, feed))
+        return self.cursor.fetchone() or (None, None, None)
+
+    def update_cache(self, search_id: int, feed: str, etag: str, modified: str,
+                     digest: str) -> None:
+        """
+        Saves the validators of the latest download of a feed
+        :param search_id: search id
+        :param feed: canonical feed url, see filters.plan_feed
+        :param etag: ETag response header
+        :param modified: Last-Modified response header
+        :param digest: sha1 hex digest of the response body
         :return: None
         """
-        self.cursor.execute('UPDATE searches SET updated = ? WHERE url = ?', (time(), url))
+        self.write_batch(caches={(search_id, feed): (etag, modified, digest)})
+
+    def get_outbox(self, now: float, limit: int = Config.outbox_batch) -> List[Tuple[int, Listing]]:
+        """
+        Returns queued listings that are ready to be sent, oldest first
+        :param now: unix time; listings whose last send failed wait out their backoff
+        :param limit: max number of listings
+        :return: list of outbox id, Listing tuples
+        """
+        self.cursor.execute('SELECT id, listing FROM outbox WHERE next_attempt <= ? '
+                            'ORDER BY id LIMIT ?', (now, limit))
+        return [(row_id, Listing.from_dict(json.loads(listing)))
+                for row_id, listing in self.cursor.fetchall()]
+
+    def remove_outbox(self, ids: Iterable[int]) -> None:
+        """
+        Removes listings that have been sent from the outbox
+        :param ids: outbox ids
+        :return: None
+        """
+        self.cursor.executemany('DELETE FROM outbox WHERE id = ?', ((row_id,) for row_id in ids))
+        self._connection.commit()
+
+    def defer_outbox(self, now: float) -> None:
+        """
+        Backs off after a failed send.  Every listing that was ready to be sent
+        waits before the next attempt, since whatever failed is likely to fail
+        the rest of the batch too.  Each failed attempt doubles the wait, from
+        Config.retry_delay up to Config.max_retry_delay.
+        :param now: unix time of the failed attempt
+        :return: None
+        """
+        # The shift is capped, since sqlite's wraps around after 63 bits
+        self.cursor.execute('UPDATE outbox SET attempts = attempts + 1, '
+                            'next_attempt = ? + MIN(?, ? << MIN(attempts, 16)) WHERE next_attempt <= ?',
+                            (now, Config.max_retry_delay, Config.retry_delay, now))
+        self._connection.commit()
+
+    def get_outbox_summary(self) -> Tuple[int, float, float]:
+        """
+        Returns how many listings are queued, when the oldest one was queued and
+        when the earliest one can next be attempted.  Times are None if the outbox
+        is empty.
+        """
+        self.cursor.execute('SELECT COUNT(*), MIN(queued), MIN(next_attempt) FROM outbox')
+        return self.cursor.fetchone()
 
     @property
     def credentials(self) -> Tuple[str, str, str]:
@@ -180,15 +518,274 @@ class Database:
         self._connection.commit()
 
 
+def _add_feed_cache(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 1: conditional GET validators and a body hash for each search, used to
+    skip parsing feeds that haven't changed since the last run.
+    """
+    for column in 'etag TEXT', 'modified TEXT', 'digest TEXT':
+        cursor.execute(f'ALTER TABLE searches ADD COLUMN {column}')
+
+
+def _normalize_hits(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 2: moves hits out of the comma-joined searches.hits column and into
+    their own table.  searches is rebuilt with an explicit primary key so that
+    hits.search_id survives a VACUUM; ids are carried over from the old rowids.
+    """
+    cursor.execute('ALTER TABLE searches RENAME TO searches_v1')
+    cursor.execute('CREATE TABLE searches '
+                   '(id INTEGER PRIMARY KEY, '
+                   'url TEXT UNIQUE, '
+                   'name TEXT, '
+                   'updated INTEGER, '
+                   'etag TEXT, '
+                   'modified TEXT, '
+                   'digest TEXT)')
+    cursor.execute('INSERT INTO searches (id, url, name, updated, etag, modified, digest) '
+                   'SELECT rowid, url, name, updated, etag, modified, digest FROM searches_v1')
+    cursor.execute('CREATE TABLE hits '
+                   '(search_id INTEGER NOT NULL REFERENCES searches (id), '
+                   'post_id TEXT NOT NULL, '
+                   'first_seen INTEGER)')
+    cursor.execute('CREATE UNIQUE INDEX hits_search_post ON hits (search_id, post_id)')
+    cursor.execute('SELECT rowid, updated, hits FROM searches_v1 WHERE hits IS NOT NULL')
+    for search_id, updated, hits in cursor.fetchall():
+        cursor.executemany('INSERT OR IGNORE INTO hits (search_id, post_id, first_seen) '
+                           'VALUES (?, ?, ?)',
+                           ((search_id, hit, updated) for hit in hits.split(',') if hit))
+    cursor.execute('DROP TABLE searches_v1')
+
+
+def _add_schedule(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 3: per-search polling schedule.  Existing searches keep the old
+    one hour cycle until their first poll under the new scheduler.
+    """
+    for column in 'next_due INTEGER', 'interval INTEGER', 'rate REAL', 'last_hits INTEGER':
+        cursor.execute(f'ALTER TABLE searches ADD COLUMN {column}')
+    cursor.execute('UPDATE searches SET next_due = updated + 3600, interval = ?',
+                   (Config.default_interval,))
+
+
+def _add_outbox(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 4: new listings waiting to be emailed, so notifications survive a
+    failed send.  Listings are stored as JSON, one row per post.
+    """
+    cursor.execute('CREATE TABLE outbox (id INTEGER PRIMARY KEY, post_id TEXT UNIQUE, '
+                   'listing TEXT NOT NULL, queued INTEGER, attempts INTEGER DEFAULT 0, '
+                   'next_attempt INTEGER DEFAULT 0)')
+
+
+def _add_feeds(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 5: validators of each feed of searches spanning several cities.
+    """
+    cursor.execute('CREATE TABLE feeds (search_id INTEGER NOT NULL REFERENCES searches (id), '
+                   'url TEXT NOT NULL, etag TEXT, modified TEXT, digest TEXT, '
+                   'PRIMARY KEY (search_id, url))')
+
+
+def _pack_hits(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 6: numeric post IDs move out of the hits table and into a sorted
+    array BLOB per search, see vehicular.seen.SeenSet.  Their first_seen
+    times aren't kept.
+    """
+    cursor.execute('CREATE TABLE seen (search_id INTEGER PRIMARY KEY REFERENCES searches (id), '
+                   'post_ids BLOB NOT NULL)')
+    cursor.execute('SELECT search_id, post_id FROM hits')
+    searches = {}
+    for search_id, post_id in cursor.fetchall():
+        if post_number(post_id) is not None:
+            searches.setdefault(search_id, []).append(post_id)
+    for search_id, post_ids in searches.items():
+        seen = SeenSet()
+        seen.add(post_ids)
+        cursor.execute('INSERT INTO seen (search_id, post_ids) VALUES (?, ?)',
+                       (search_id, seen.to_blob()))
+        cursor.executemany('DELETE FROM hits WHERE search_id = ? AND post_id = ?',
+                           ((search_id, post_id) for post_id in post_ids))
+
+
+def _canonicalize_urls(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 7: stores every search url in canonical form, see
+    utilities.canonical_url, as new searches have been.  Searches that turn
+    out to be the same are merged into the one already stored canonically,
+    or the oldest, keeping the posts either has seen.
+    """
+    cursor.execute('SELECT id, url FROM searches ORDER BY id')
+    searches = {}
+    for search_id, url in cursor.fetchall():
+        canonical = ' '.join(sorted({canonical_url(part) for part in url.split(' ')}))
+        searches.setdefault(canonical, []).append((search_id, url))
+    for canonical, rows in searches.items():
+        keep = next((search_id for search_id, url in rows if url == canonical), rows[0][0])
+        duplicates = [search_id for search_id, _ in rows if search_id != keep]
+        if duplicates:
+            _merge_searches(cursor, keep, duplicates)
+        cursor.execute('UPDATE searches SET url = ? WHERE id = ?', (canonical, keep))
+
+
+def _merge_searches(cursor: sqlite3.Cursor, keep: int, duplicates: List[int]) -> None:
+    """
+    Folds the hits of duplicate searches into the one kept, then removes them
+    """
+    seen = []
+    for search_id in keep, *duplicates:
+        cursor.execute('SELECT post_ids FROM seen WHERE search_id = ?', (search_id,))
+        row = cursor.fetchone()
+        seen.append(SeenSet(row and row[0]))
+    cursor.execute('INSERT OR REPLACE INTO seen (search_id, post_ids) VALUES (?, ?)',
+                   (keep, seen[0].union(*seen[1:]).to_blob()))
+    for search_id in duplicates:
+        cursor.execute('UPDATE OR IGNORE hits SET search_id = ? WHERE search_id = ?',
+                       (keep, search_id))
+        for table in 'hits', 'seen', 'feeds':
+            cursor.execute(f'DELETE FROM {table} WHERE search_id = ?', (search_id,))
+        cursor.execute('DELETE FROM searches WHERE id = ?', (search_id,))
+
+
+def _add_cities(cursor: sqlite3.Cursor) -> None:
+    """
+    Version 8: searches spanning several cities were stored as the feed url of
+    each city joined by spaces, in searches.url.  Every search's feed urls get
+    a row each in the cities table instead, and searches is rebuilt without
+    url, and without the validators, which join the other feeds' in feeds.
+    """
+    cursor.execute('CREATE TABLE cities (search_id INTEGER NOT NULL REFERENCES searches (id), '
+                   'url TEXT NOT NULL, PRIMARY KEY (search_id, url))')
+    cursor.execute('SELECT id, url, etag, modified, digest FROM searches WHERE url IS NOT NULL')
+    for search_id, url, *cache in cursor.fetchall():
+        urls = url.split(' ')
+        cursor.executemany('INSERT OR IGNORE INTO cities (search_id, url) VALUES (?, ?)',
+                           ((search_id, part) for part in urls))
+        if len(urls) == 1 and any(cache):
+            cursor.execute('INSERT OR IGNORE INTO feeds (search_id, url, etag, modified, digest) '
+                           'VALUES (?, ?, ?, ?, ?)', (search_id, plan_feed(url), *cache))
+    columns = 'id, name, updated, next_due, interval, rate, last_hits'
+    # Built under another name, as renaming searches would repoint the other tables at it
+    cursor.execute('CREATE TABLE searches_v8 (id INTEGER PRIMARY KEY, name TEXT, updated INTEGER, '
+                   'next_due INTEGER, interval INTEGER, rate REAL, last_hits INTEGER)')
+    cursor.execute(f'INSERT INTO searches_v8 ({columns}) SELECT {columns} FROM searches')
+    cursor.execute('DROP TABLE searches')
+    cursor.execute('ALTER TABLE searches_v8 RENAME TO searches')
+
+
+# Applied in order by Database.migrate.  Only ever append to this.
+MIGRATIONS = (_add_feed_cache,
+              _normalize_hits,
+              _add_schedule,
+              _add_outbox,
+              _add_feeds,
+              _pack_hits,
+              _canonicalize_urls,
+              _add_cities)
+
+
+class Writer:
+    """
+    Single writer for a search run.  Workers queue their writes here rather
+    than committing each one, and flush applies everything queued so far in
+    one transaction, so a run costs a commit per feed with new hits, plus one
+    for the rest, however many searches it polls, and new hits can't be
+    recorded without also being queued for sending.
+    """
+
+    def __init__(self, db: Database):
+        """
+        :param db: open Database, also used by workers for reads
+        """
+        self.db = db
+        self.hits = []
+        self.polls = {}
+        self.caches = {}
+        self.outbox = []
+        self.failures = set()
+        # Feed url to why it couldn't be downloaded, for the caller to report
+        self.errors = {}
+        # Listings already written to the outbox, so a post two searches find
+        # is only queued with whichever is flushed first
+        self.queued = set()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.db!r})>'
+
+    def update_hits(self, search_id: int, *hits) -> None:
+        """
+        Queues new hits of a search
+        """
+        self.hits.extend((search_id, hit) for hit in hits)
+
+    def enqueue(self, *listings, search_id: int = None) -> None:
+        """
+        Queues new listings for the outbox
+        :param search_id: search that found them, see flush
+        """
+        self.outbox.extend((search_id, listing) for listing in listings)
+
+    def record_poll(self, search_id: int, new_hits: int) -> None:
+        """
+        Queues the outcome of a successful poll.  A search spanning several
+        cities is polled once per feed, and its new posts are added up.
+        """
+        self.polls[search_id] = self.polls.get(search_id, 0) + new_hits
+
+    def record_failure(self, feed: str, search_ids: Iterable[int], error: str) -> None:
+        """
+        Queues a failed download of a feed, for every search that shares it
+        """
+        self.failures.update(search_ids)
+        self.errors[feed] = error
+
+    def update_cache(self, search_id: int, feed: str, etag: str, modified: str,
+                     digest: str) -> None:
+        """
+        Queues the validators of a feed download
+        """
+        self.caches[search_id, feed] = etag, modified, digest
+
+    def flush(self, polls: bool = True, search_ids: Container[int] = None) -> None:
+        """
+        Writes everything queued so far in a single transaction
+        :param polls: also write the polls and failures.  Held back until a run
+            is done, so a search spanning several cities is rescheduled once.
+        :param search_ids: only write the hits, validators and listings of these
+            searches, and keep the rest queued.  A search spanning several
+            cities is flushed once all of its feeds are in, so its listings
+            reach the outbox, and are sent, together.
+        """
+        if search_ids is None:
+            hits, caches, outbox = self.hits, self.caches, self.outbox
+            self.hits, self.caches, self.outbox = [], {}, []
+        else:
+            hits = [hit for hit in self.hits if hit[0] in search_ids]
+            self.hits = [hit for hit in self.hits if hit[0] not in search_ids]
+            caches = {key: cache for key, cache in self.caches.items() if key[0] in search_ids}
+            self.caches = {key: cache for key, cache in self.caches.items() if key[0] not in search_ids}
+            outbox = [item for item in self.outbox if item[0] in search_ids]
+            self.outbox = [item for item in self.outbox if item[0] not in search_ids]
+        listings = [listing for _, listing in outbox if listing.id not in self.queued]
+        self.queued.update(listing.id for listing in listings)
+        batch = self.polls if polls else {}
+        failures = self.failures if polls else ()
+        if hits or batch or caches or listings or failures:
+            self.db.write_batch(hits, batch, caches, listings, failures)
+        if polls:
+            self.polls, self.failures = {}, set()
+
+
 class FPIntegration(Database):
     """
     Integrates Feedparser into database operations.  Deprecated in favor of
-    functional threaded approach
+    functional asyncio approach
     """
 
     def run_search(self) -> List[fp.FeedParserDict]:
         """
-        Updates rss feed urls (Remember, Database.get_urls only returns urls
+        Updates rss feed urls (Remember, Database.get_due only returns searches
         that haven't been updated in the last hour) and builds a single list of
         FeedParserDicts from feedparser.parse(url).entries.
 
@@ -197,70 +794,276 @@ class FPIntegration(Database):
         :return: list of FeedParserDicts
         """
         new_hits = []
-        for url in self.get_urls():
-            # Extend flattens all list results from each url
-            new_hits.extend(self._search_worker(url))
+        for search_id, urls in self.get_cities(self.get_due()).items():
+            for url in urls:
+                # Extend flattens all list results from each url
+                new_hits.extend(self._search_worker(search_id, url))
         return new_hits
 
-    def _search_worker(self, url) -> List[fp.FeedParserDict]:
+    def _search_worker(self, search_id: int, url: str) -> List[fp.FeedParserDict]:
         """
         Gets list of new hits associated with a single RSS feed url, increments
         row's updated value to current value of time.time()
 
-        :param url: RSS Feed URL
+        :param search_id: search id
+        :param url: RSS Feed URL of one of the search's cities
         :return:
         """
-        new_hits = [entry for entry in fp.parse(url).entries
-                    if entry['id'] not in self.get_hits(url)]
+        import feedparser as fp
+        seen = self.get_seen(search_id)
+        new_hits = [entry for entry in fp.parse(url).entries if entry['id'] not in seen]
         if new_hits:
             hit_ids = []
             for hit in new_hits:
                 # For some reason, CL hard-codes `$` as &#x0024
                 hit['title'] = hit['title'].replace('&#x0024;', '$')
                 hit_ids.append(hit['id'])
-            self.update_hits(url, *hit_ids)
-            self.update_time(url)
+            self.update_hits(search_id, *hit_ids)
+            self.update_time(search_id)
         return new_hits
 
 
-def search_worker(url_packet: Tuple[str, str]) -> List[fp.FeedParserDict]:
+async def search_worker(writer: Writer, searches: Dict[int, str], response: Response,
+                        feed: str,
+                        digests: Dict[int, str] = None,
+                        parser: ParsePool = None) -> Dict[int, List[Listing]]:
     """
-    Used by run_search to get back search results for a single rss feed url.
-    Adapted from FPIntegration._searchworker.  SQLite doesn't allow threads to
-    share database connections, so each thread has to open its own connection
+    Used by run_search to get back search results for a single rss feed.
+    Adapted from FPIntegration._searchworker.  The feed has already been
+    downloaded by the fetch engine, so only the body has to be parsed, and
+    only once however many searches share the feed.  With the fast parser,
+    parsing stops after a run of posts every one of those searches has seen.  Searches
+    for which the feed hasn't changed since the last run, either because the
+    server answered 304 or because the body hashes the same, don't need it
+    parsed at all.
 
-    :param url_packet: Tuple of the string to a database file and an rss feed url
-    :return:
+    :param writer: Writer of the run, which queues this worker's writes
+    :param searches: id of each search that shares this feed, to its url in the feed's city
+    :param response: downloaded feed
+    :param feed: canonical feed url, which keys the validators of each search
+    :param digests: sha1 hex digest of the body of each search's previous download
+    :param parser: ParsePool of the run, by default the body is parsed on this thread
+    :return: search id to its new hits, as Listings, in feed order
     """
-    database, url = url_packet
-    with Database(database) as db:
-        old_hits = db.get_hits(url)
-    new_hits = [entry for entry in fp.parse(url).entries
-                if entry['id'] not in old_hits]
-    if new_hits:
-        hit_ids = []
-        for hit in new_hits:
-            hit['title'] = hit['title'].replace('&#x0024;', '$')
-            hit_ids.append(hit['id'])
-        with Database(database) as db:
-            db.update_hits(url, *hit_ids)
-            db.update_time(url)
+    from vehicular.parser import ParsePool
+    digests = digests or {}
+    parser = parser or ParsePool(0)
+    db = writer.db
+    new_hits = {search_id: [] for search_id in searches}
+    if response.status == 304:
+        for search_id in searches:
+            writer.record_poll(search_id, 0)
+        return new_hits
+    new_digest = sha1(response.body).hexdigest()
+    etag, modified = response.headers.get('etag'), response.headers.get('last-modified')
+    entries = None
+    for search_id in searches:
+        if digests.get(search_id) == new_digest:
+            # The server may still have issued fresh validators for the same body
+            writer.record_poll(search_id, 0)
+            writer.update_cache(search_id, feed, etag, modified, new_digest)
+            continue
+        if entries is None:
+            pending = [search_id for search_id in searches if digests.get(search_id) != new_digest]
+            seen = {search_id: db.get_seen(search_id) for search_id in pending}
+            first, *rest = seen.values()
+            entries = await parser.parse(response.body, response.headers, first.intersection(*rest))
+            # Every search's criteria are matched in one pass over each listing
+            urls = tuple(searches[search_id] for search_id in pending)
+            selected = dict(zip(pending, matcher(urls, feed).select(entries)))
+        hits = [entry for entry in selected[search_id] if entry.id not in seen[search_id]]
+        if hits:
+            writer.update_hits(search_id, *(hit.id for hit in hits))
+            writer.enqueue(*hits, search_id=search_id)
+        writer.record_poll(search_id, len(hits))
+        writer.update_cache(search_id, feed, etag, modified, new_digest)
+        new_hits[search_id] = hits
     return new_hits
 
 
-def run_search(database: str=Config.database) -> List[fp.FeedParserDict]:
+def conditional_headers(etag: str or None, modified: str or None) -> Dict[str, str]:
+    """
+    Builds the request headers that let the server answer 304 Not Modified
+    :param etag: ETag of the previous download
+    :param modified: Last-Modified of the previous download
+    :return: dict of headers
+    """
+    headers = {}
+    if etag:
+        headers['If-None-Match'] = etag
+    if modified:
+        headers['If-Modified-Since'] = modified
+    return headers
+
+
+def group_feeds(cities: Dict[int, List[str]]) -> Dict[str, Dict[int, str]]:
+    """
+    Groups searches whose urls point at the same feed once canonicalized, so
+    that each feed is only downloaded once per run.  Searches spanning several
+    cities are expanded into the feed of each city.  Which feed a search
+    needs is up to filters.plan_feed; whatever it leaves out is filtered
+    locally by search_worker.
+    :param cities: search id to the feed url of each of its cities, see Database.get_cities
+    :return: dict of canonical feed url to the id of each search that shares
+        it, and that search's url in the feed's city
+    """
+    feeds = {}
+    for search_id, urls in cities.items():
+        for url in urls:
+            feeds.setdefault(plan_feed(url), {})[search_id] = url
+    return feeds
+
+
+async def search_feed(writer: Writer, feed: str, searches: Dict[int, str], fetcher: Fetcher,
+                      parser: ParsePool = None) -> Dict[int, List[Listing]]:
+    """
+    Downloads a single feed with the fetch engine and diffs it against the
+    stored hits of every search that shares it.  The download is conditional
+    when all of those searches agree on the validators of their previous
+    download, which they will after their first shared run.  Download failures
+    are reported, and the searches retried after Config.min_interval.
+
+    :param writer: Writer of the run
+    :param feed: canonical feed url
+    :param searches: searches that share the feed, see group_feeds
+    :param fetcher: Fetcher used for the download
+    :param parser: ParsePool the body is parsed in
+    :return: search id to its new hits, see search_worker
+    """
+    from vehicular.fetch import FetchError
+    caches = {search_id: writer.db.get_cache(search_id, feed) for search_id in searches}
+    validators = {(etag, modified) for etag, modified, _ in caches.values()}
+    headers = conditional_headers(*validators.pop()) if len(validators) == 1 else {}
+    try:
+        response = await fetcher.fetch(feed, headers)
+    except FetchError as exc:
+        error = str(exc)
+    else:
+        if response.status in (200, 304):
+            return await search_worker(writer, searches, response, feed,
+                                       {search_id: cache[2] for search_id, cache in caches.items()},
+                                       parser)
+        error = f'HTTP {response.status}'
+    print(f'Error fetching {feed}: {error}', file=sys.stderr)
+    writer.record_failure(feed, searches, error)
+    return {search_id: [] for search_id in searches}
+
+
+async def stream_searches(db: Database, search_ids: List[int], fetcher: Fetcher,
+                          parser: ParsePool = None,
+                          errors: Dict[str, str] = None) -> AsyncIterator[List[Listing]]:
     """
-    Runs the search, using multiprocessing.dummy.Pool.
-    This runs faster than the sequential version but only because it's IO-bound,
-    not CPU-bound.  (The GIL prevents true concurrency).
+    Polls every search concurrently, diffing each feed as soon as its body
+    arrives, so downloads and parsing overlap, and yields each search's new
+    hits as soon as all of its feeds are done, so the slowest host doesn't
+    hold up the rest, and a search spanning several cities still makes a
+    single notification.  Searches sharing a feed are coalesced into a
+    single download and listings they have in common are only yielded once,
+    as are listings a search spanning several cities finds in more than one
+    of them.  Downloads are started round-robin across hosts.  Hits are
+    committed, and queued in the outbox, before they're yielded; searches are
+    rescheduled, and searches without new hits committed, together once all
+    feeds are done.
 
-    :return: list of FeedParserDicts
+    :param db: open Database
+    :param search_ids: ids of the searches to poll
+    :param fetcher: Fetcher used for the downloads
+    :param parser: ParsePool the feeds are parsed in
+    :param errors: filled in with feed url to why it couldn't be downloaded
+    :return: async iterator of lists of Listings, one per feed that completes
+        searches with new hits
     """
+    import asyncio
+    from vehicular.fetch import interleave
+    feeds = group_feeds(db.get_cities(search_ids))
+    writer = Writer(db)
+    tasks = [asyncio.ensure_future(search_feed(writer, feed, feeds[feed], fetcher, parser))
+             for feed in interleave(feeds)]
+    # Feeds each search is still waiting on, and the hits of those it isn't
+    remaining = {}
+    for searches in feeds.values():
+        for search_id in searches:
+            remaining[search_id] = remaining.get(search_id, 0) + 1
+    found = {search_id: [] for search_id in remaining}
+    seen = set()
+    try:
+        for result in asyncio.as_completed(tasks):
+            done = []
+            for search_id, new_hits in (await result).items():
+                found[search_id].extend(new_hits)
+                remaining[search_id] -= 1
+                if not remaining[search_id]:
+                    done.append(search_id)
+            hits = []
+            for hit in chain.from_iterable(found.pop(search_id) for search_id in done):
+                if hit.id not in seen:
+                    seen.add(hit.id)
+                    hits.append(hit)
+            if hits:
+                writer.flush(polls=False, search_ids=done)
+                yield hits
+    finally:
+        # The consumer may stop early; feeds still downloading are dropped
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        writer.flush()
+        if errors is not None:
+            errors.update(writer.errors)
+
+
+def run_search(database: str=Config.database,
+               concurrency: int = Config.concurrency) -> List[Listing]:
+    """
+    Collects everything iter_search yields
+    :return: list of Listings
+    """
+    return list(chain.from_iterable(iter_search(database, concurrency)))
+
+
+def iter_search(database: str = Config.database,
+                concurrency: int = Config.concurrency,
+                errors: Dict[str, str] = None) -> Iterator[List[Listing]]:
+    """
+    Runs the search in two stages: feeds are downloaded by the asyncio fetch
+    engine, which doesn't block a thread per download, so hundreds of feeds can
+    be in flight at once; `concurrency` caps how many.  Bodies are then parsed
+    in a ParsePool, so parsing scales across cores rather than sharing the GIL.
+    Everything but parsing runs on the event loop's thread, so a single
+    database connection is shared by all workers.  Hits are yielded search by
+    search, see stream_searches, so callers can notify on the first ones while
+    slower feeds are still downloading.  The event loop only runs while the
+    next feed is awaited, so callers should hand slow work, like sending
+    email, to another thread.
+
+    :param errors: filled in with feed url to why it couldn't be downloaded
+    :return: iterator of lists of Listings, see stream_searches
+    """
+    import asyncio
+    from vehicular.fetch import Fetcher
+    from vehicular.parser import ParsePool
     with Database(database) as db:
-        urls = [(database, url) for url in db.get_urls()]
-    pool = ThreadPool(5)
-    # Flatten the 2D list returned from pool.map
-    hits = list(chain.from_iterable(pool.map(search_worker, urls)))
-    pool.close()
-    pool.join()
-    return hits
+        search_ids = db.get_due()
+        feeds = len(group_feeds(db.get_cities(search_ids)))
+    if not search_ids:
+        return
+
+    async def stream() -> AsyncIterator[List[Listing]]:
+        async with Fetcher(concurrency) as fetcher:
+            with ParsePool(min(Config.parse_processes, feeds)) as parser, \
+                    Database(database) as db:
+                async for hits in stream_searches(db, search_ids, fetcher, parser, errors):
+                    yield hits
+
+    loop = asyncio.new_event_loop()
+    batches = stream()
+    try:
+        while True:
+            try:
+                yield loop.run_until_complete(batches.__anext__())
+            except StopAsyncIteration:
+                return
+    finally:
+        loop.run_until_complete(batches.aclose())
+        loop.run_until_complete(loop.shutdown_asyncgens())
+        loop.close()
@@ -791,6 +791,85 @@ MOTO_SELLER = {
     'both': 'mca'
 }
 
+# First city of each state, province or part of the world, in CITIES order.  A region runs
+# up to the first city of the next one.
+REGION_STARTS = {
+    'alabama': 'auburn',
+    'alaska': 'anchorage_/_mat-su',
+    'arizona': 'flagstaff_/_sedona',
+    'arkansas': 'fayetteville',
+    'california': 'bakersfield',
+    'colorado': 'boulder',
+    'connecticut': 'eastern_CT',
+    'delaware': 'delaware',
+    'district_of_columbia': 'washington',
+    'florida': 'broward_county',
+    'georgia': 'albany',
+    'hawaii': 'hawaii',
+    'idaho': 'boise',
+    'illinois': 'bloomington-normal',
+    'indiana': 'bloomington',
+    'iowa': 'ames',
+    'kansas': 'lawrence',
+    'kentucky': 'bowling_green',
+    'louisiana': 'baton_rouge',
+    'maine': 'maine',
+    'maryland': 'annapolis',
+    'massachusetts': 'boston',
+    'michigan': 'ann_arbor',
+    'minnesota': 'bemidji',
+    'mississippi': 'gulfport_/_biloxi',
+    'missouri': 'columbia_/_jeff_city',
+    'montana': 'billings',
+    'nebraska': 'grand_island',
+    'nevada': 'elko',
+    'new_hampshire': 'new_hampshire',
+    'new_jersey': 'central_NJ',
+    'new_mexico': 'albuquerque',
+    'new_york': 'binghamton',
+    'north_carolina': 'asheville',
+    'north_dakota': 'bismarck',
+    'ohio': 'akron_/_canton',
+    'oklahoma': 'lawton',
+    'oregon': 'bend',
+    'pennsylvania': 'altoona-johnstown',
+    'rhode_island': 'rhode_island',
+    'south_carolina': 'charleston',
+    'south_dakota': 'northeast_SD',
+    'tennessee': 'chattanooga',
+    'texas': 'abilene',
+    'utah': 'logan',
+    'vermont': 'vermont',
+    'virginia': 'charlottesville',
+    'washington': 'bellingham',
+    'west_virginia': 'eastern_panhandle',
+    'wisconsin': 'appleton-oshkosh-FDL',
+    'wyoming': 'wyoming',
+    'us_territories': 'guam-micronesia',
+    'alberta': 'calgary',
+    'british_columbia': 'cariboo',
+    'manitoba': 'winnipeg',
+    'new_brunswick': 'new_brunswick',
+    'newfoundland': "st_john's",
+    'northwest_territories': 'territories',
+    'nova_scotia': 'halifax',
+    'ontario': 'barrie',
+    'prince_edward_island': 'prince_edward_island',
+    'quebec': 'montreal',
+    'saskatchewan': 'regina',
+    'yukon': 'whitehorse',
+    'europe': 'vienna',
+    'asia': 'bangladesh',
+    'oceania': 'adelaide',
+    'latin_america': 'buenos_aires',
+    'africa': 'egypt'
+}
+_CITY_NAMES = list(CITIES)
+_BOUNDS = [_CITY_NAMES.index(city) for city in REGION_STARTS.values()] + [len(_CITY_NAMES)]
+# Region to the cities in it, for searches that span several cities
+REGIONS = {region: tuple(_CITY_NAMES[start:end])
+           for region, start, end in zip(REGION_STARTS, _BOUNDS, _BOUNDS[1:])}
+
 TITLE_STATUS = {
     'clean': 'auto_title_status=1',
     'salvage': 'auto_title_status=2',
@@ -0,0 +1,417 @@
+"""
+Contains the asyncio HTTP client used to download RSS feeds
+"""
+import asyncio
+from collections import OrderedDict
+from itertools import chain, zip_longest
+import ssl
+from time import monotonic
+from typing import Dict, Iterable, List
+from urllib.parse import urljoin, urlsplit
+import zlib
+
+from vehicular.config import Config
+from vehicular.utilities import feed_url
+
+REDIRECTS = 301, 302, 303, 307, 308
+
+
+class FetchError(Exception):
+    """
+    Raised when a feed can't be downloaded
+    """
+
+
+class Response:
+    """
+    A downloaded feed.  Header names are lower-cased and the body has already
+    been decompressed, so it can be handed straight to feedparser.
+    """
+
+    def __init__(self, url: str, status: int, headers: Dict[str, str], body: bytes):
+        """
+        :param url: url the body was actually served from, after redirects
+        :param status: HTTP status code
+        :param headers: response headers
+        :param body: response body
+        """
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.url}, {self.status})>'
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter: allows bursts of up to `burst` requests, then
+    `rate` requests per second
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """
+        :param rate: tokens added per second
+        :param burst: bucket capacity
+        """
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+
+    async def acquire(self) -> None:
+        """
+        Waits until a token is available and takes it
+        """
+        while True:
+            now = monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class Connection:
+    """
+    An open HTTP connection, possibly reused across several requests
+    """
+
+    def __init__(self, key: tuple, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """
+        :param key: tuple of scheme, host and port the connection is for
+        """
+        self.key = key
+        self.reader = reader
+        self.writer = writer
+        self.requests = 0
+        self.idle_since = None
+
+    @property
+    def usable(self) -> bool:
+        """
+        False once the server has closed its end
+        """
+        return not (self.writer.is_closing() or self.reader.at_eof())
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class ConnectionPool:
+    """
+    Keeps keep-alive connections open between requests, so feeds on the same
+    craigslist subdomain don't each pay for a TCP and TLS handshake.  Each host
+    gets at most `size` connections, busy or idle, and idle connections are
+    dropped after `idle_timeout` seconds.  A size of 0 disables keep-alive.
+    """
+
+    def __init__(self,
+                 ssl_context: ssl.SSLContext,
+                 size: int = Config.pool_size,
+                 idle_timeout: float = Config.idle_timeout):
+        """
+        :param ssl_context: used for https connections
+        :param size: max connections per host
+        :param idle_timeout: seconds an unused connection is kept open
+        """
+        self.size = size
+        self.idle_timeout = idle_timeout
+        self.opened = 0
+        self._ssl = ssl_context
+        self._idle = {}
+        self._slots = {}
+
+    async def acquire(self, scheme: str, host: str, port: int) -> Connection:
+        """
+        Returns an idle connection to the host if there is a usable one, opens a
+        new one otherwise.  Waits if the host already has `size` connections.
+        """
+        key = scheme, host, port
+        if self.size:
+            await self._slots.setdefault(key, asyncio.Semaphore(self.size)).acquire()
+        try:
+            idle = self._idle.get(key, [])
+            while idle:
+                connection = idle.pop()
+                if connection.usable and monotonic() - connection.idle_since < self.idle_timeout:
+                    return connection
+                connection.close()
+            reader, writer = await asyncio.open_connection(
+                host, port, ssl=self._ssl if scheme == 'https' else None)
+        except BaseException:
+            self._free(key)
+            raise
+        self.opened += 1
+        return Connection(key, reader, writer)
+
+    def release(self, connection: Connection, reusable: bool) -> None:
+        """
+        Hands a connection back once its response has been read in full
+        :param connection: connection returned by acquire
+        :param reusable: whether the response left the connection open for another request
+        """
+        if self.size and reusable and connection.usable:
+            connection.idle_since = monotonic()
+            self._idle.setdefault(connection.key, []).append(connection)
+        else:
+            connection.close()
+        self._free(connection.key)
+
+    def prune(self) -> None:
+        """
+        Closes idle connections that have outlived idle_timeout
+        """
+        now = monotonic()
+        for key, idle in self._idle.items():
+            for connection in idle:
+                if now - connection.idle_since >= self.idle_timeout:
+                    connection.close()
+            self._idle[key] = [connection for connection in idle if not connection.writer.is_closing()]
+
+    def close(self) -> None:
+        """
+        Closes every idle connection
+        """
+        for idle in self._idle.values():
+            for connection in idle:
+                connection.close()
+        self._idle.clear()
+
+    def _free(self, key: tuple) -> None:
+        if self.size:
+            self._slots[key].release()
+
+
+class Fetcher:
+    """
+    Downloads feeds over asyncio streams, so waiting on the network doesn't
+    tie up a thread per feed.  At most `concurrency` requests are in flight
+    at any one time, and each host gets its own token bucket so a burst of
+    searches in one city doesn't get us throttled.  Requests wait for their
+    host's token before taking a concurrency slot, so a busy host never holds
+    up the others.  Connections are kept alive in a ConnectionPool; call
+    close, or use it as an async context manager, when done.
+    """
+
+    def __init__(self,
+                 concurrency: int = Config.concurrency,
+                 timeout: float = Config.timeout,
+                 host_rate: float = Config.host_rate,
+                 host_burst: int = Config.host_burst,
+                 pool_size: int = Config.pool_size,
+                 ssl_context: ssl.SSLContext = None):
+        """
+        :param concurrency: max number of simultaneous requests
+        :param timeout: seconds allowed for a single request, redirects included
+        :param host_rate: sustained requests per second allowed to each host
+        :param host_burst: requests a host may receive back to back
+        :param pool_size: max keep-alive connections per host, 0 to disable keep-alive
+        :param ssl_context: used for https, defaults to ssl.create_default_context()
+        """
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._timeout = timeout
+        self.pool = ConnectionPool(ssl_context or ssl.create_default_context(), pool_size)
+        self._host_rate = host_rate
+        self._host_burst = host_burst
+        self._buckets = {}
+
+    def bucket(self, host: str) -> TokenBucket:
+        """
+        Returns the token bucket of a host, creating it on first use
+        """
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self._host_rate, self._host_burst)
+        return self._buckets[host]
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self) -> None:
+        """
+        Closes pooled connections
+        """
+        self.pool.close()
+
+    async def fetch(self, url: str, headers: Dict[str, str] = None) -> Response:
+        """
+        Downloads a single url, following redirects
+        :param url: feed url.  `feed:` prefixed urls are accepted
+        :param headers: additional request headers
+        :return: Response
+        :raises FetchError: on network errors, timeouts or malformed responses
+        """
+        url = feed_url(url)
+        await self.bucket(urlsplit(url).hostname or '').acquire()
+        async with self._semaphore:
+            try:
+                return await asyncio.wait_for(self._get(url, headers or {}),
+                                              self._timeout)
+            except asyncio.TimeoutError:
+                raise FetchError(f'Timed out after {self._timeout} seconds')
+            except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                raise FetchError(str(exc) or exc.__class__.__name__) from exc
+
+    async def fetch_all(self, urls: List[str]) -> List[Response or FetchError]:
+        """
+        Downloads every url concurrently.  Failures are returned in place of
+        the response rather than raised, so one bad feed doesn't sink the rest.
+        :param urls: list of feed urls
+        :return: list of Responses or FetchErrors, in the same order as urls
+        """
+        return await asyncio.gather(*(self.fetch(url) for url in urls),
+                                    return_exceptions=True)
+
+    async def _get(self, url: str, headers: Dict[str, str]) -> Response:
+        """
+        Issues GET requests until a non-redirect response comes back
+        """
+        for _ in range(Config.max_redirects + 1):
+            response = await self._request(url, headers)
+            if response.status in REDIRECTS and 'location' in response.headers:
+                url = urljoin(url, response.headers['location'])
+                continue
+            return response
+        raise FetchError(f'Too many redirects: {url}')
+
+    async def _request(self, url: str, headers: Dict[str, str]) -> Response:
+        """
+        Performs a single HTTP/1.1 GET request over a pooled connection.  A reused
+        connection may have been closed by the server while it sat idle, in which
+        case the request is retried once on a fresh one.
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise FetchError(f'Unsupported url: {url}')
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        for attempt in range(2):
+            connection = await self.pool.acquire(parts.scheme, parts.hostname, port)
+            reusable = False
+            try:
+                connection.writer.write(request_bytes(parts, headers, keep_alive=bool(self.pool.size)))
+                await connection.writer.drain()
+                try:
+                    version, status, response_headers = await read_head(connection.reader)
+                except (OSError, FetchError, asyncio.IncompleteReadError):
+                    if connection.requests and not attempt:
+                        continue
+                    raise
+                body = await read_body(connection.reader, status, response_headers)
+                reusable = keep_alive(version, status, response_headers)
+            finally:
+                connection.requests += 1
+                self.pool.release(connection, reusable)
+            return Response(url, status, response_headers, decode(body, response_headers))
+
+
+def interleave(urls: Iterable[str]) -> List[str]:
+    """
+    Reorders urls round-robin by host, keeping their relative order within each
+    host.  Requests are started in this order, so every host gets its first
+    requests out early instead of one host's backlog filling the queue.
+    :param urls: urls to reorder
+    :return: list of urls
+    """
+    hosts = OrderedDict()
+    for url in urls:
+        hosts.setdefault(urlsplit(feed_url(url)).hostname, []).append(url)
+    return [url for url in chain.from_iterable(zip_longest(*hosts.values())) if url is not None]
+
+
+def request_bytes(parts, headers: Dict[str, str], keep_alive: bool = True) -> bytes:
+    """
+    Builds the raw request for a split url
+    :param parts: urllib.parse.SplitResult
+    :param headers: additional request headers
+    :param keep_alive: ask the server to keep the connection open afterwards
+    :return: bytes to write to the socket
+    """
+    target = (parts.path or '/') + (f'?{parts.query}' if parts.query else '')
+    lines = [f'GET {target} HTTP/1.1',
+             f'Host: {parts.netloc}',
+             f'User-Agent: {Config.user_agent}',
+             'Accept-Encoding: gzip, deflate',
+             f'Connection: {"keep-alive" if keep_alive else "close"}']
+    lines.extend(f'{name}: {value}' for name, value in headers.items())
+    return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+
+async def read_head(reader: asyncio.StreamReader):
+    """
+    Reads the status line and headers of a response
+    :return: tuple of HTTP version, status code and dict of lower-cased headers
+    """
+    line = await reader.readline()
+    try:
+        version, status, *_ = line.decode('latin-1').split(None, 2)
+        status = int(status)
+    except ValueError:
+        raise FetchError(f'Malformed status line: {line!r}')
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b'\n', b''):
+            return version, status, headers
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+
+async def read_body(reader: asyncio.StreamReader, status: int, headers: Dict[str, str]) -> bytes:
+    """
+    Reads a response body framed by chunked encoding, Content-Length or the
+    connection closing, in that order of preference
+    """
+    if status in (204, 304) or status < 200:
+        return b''
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        chunks = []
+        while True:
+            size = int(((await reader.readline()).split(b';')[0].strip() or b'0'), 16)
+            if not size:
+                # Skip any trailers
+                while await reader.readline() not in (b'\r\n', b'\n', b''):
+                    pass
+                return b''.join(chunks)
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+    if 'content-length' in headers:
+        return await reader.readexactly(int(headers['content-length']))
+    return await reader.read()
+
+
+def keep_alive(version: str, status: int, headers: Dict[str, str]) -> bool:
+    """
+    Whether a connection can carry another request after this response: the
+    server didn't ask to close it and the body had a known length, so none of
+    it is left unread
+    """
+    connection = headers.get('connection', '').lower()
+    if connection == 'close' or (version == 'HTTP/1.0' and connection != 'keep-alive'):
+        return False
+    return (status in (204, 304) or status < 200
+            or 'content-length' in headers
+            or 'chunked' in headers.get('transfer-encoding', '').lower())
+
+
+def decode(body: bytes, headers: Dict[str, str]) -> bytes:
+    """
+    Undoes gzip or deflate content encoding
+    """
+    encoding = headers.get('content-encoding', '').lower()
+    try:
+        if encoding in ('gzip', 'x-gzip'):
+            return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+        if encoding == 'deflate':
+            try:
+                return zlib.decompress(body)
+            except zlib.error:
+                # Some servers send raw deflate streams without the zlib header
+                return zlib.decompress(body, -zlib.MAX_WBITS)
+    except zlib.error as exc:
+        raise FetchError(f'Undecodable {encoding} body: {exc}')
+    return body
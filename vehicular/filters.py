@@ -0,0 +1,281 @@
+"""
+Contains the local filter stage: criteria of a search that aren't sent to
+craigslist are evaluated against Listings instead, by a Matcher that
+handles every search sharing a feed at once, and plan_feed, which decides
+which criteria those are
+"""
+from collections import Counter
+from functools import lru_cache
+from itertools import chain
+import re
+from typing import Dict, Iterable, List, Sequence, Set, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from vehicular.config import Config
+from vehicular.listing import Listing
+from vehicular.utilities import canonical_url
+
+# Parameters craigslist doesn't know about, which are only ever evaluated locally
+LOCAL_PARAMS = 'exclude',
+# Parameters that can also be evaluated locally, from a listing's title and summary.
+# The broad feed planner leaves them out of the downloaded feed.
+BROAD_PARAMS = 'auto_make_model', 'min_price', 'max_price', 'min_auto_year', 'max_auto_year'
+
+YEAR = re.compile(r'\b((?:19|20)\d\d)\b')
+
+
+def plan_feed(url: str, broad: bool = None) -> str:
+    """
+    Returns the feed to download for a search.  Local parameters are always
+    dropped.  With the broad feed planner, the parameters Criteria can
+    evaluate are dropped too, so searches that only differ in make, model,
+    price or year share a single download of the city and category's feed.
+    Broad feeds only hold the latest posts of every search they serve, so
+    busy cities can push a quiet search's matches out before they're seen.
+
+    :param url: feed url of one of a search's cities, see Database.get_cities
+    :param broad: use the broad feed planner, by default Config.broad_feeds
+    :return: canonical feed url
+    """
+    broad = Config.broad_feeds if broad is None else broad
+    dropped = LOCAL_PARAMS + BROAD_PARAMS if broad else LOCAL_PARAMS
+    parts = urlsplit(canonical_url(url))
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key not in dropped]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ''))
+
+
+def parse_year(listing: Listing) -> int or None:
+    """
+    Returns the model year from a listing's title, or its summary failing that
+    """
+    for text in listing.title, listing.summary:
+        match = YEAR.search(text or '')
+        if match:
+            return int(match.group(1))
+
+
+class Criteria:
+    """
+    Criteria of a search that its downloaded feed doesn't apply: make / model
+    words a listing must contain, words that rule it out, and price and year
+    limits.  Evaluated by a Matcher, alone or along with other searches'.
+    Price and year limits pass listings they can't be read from, since
+    rejecting those would hide posts craigslist itself would have matched.
+    """
+
+    def __init__(self, params: Dict[str, str]):
+        """
+        :param params: search url parameters to evaluate locally
+        """
+        self.params = params
+        self.min_price = _int(params.get('min_price'))
+        self.max_price = _int(params.get('max_price'))
+        self.min_year = _int(params.get('min_auto_year'))
+        self.max_year = _int(params.get('max_auto_year'))
+        self.keywords = frozenset(params.get('auto_make_model', '').lower().split())
+        self.exclude = frozenset(params.get('exclude', '').lower().split())
+        self._matcher = None
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.params})>'
+
+    def __bool__(self) -> bool:
+        return bool(self.params)
+
+    def within_limits(self, listing: Listing) -> bool:
+        """
+        Returns True if a listing's price and year are within the limits, or
+        can't be read
+        """
+        if self.min_price is not None or self.max_price is not None:
+            price = listing.price
+            if price is not None and not _between(price, self.min_price, self.max_price):
+                return False
+        if self.min_year is not None or self.max_year is not None:
+            year = parse_year(listing)
+            if year is not None and not _between(year, self.min_year, self.max_year):
+                return False
+        return True
+
+    def matches(self, listing: Listing) -> bool:
+        """
+        Returns True if a listing record meets every criterion
+        """
+        return not self or bool(self.matcher.match(listing))
+
+    def filter(self, listings: List[Listing]) -> List[Listing]:
+        """
+        Returns the listings that meet every criterion
+        """
+        if not self:
+            return listings
+        return self.matcher.select(listings)[0]
+
+    @property
+    def matcher(self) -> 'Matcher':
+        """
+        Matcher for this search alone, compiled on first use
+        """
+        if self._matcher is None:
+            self._matcher = Matcher([self])
+        return self._matcher
+
+
+class Matcher:
+    """
+    Evaluates the Criteria of many searches against each listing in a single
+    pass over its text, rather than one pass per search.  Every search's make
+    / model and exclude words are compiled into one trie-shaped pattern, which
+    is searched for from each position after the last match, so overlapping
+    words are found too.  The longest word at a position is matched, and the
+    words that are prefixes of it are present as well.  Each search is
+    indexed under its least common make / model word, so a listing only
+    costs work for the searches whose rarest word it contains, rather than
+    every search for the same make.  The cost per listing still grows with
+    the number of searches, since a bigger vocabulary finds more words in
+    each listing and points at more candidate searches.
+
+    Make / model words match anywhere, so `drz 400` matches `DRZ400S` the way
+    craigslist's make / model search does.  Exclude words match the start of
+    a word, so `salvage` also excludes `salvaged`.
+    """
+
+    def __init__(self, searches: Sequence[Criteria]):
+        """
+        :param searches: Criteria of each search, in the order matches are reported in
+        """
+        self.searches = list(searches)
+        frequency = Counter(word for search in self.searches for word in search.keywords)
+        self._anchors = {}
+        # Searches without make / model words, which every listing is a candidate for
+        self._open = []
+        for index, search in enumerate(self.searches):
+            if search.keywords:
+                anchor = min(search.keywords, key=lambda word: (frequency[word], word))
+                self._anchors.setdefault(anchor, []).append(index)
+            else:
+                self._open.append(index)
+        words = set(frequency).union(*(search.exclude for search in self.searches))
+        self._prefixes = {word: [word[:end] for end in range(1, len(word) + 1)
+                                 if word[:end] in words]
+                          for word in words}
+        self._pattern = re.compile(_trie(words)) if words else None
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({len(self.searches)} searches)>'
+
+    def words(self, listing: Listing) -> Tuple[Set[str], Set[str]]:
+        """
+        Finds every word of every search in a listing's title and summary
+        :return: words found anywhere, and words found at the start of a word
+        """
+        found, starts = set(), set()
+        if self._pattern is None:
+            return found, starts
+        text = f'{listing.title}\n{listing.summary}'.lower()
+        match = self._pattern.search(text)
+        while match is not None:
+            words = self._prefixes[match.group()]
+            found.update(words)
+            position = match.start()
+            if not position or not (text[position - 1].isalnum() or text[position - 1] == '_'):
+                starts.update(words)
+            match = self._pattern.search(text, position + 1)
+        return found, starts
+
+    def match(self, listing: Listing) -> List[int]:
+        """
+        Returns the indexes of the searches a listing meets every criterion of
+        """
+        found, starts = self.words(listing)
+        candidates = chain(self._open,
+                           *(self._anchors[word] for word in found if word in self._anchors))
+        return sorted(index for index in candidates
+                      if self.searches[index].keywords <= found
+                      and not self.searches[index].exclude & starts
+                      and self.searches[index].within_limits(listing))
+
+    def select(self, listings: Iterable[Listing]) -> List[List[Listing]]:
+        """
+        Matches every listing
+        :return: for each search, the listings it matches, in their original order
+        """
+        selected = [[] for _ in self.searches]
+        for listing in listings:
+            for index in self.match(listing):
+                selected[index].append(listing)
+        return selected
+
+
+@lru_cache(maxsize=1024)
+def criteria(url: str, feed: str = None) -> Criteria:
+    """
+    Returns the Criteria of a search that its feed leaves out.  Cached, so
+    each search's keywords are only compiled once per process.
+    :param url: feed url of the search in the feed's city, see Database.get_cities
+    :param feed: feed that was downloaded for it, see plan_feed.  By default
+        the search's own, less its local parameters.
+    :return: Criteria
+    """
+    params = dict(parse_qsl(urlsplit(url).query))
+    feed = feed or plan_feed(url, broad=False)
+    applied = dict(parse_qsl(urlsplit(feed).query))
+    return Criteria({key: value for key, value in params.items() if applied.get(key) != value})
+
+
+@lru_cache(maxsize=256)
+def matcher(urls: Tuple[str, ...], feed: str = None) -> Matcher:
+    """
+    Returns a Matcher for the searches that share a feed, see criteria.
+    Cached, so the combined pattern is only compiled once per set of searches.
+    :param urls: url of each search in the feed's city
+    :param feed: feed that was downloaded for them
+    :return: Matcher, which reports matches in the order of `urls`
+    """
+    return Matcher([criteria(url, feed) for url in urls])
+
+
+def _int(value: str or None) -> int or None:
+    """
+    Returns a parameter as an int, None if it's missing or malformed
+    """
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _between(value: int, low: int or None, high: int or None) -> bool:
+    """
+    Returns True if value is within the limits that are set
+    """
+    return (low is None or value >= low) and (high is None or value <= high)
+
+
+def _trie(words: Iterable[str]) -> str:
+    """
+    Builds a pattern matching any of `words`, shaped like a trie so that each
+    position is tried against every word in one walk.  Optional tails are
+    greedy, so the longest word at a position is the one matched.
+    """
+    root = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+    return _node(root)
+
+
+def _node(node: dict) -> str:
+    """
+    Renders a trie node, see _trie
+    """
+    branches = [re.escape(char) + _node(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    if '' in node:
+        return f'(?:{"|".join(branches)})?'
+    if len(branches) == 1:
+        return branches[0]
+    return f'(?:{"|".join(branches)})'
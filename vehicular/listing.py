@@ -0,0 +1,99 @@
+"""
+Contains Listing, the record a new post travels as from the parser to the
+outbox and the email templates
+"""
+import re
+from typing import Dict
+
+PRICE = re.compile(r'\$\s?(\d[\d,]*)')
+POST_ID = re.compile(r'(\d+)\.html')
+# Fields of a listing the templates use
+FIELDS = 'id', 'title', 'link', 'summary'
+
+
+class Listing:
+    """
+    A new post.  Holds only the fields the templates read, plus the asking
+    price and craigslist's numeric post ID, in slots rather than a dict, so
+    a big run's listings take a fraction of the memory feedparser's entries
+    would.  Picklable, for ParsePool, and converts to and from JSON-friendly
+    dicts for the outbox.
+    """
+    __slots__ = FIELDS + ('enc_enclosure', 'price', 'post_id')
+
+    def __init__(self, id: str,
+                 title: str = '',
+                 link: str = '',
+                 summary: str = '',
+                 enc_enclosure: Dict[str, str] = None,
+                 price: int = None,
+                 post_id: int = None):
+        """
+        :param id: post url, which identifies it in the hits table
+        :param enc_enclosure: image, as `resource` url and `type`
+        :param price: asking price, None if the post doesn't give one
+        :param post_id: numeric post ID, None if the url doesn't end in one
+        """
+        self.id = id
+        self.title = title
+        self.link = link
+        self.summary = summary
+        self.enc_enclosure = enc_enclosure
+        self.price = price
+        self.post_id = post_id
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.id!r})>'
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Listing):
+            return NotImplemented
+        return self.to_dict() == other.to_dict()
+
+    @classmethod
+    def from_entry(cls, entry: dict) -> 'Listing':
+        """
+        Builds a listing from a parsed feed entry, a dict or FeedParserDict
+        """
+        # For some reason, CL hard-codes `$` as &#x0024
+        title = (entry.get('title') or '').replace('&#x0024;', '$')
+        summary = entry.get('summary') or ''
+        enclosure = entry.get('enc_enclosure')
+        if enclosure is not None:
+            enclosure = {'resource': enclosure.get('resource', ''),
+                         'type': enclosure.get('type', '')}
+        return cls(entry['id'], title, entry.get('link') or '', summary, enclosure,
+                   parse_price(title, summary), parse_post_id(entry['id']))
+
+    @classmethod
+    def from_dict(cls, record: dict) -> 'Listing':
+        """
+        Rebuilds a listing from to_dict's output.  Records queued by older
+        versions, without price or post ID, are accepted too.
+        """
+        return cls(**{key: record[key] for key in cls.__slots__ if key in record})
+
+    def to_dict(self) -> dict:
+        """
+        Returns the listing as a dict, for JSON
+        """
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+def parse_price(title: str, summary: str = '') -> int or None:
+    """
+    Returns the asking price from a post's title, or its summary failing that
+    """
+    for text in title, summary:
+        match = PRICE.search(text or '')
+        if match:
+            return int(match.group(1).replace(',', ''))
+
+
+def parse_post_id(url: str) -> int or None:
+    """
+    Returns craigslist's numeric post ID from a post url
+    """
+    match = POST_ID.search(url)
+    if match:
+        return int(match.group(1))
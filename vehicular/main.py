@@ -1,17 +1,29 @@
 """
 Contains integration of cmd, database and message classes.
 """
+from contextlib import redirect_stdout
 import getpass
+import io
 import sqlite3
+from typing import Dict, List
 
 from vehicular.config import Config
-from vehicular.database import Database, run_search
+from vehicular.database import Database, iter_search
 from vehicular.dicts import (BOOL_OPTIONS,
                              CAR_SELLER,
                              MOTO_SELLER)
-from vehicular.message import Message
+from vehicular.message import SMTPPool
+from vehicular.sender import Sender
 from vehicular.shell import CarShell, help_message
-from vehicular.utilities import credential_validation as cv
+from vehicular.utilities import (canonical_url,
+                                 credential_validation as cv,
+                                 read_searches)
+
+# Attributes of Run that aren't search options
+NON_OPTIONS = 'stdin', 'stdout', 'name', 'mode', 'encoding', 'cmdqueue', \
+              'completekey', 'city', 'cities', 'vehicle_type', 'seller_type', \
+              'seller_abbrev', 'database', 'lastcmd', 'completion_matches', \
+              'db_file', 'smtp', 'sender'
 
 
 class Run(CarShell):
@@ -26,6 +38,12 @@ class Run(CarShell):
         self.db_file = database
         self.database = Database(self.db_file)
         self.database.create_database()
+        self.smtp = SMTPPool()
+        self.sender = Sender(self.db_file, self.smtp)
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.sender.join()
+        self.smtp.close()
 
     def create_seller_abbrev(self) -> None:
         """
@@ -40,20 +58,17 @@ class Run(CarShell):
                 self.seller_abbrev = CAR_SELLER[self.seller_type]
 
     @property
-    def search_url(self) -> str or None:
+    def search_urls(self) -> List[str] or None:
         """
-        Creates search url
-        :return: search URL string or None
+        Creates the canonical search url of each city
+        :return: sorted list of search URL strings or None
         """
         self.create_seller_abbrev()
-        non_options = 'stdin', 'stdout', 'name', 'mode', 'encoding', 'cmdqueue', \
-                      'completekey', 'city', 'vehicle_type', 'seller_type', \
-                      'seller_abbrev', 'database', 'lastcmd', 'completion_matches'
         options = {key: value for key, value in self.__dict__.items() if key not
-                   in non_options and value}
+                   in NON_OPTIONS and value}
         sel_options = []
-        if self.city and self.seller_abbrev and self.make_model:
-            base_url = f'{self.CITY_DICT[self.city]}{self.seller_abbrev}?format=rss&'
+        cities = self.cities or [self.city]
+        if all(cities) and self.seller_abbrev and self.make_model:
             for key, value in options.items():
                 if key in BOOL_OPTIONS:
                     # In order for toggle functionality to work, its value has to
@@ -62,12 +77,60 @@ class Run(CarShell):
                 else:
                     # All other options are in the completed form
                     sel_options.append(value)
-                return base_url + '&'.join(sel_options)
+            # Canonical, so the same search can't be stored twice under urls that
+            # only differ in the order options were set.  Searches spanning several
+            # cities are stored as one, with a feed per city.
+            return sorted({canonical_url(f'{self.CITY_DICT[city]}{self.seller_abbrev}?format=rss&'
+                                         + '&'.join(sel_options))
+                           for city in cities})
         else:
-            msg = 'At a minimum, you must set the city, seller type,' \
+            msg = 'At a minimum, you must set the city (or cities), seller type,' \
                   ' vehicle type and a make_model.'
             print(msg)
 
+    @property
+    def search_name(self) -> str or None:
+        """
+        Human readable name of the search, taken from the make_model
+        """
+        if self.make_model:
+            return self.make_model.split('=')[1].replace('+', ' ')
+
+    def configure(self, options: Dict[str, str or bool]) -> List[str]:
+        """
+        Sets search options the same way typing their commands into the shell
+        would, so they're validated the same way.  Used by the batch commands.
+        ex: `{'city': 'denver', 'make_model': 'drz 400', 'has_images': True}`
+        Start from a fresh Run, or call reset_search_options first.
+
+        :param options: shell command name to its argument.  Toggles, such as
+            has_images, are switched on by True.
+        :return: search url of each city, see search_urls
+        :raises ValueError: if an option is unknown or rejected, or required ones are missing
+        """
+        if options.get('seller_type'):
+            # Otherwise setting the default would look like a rejected value
+            self.seller_type = None
+        for option, value in options.items():
+            if option == 'EOF' or not hasattr(CarShell, f'do_{option}'):
+                raise ValueError(f'Unknown search option: `{option}`.')
+            if value is None or value is False:
+                continue
+            before = dict(self.__dict__)
+            output = io.StringIO()
+            with redirect_stdout(output):
+                if isinstance(value, (list, tuple)):
+                    value = ' '.join(map(str, value))
+                getattr(self, f'do_{option}')('' if value is True else str(value))
+            if self.__dict__ == before:
+                raise ValueError(output.getvalue().strip().splitlines()[0])
+        output = io.StringIO()
+        with redirect_stdout(output):
+            urls = self.search_urls
+        if not urls:
+            raise ValueError(output.getvalue().strip())
+        return urls
+
     def do_credentials(self, *args) -> None:
         """
         Allows user to store credentials in the database.  Uses
@@ -111,19 +174,20 @@ class Run(CarShell):
         Adds search URL to database
         :return:
         """
-        url = self.search_url
-        if url:
+        urls = self.search_urls
+        if urls:
             try:
-                name = self.make_model.split('=')[1].replace('+', ' ')
+                name = self.search_name
                 print(f'Added {name} search.')
-                self.database.add_search(url, name=name)
+                self.database.add_search(urls, name=name)
                 self.reset_search_options()
             except sqlite3.IntegrityError:
                 print('Each search must be unique!')
 
     def do_run_search(self, *args) -> None:
         """
-        Run search and send email notification
+        Run search and queue new hits for the email notification, which is
+        sent in the background
         :param args:
         :return: None
         """
@@ -133,12 +197,78 @@ class Run(CarShell):
             print('Ensure that credentials have been set successfully first.')
             return
         if user and password and recipient:
-            hits = run_search(self.db_file)
+            hits = 0
+            # Each feed's hits are sent while the slower feeds are still downloading
+            for batch in iter_search(self.db_file):
+                hits += len(batch)
+                self.sender.start()
             if hits:
                 print('New hits found!')
-                Message(user, password, recipient, hits).send()
             else:
                 print('No new search hits.')
+            # Also retries anything a previous send failed on
+            self.sender.start()
+
+    def do_import_searches(self, path: str) -> None:
+        """
+        Adds every search in a CSV, JSON or TOML file, see utilities.read_searches.
+        Each search is validated the same way as the batch `add` command, and
+        if any are invalid nothing is imported.  Duplicates are reported and
+        skipped.  Options set in the shell are left as they were.
+        :param path: file to import
+        :return: None
+        """
+        path = path.strip()
+        if not path:
+            print('Usage: import_searches <file>')
+            return
+        try:
+            rows = read_searches(path)
+        except (OSError, ValueError) as exc:
+            print(f'Unable to import {path}: {exc}')
+            return
+        state = dict(self.__dict__)
+        known = {frozenset(urls) for _, _, urls in self.database.get_searches()}
+        searches, invalid, duplicates = {}, [], []
+        for number, row in enumerate(rows, 1):
+            name = row.pop('name', None)
+            # Every search starts from scratch, city and vehicle type included
+            self.reset_search_options()
+            self.city = self.cities = self.vehicle_type = self.seller_abbrev = None
+            try:
+                urls = frozenset(self.configure(row))
+            except ValueError as exc:
+                invalid.append(f'Search {number}: {exc}')
+                continue
+            name = str(name) if name else self.search_name
+            if urls in known or urls in searches:
+                duplicates.append(name)
+            else:
+                searches[urls] = name
+        self.__dict__.update(state)
+        for message in invalid:
+            print(message)
+        if invalid:
+            print('Nothing imported.  Fix the searches above and try again.')
+            return
+        if duplicates:
+            print(f'Skipped {len(duplicates)} duplicate searches: {", ".join(duplicates)}')
+        added = self.database.add_searches(searches.items())
+        print(f'Imported {added} searches.')
+
+    @staticmethod
+    def help_import_searches() -> None:
+        """
+        Displays help message for import_searches command
+        """
+        initial_desc = 'Used to add many searches at once from a CSV, JSON or TOML file'
+        usage = 'type `import_searches <file>`',
+        long_desc = 'Each search sets options by their command names, ex: city, ' \
+                    'vehicle_type, make_model and has_images, plus an optional name.', \
+                    'CSV files take a header row of option names; JSON files a list ' \
+                    'of objects; TOML files an array of [[searches]] tables.', \
+                    'Nothing is imported unless every search is valid.'
+        help_message(initial_desc, usage, long_desc)
 
     @staticmethod
     def help_run_search() -> None:
@@ -164,15 +294,15 @@ class Run(CarShell):
         Draws deletion menu
         """
         # Creates a dictionary with a number corresponding to each search
-        url_name = {num: item for num, item in enumerate(self.database.get_url_name())}
-        if url_name:
-            for key, value in url_name.items():
-                # value[0] is the url, value[1] is the name
+        searches = {num: item for num, item in enumerate(self.database.get_searches())}
+        if searches:
+            for key, value in searches.items():
+                # value[0] is the search id, value[1] is the name
                 print(f'{key}: {value[1]}')
             choice = input('Search to delete: ')
             try:
                 choice = int(choice)
-                self.database.remove_search(url_name[choice][0])
+                self.database.remove_search(searches[choice][0])
             except ValueError:
                 print('Invalid choice')
             except KeyError:
@@ -198,12 +328,8 @@ class Run(CarShell):
         Sets search values to None
         :return: None
         """
-        non_options = 'stdin', 'stdout', 'name', 'mode', 'encoding', 'cmdqueue', \
-                      'completekey', 'city', 'vehicle_type', 'seller_type', \
-                      'seller_abbrev', 'database', 'lastcmd', 'completion_matches', \
-                      'db_file'
         for key in self.__dict__:
-            if key not in non_options:
+            if key not in NON_OPTIONS:
                 self.__dict__[key] = None
         # `both` is the default option for seller_type
         self.__dict__['seller_type'] = 'both'
@@ -212,7 +338,7 @@ class Run(CarShell):
         """
         Prints out names of all searches in the database
         """
-        searches = self.database.get_url_name()
+        searches = self.database.get_searches()
         if searches:
             print('Current searches')
             print('*' * 40)
@@ -1,16 +1,23 @@
 """
-Contains Message class
+Contains Message class, and the SMTP sessions messages are sent over
 """
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-import smtplib
-from typing import List
+# jinja2, smtplib and the email package are only imported once something is
+# rendered or sent, they're a good part of startup time otherwise
+from __future__ import annotations
 
-from feedparser import FeedParserDict
-from jinja2 import Environment, PackageLoader, select_autoescape
+from functools import lru_cache
+import threading
+from typing import TYPE_CHECKING, Dict, List, Tuple
 
 from vehicular.config import Config
 
+if TYPE_CHECKING:
+    import smtplib
+
+    from jinja2 import Environment
+
+    from vehicular.listing import Listing
+
 
 class Message:
     """
@@ -19,12 +26,12 @@ class Message:
     def __init__(self, username: str,
                  password: str,
                  recipient: str,
-                 hits: List[FeedParserDict]):
+                 hits: List[Listing]):
         """
 
         :param username:
         :param password:
-        :param hits: list of FeedParserDicts, which are new search hits.
+        :param hits: list of Listings, which are new search hits.
         """
         self.username = username
         self.password = password
@@ -33,11 +40,25 @@ class Message:
         self.html = None
         self.text = None
 
-    def send(self) -> None:
+    def send(self, session: 'SMTPSession' = None) -> None:
         """
         Composes and sends email using the credentials supplied in __init__
+        :param session: SMTPSession to send over.  By default a connection is
+            opened for this message alone.
         :return: None
         """
+        if session is None:
+            with SMTPSession(self.username, self.password) as session:
+                return self.send(session)
+        session.send(self.username, self.recipient, self.compose())
+
+    def compose(self) -> str:
+        """
+        Renders both bodies and builds the email
+        :return: email, ready to be sent
+        """
+        from email.mime.multipart import MIMEMultipart
+        from email.mime.text import MIMEText
         self.render_html()
         self.render_text()
         msg = MIMEMultipart('alternative')
@@ -49,33 +70,170 @@ class Message:
 
         html = MIMEText(self.html, 'html')
         msg.attach(html)
-
-        server = smtplib.SMTP(host=Config.hostname, port=Config.port)
-        server.starttls()
-        server.login(user=self.username, password=self.password)
-        server.sendmail(self.username, self.recipient, msg.as_string())
-        server.quit()
+        return msg.as_string()
 
     def render_html(self) -> None:
         """
         Renders HTML email body
         :return: None
         """
-        env = Environment(
-            loader=PackageLoader('vehicular', 'templates'),
-            autoescape=select_autoescape(['html', 'xml'])
-        )
-        template = env.get_template('base.html')
-        self.html = template.render(listings=self.hits)
+        self.html = environment().get_template('base.html').render(listings=self.hits)
 
     def render_text(self) -> None:
         """
         Renders text email body
         :return: None
         """
-        env = Environment(
-            loader=PackageLoader('vehicular', 'templates'),
-            autoescape=select_autoescape(['.txt'])
-        )
-        template = env.get_template('base.txt')
-        self.text = template.render(listings=self.hits)
+        self.text = environment().get_template('base.txt').render(listings=self.hits)
+
+
+class SMTPSession:
+    """
+    An authenticated SMTP connection that any number of messages can be sent
+    over, so a batch of emails costs one TLS handshake and one login rather
+    than one each.  The connection is opened on first use and reopened
+    transparently if the server has dropped it, e.g. after sitting idle.
+    Sends are serialized, so a session can be shared between threads.
+    """
+
+    def __init__(self, username: str, password: str):
+        """
+        :param username: sender's address, used to log in
+        :param password: sender's password
+        """
+        self.username = username
+        self.password = password
+        self.connections = 0
+        self._server = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.username})>'
+
+    def open(self) -> None:
+        """
+        Connects and logs in, unless the session already has a connection
+        """
+        with self._lock:
+            if self._server is None:
+                self._server = self.connect()
+
+    def connect(self) -> smtplib.SMTP:
+        """
+        Opens a new connection to Config.hostname and logs in.  STARTTLS is used
+        when Config.starttls is set.
+        :return: logged in SMTP connection
+        """
+        import smtplib
+        server = smtplib.SMTP(host=Config.hostname, port=Config.port, timeout=Config.timeout)
+        try:
+            if Config.starttls:
+                server.starttls()
+            server.login(user=self.username, password=self.password)
+        except (smtplib.SMTPException, OSError):
+            server.close()
+            raise
+        self.connections += 1
+        return server
+
+    def send(self, sender: str, recipient: str, message: str) -> None:
+        """
+        Sends a message, reconnecting once if the connection turns out to have
+        been dropped
+        :param sender: envelope sender address
+        :param recipient: recipient address
+        :param message: email, as returned by Message.compose
+        :return: None
+        """
+        import smtplib
+        with self._lock:
+            reused = self._server is not None
+            if not reused:
+                self._server = self.connect()
+            try:
+                self._server.sendmail(sender, recipient, message)
+            except smtplib.SMTPServerDisconnected:
+                self._server = None
+                if not reused:
+                    raise
+                self._server = self.connect()
+                self._server.sendmail(sender, recipient, message)
+
+    def close(self) -> None:
+        """
+        Logs out and closes the connection, if there is one
+        """
+        import smtplib
+        with self._lock:
+            if self._server is not None:
+                try:
+                    self._server.quit()
+                except (smtplib.SMTPException, OSError):
+                    self._server.close()
+                self._server = None
+
+
+class SMTPPool:
+    """
+    Keeps one SMTPSession per set of credentials, for long-lived callers such
+    as the shell and the daemon
+    """
+
+    def __init__(self):
+        self._sessions = {}  # type: Dict[Tuple[str, str], SMTPSession]
+        self._lock = threading.Lock()
+
+    def session(self, username: str, password: str) -> SMTPSession:
+        """
+        Returns the session for the given credentials, creating it if need be
+        """
+        with self._lock:
+            key = username, password
+            if key not in self._sessions:
+                self._sessions[key] = SMTPSession(username, password)
+            return self._sessions[key]
+
+    def close(self) -> None:
+        """
+        Closes every session
+        """
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+
+@lru_cache(maxsize=None)
+def environment() -> Environment:
+    """
+    Returns the jinja2 Environment shared by every Message, created on first
+    use.  The environment keeps templates once they're compiled, and their
+    bytecode is cached on disk so other processes, e.g. cron runs, load them
+    without compiling them again.  Templates don't change once installed, so
+    they aren't checked for changes.
+    """
+    from jinja2 import Environment, FileSystemBytecodeCache, PackageLoader, select_autoescape
+    return Environment(
+        loader=PackageLoader('vehicular', 'templates'),
+        autoescape=select_autoescape(['html', 'xml', 'txt']),
+        bytecode_cache=FileSystemBytecodeCache(Config.template_cache),
+        auto_reload=False
+    )
+
+
+def precompile() -> List[str]:
+    """
+    Compiles every template ahead of the first send, filling the bytecode cache
+    :return: names of the compiled templates
+    """
+    env = environment()
+    names = env.list_templates()
+    for name in names:
+        env.get_template(name)
+    return names
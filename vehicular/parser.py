@@ -0,0 +1,195 @@
+"""
+Contains the feed parsers: a streaming fast path for craigslist's RSS 1.0
+(RDF) feeds, with feedparser as the fallback for anything else, and
+ParsePool, which runs them in worker processes
+"""
+import asyncio
+from io import BytesIO
+from typing import Callable, Container, Dict, List
+from xml.etree import ElementTree
+
+from vehicular.config import Config
+from vehicular.listing import Listing
+
+RDF = '{http://www.w3.org/1999/02/22-rdf-syntax-ns#}'
+RSS = '{http://purl.org/rss/1.0/}'
+ENC = '{http://purl.oclc.org/net/rss_2.0/enc#}'
+
+
+class ParsePool:
+    """
+    Parse stage of a search run.  Feedparser is pure Python, so parsing feeds
+    on the event loop's thread would serialize every run on the GIL; instead
+    bodies are handed to worker processes, which send back Listings.
+    Processes are started on first use, with Config.parse_start_method, and
+    don't inherit anything from the parent, so the parser settings are sent
+    along with every body.
+    """
+
+    def __init__(self, processes: int = Config.parse_processes,
+                 fast_parser: bool = None,
+                 known_run: int = None):
+        """
+        :param processes: number of worker processes.  0 parses on the calling
+            thread instead, which is cheaper for a handful of feeds.
+        :param fast_parser: use parse_feed for craigslist feeds, by default Config.fast_parser
+        :param known_run: see parse_feed, by default Config.known_run
+        """
+        self.processes = processes
+        self.fast_parser = Config.fast_parser if fast_parser is None else fast_parser
+        self.known_run = Config.known_run if known_run is None else known_run
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.processes})>'
+
+    async def parse(self, body: bytes,
+                    headers: Dict[str, str] = None,
+                    known: Container[str] = frozenset()) -> List[Listing]:
+        """
+        Runs parse_listings in a worker process
+        :param known: picklable container, such as a set or SeenSet
+        :return: list of Listings
+        """
+        if not self.processes:
+            return parse_listings(body, headers, known, self.fast_parser, self.known_run)
+        if self._executor is None:
+            from concurrent.futures import ProcessPoolExecutor
+            import multiprocessing
+            method = Config.parse_start_method
+            if method not in multiprocessing.get_all_start_methods():
+                method = 'spawn'
+            context = multiprocessing.get_context(method)
+            if method == 'forkserver':
+                # Workers are forked with the parsers already imported
+                context.set_forkserver_preload(['vehicular.parser', 'feedparser'])
+            self._executor = ProcessPoolExecutor(self.processes, mp_context=context)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._executor, parse_listings, body, dict(headers or {}), known,
+            self.fast_parser, self.known_run)
+
+    def close(self) -> None:
+        """
+        Shuts the worker processes down
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def parse_listings(body: bytes,
+                   headers: Dict[str, str] = None,
+                   known: Container[str] = frozenset(),
+                   fast_parser: bool = None,
+                   known_run: int = None) -> List[Listing]:
+    """
+    Parses a downloaded feed into Listings, which hold only the fields the
+    templates use and are cheap to send between processes.
+
+    :param body: feed body
+    :param headers: response headers
+    :param known: post IDs that have already been seen, see parse_entries
+    :param fast_parser: see parse_entries
+    :param known_run: see parse_entries
+    :return: list of Listings, newest first
+    """
+    return [Listing.from_entry(entry)
+            for entry in parse_entries(body, headers, known.__contains__, fast_parser, known_run)]
+
+
+def parse_entries(body: bytes,
+                  headers: Dict[str, str] = None,
+                  known: Callable[[str], bool] = None,
+                  fast_parser: bool = None,
+                  known_run: int = None) -> List[dict]:
+    """
+    Parses a downloaded feed into a list of entries, newest first.  Craigslist
+    feeds go through parse_feed when the fast parser is on; feeds it doesn't
+    recognize are handed to feedparser.
+
+    :param body: feed body
+    :param headers: response headers, used by feedparser to work out the encoding
+    :param known: returns True for post IDs that have already been seen.  The
+        fast path stops after `known_run` of them in a row, since craigslist
+        lists newest posts first.
+    :param fast_parser: use the fast path, by default Config.fast_parser
+    :param known_run: see parse_feed
+    :return: list of entries, dicts or FeedParserDicts, keyed like feedparser's
+    """
+    fast_parser = Config.fast_parser if fast_parser is None else fast_parser
+    if fast_parser:
+        entries = parse_feed(body, known, known_run)
+        if entries is not None:
+            return entries
+    # Only needed for feeds the fast path doesn't handle
+    import feedparser as fp
+    return fp.parse(body, response_headers=headers or {}).entries
+
+
+def parse_feed(body: bytes, known: Callable[[str], bool] = None,
+               known_run: int = None) -> List[dict] or None:
+    """
+    Streams through a craigslist RDF feed, building entries with only the
+    fields the templates use: id, title, link, summary and enc_enclosure.
+    Items are parsed one at a time and discarded from the tree as they're
+    read.  Known posts are left out, and parsing stops after a run of them:
+    a renewed old post is bumped to the top of the feed, above posts that
+    are new, so stopping at the first would miss those.
+
+    :param body: feed body
+    :param known: returns True for post IDs that have already been seen
+    :param known_run: known posts in a row to stop after, by default Config.known_run
+    :return: list of entry dicts, None if the feed isn't craigslist shaped
+    """
+    known_run = Config.known_run if known_run is None else known_run
+    entries = []
+    run = 0
+    try:
+        events = ElementTree.iterparse(BytesIO(body), events=('start', 'end'))
+        _, root = next(events)
+        if root.tag != f'{RDF}RDF':
+            return None
+        for event, element in events:
+            if event != 'end' or element.tag != f'{RSS}item':
+                continue
+            entry = _entry(element)
+            # Items are children of the root, so clearing it drops everything read so far
+            root.clear()
+            if entry is None:
+                return None
+            if known is not None and known(entry['id']):
+                run += 1
+                if run >= known_run:
+                    break
+                continue
+            run = 0
+            entries.append(entry)
+    except (ElementTree.ParseError, StopIteration):
+        return None
+    return entries
+
+
+def _entry(item: ElementTree.Element) -> dict or None:
+    """
+    Builds an entry from an RSS 1.0 <item>
+    :return: dict, None if the item has no usable ID
+    """
+    link = item.findtext(f'{RSS}link', '').strip()
+    post_id = item.get(f'{RDF}about') or link
+    if not post_id:
+        return None
+    entry = {'id': post_id,
+             'title': item.findtext(f'{RSS}title', '').strip(),
+             'link': link or post_id,
+             'summary': item.findtext(f'{RSS}description', '').strip()}
+    enclosure = item.find(f'{ENC}enclosure')
+    if enclosure is not None:
+        entry['enc_enclosure'] = {'resource': enclosure.get('resource', ''),
+                                  'type': enclosure.get('type', '')}
+    return entry
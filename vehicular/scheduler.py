@@ -0,0 +1,40 @@
+"""
+Contains the adaptive polling schedule used to decide when each search is due
+"""
+from vehicular.config import Config
+
+
+def poll_rate(rate: float or None, new_hits: int, elapsed: float) -> float or None:
+    """
+    Folds the result of one poll into a search's smoothed rate of new posts.
+    Uses an exponentially weighted moving average so a single busy or quiet
+    hour doesn't swing the schedule too far.
+
+    :param rate: previous rate in new posts per second, None if unknown
+    :param new_hits: number of new posts the poll found
+    :param elapsed: seconds since the previous poll
+    :return: updated rate, None if there still isn't enough data for one
+    """
+    if elapsed <= 0:
+        return rate
+    observed = new_hits / elapsed
+    if rate is None:
+        return observed
+    return Config.rate_smoothing * observed + (1 - Config.rate_smoothing) * rate
+
+
+def poll_interval(rate: float or None) -> int:
+    """
+    Returns how long to wait before polling a search again.  Aims for about
+    Config.target_hits new posts per poll, clamped between Config.min_interval
+    and Config.max_interval, so busy searches are polled often and quiet ones
+    are left alone.
+
+    :param rate: smoothed rate in new posts per second, None if unknown
+    :return: interval in seconds
+    """
+    if rate is None:
+        return Config.default_interval
+    if rate <= 0:
+        return Config.max_interval
+    return int(min(Config.max_interval, max(Config.min_interval, Config.target_hits / rate)))
@@ -0,0 +1,143 @@
+"""
+Contains SeenSet, the compact set of posts a search has already seen
+"""
+from array import array
+from bisect import bisect_left
+import sys
+from typing import Iterable, Iterator
+
+from vehicular.listing import parse_post_id
+
+# Largest post ID a 64 bit array can hold
+MAX_ID = 2 ** 63 - 1
+
+
+class SeenSet:
+    """
+    Posts a search has already seen.  Craigslist's numeric post IDs are kept
+    in a sorted array of 64 bit ints, searched with bisect, and stored as a
+    single BLOB per search: 8 bytes a post rather than its url, and one row
+    read per search rather than one per post.  The BLOB is only decoded on
+    first use.  Posts without a numeric ID, which only feeds from elsewhere
+    have, are kept as they are.  Membership is checked with post urls.
+    """
+
+    def __init__(self, blob: bytes = None, others: Iterable[str] = ()):
+        """
+        :param blob: sorted post IDs, see to_blob
+        :param others: post IDs that aren't numeric
+        """
+        self._blob = blob
+        self._ids = None
+        self.others = set(others)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({len(self)} posts)>'
+
+    def __len__(self) -> int:
+        return len(self.ids) + len(self.others)
+
+    def __iter__(self) -> Iterator[str]:
+        """
+        Yields each post ID, numeric ones as strings
+        """
+        yield from self.others
+        yield from map(str, self.ids)
+
+    def __contains__(self, post: str) -> bool:
+        """
+        :param post: post url, or other post ID
+        """
+        number = post_number(post)
+        if number is None:
+            return post in self.others
+        return self._has(number)
+
+    def __getstate__(self) -> dict:
+        return {'blob': self.to_blob(), 'others': self.others}
+
+    def __setstate__(self, state: dict) -> None:
+        self.__init__(state['blob'], state['others'])
+
+    @property
+    def ids(self) -> array:
+        """
+        Sorted numeric post IDs, decoded from the BLOB on first use
+        """
+        if self._ids is None:
+            self._ids = array('q')
+            if self._blob:
+                self._ids.frombytes(self._blob)
+                if sys.byteorder != 'little':
+                    self._ids.byteswap()
+            self._blob = None
+        return self._ids
+
+    def add(self, posts: Iterable[str]) -> None:
+        """
+        Merges new posts in, each inserted at its place in the array
+        :param posts: post urls, or other post IDs
+        """
+        new = set()
+        for post in posts:
+            number = post_number(post)
+            if number is None:
+                self.others.add(post)
+            elif not self._has(number):
+                new.add(number)
+        if len(new) > 64:
+            # Cheaper to rebuild than to shift the array once per post
+            self._ids = array('q', sorted(new.union(self.ids)))
+            return
+        ids = self.ids
+        for number in sorted(new):
+            ids.insert(bisect_left(ids, number), number)
+
+    def to_blob(self) -> bytes:
+        """
+        Returns the numeric post IDs as little endian 64 bit ints
+        """
+        if self._ids is None:
+            return self._blob or b''
+        if sys.byteorder == 'little':
+            return self._ids.tobytes()
+        ids = array('q', self._ids)
+        ids.byteswap()
+        return ids.tobytes()
+
+    def intersection(self, *others: 'SeenSet') -> 'SeenSet':
+        """
+        Returns the posts every one of these sets has seen
+        """
+        if not others:
+            return self
+        ids = set(self.ids).intersection(*(other.ids for other in others))
+        common = SeenSet(others=self.others.intersection(*(other.others for other in others)))
+        common._ids = array('q', sorted(ids))
+        return common
+
+    def union(self, *others: 'SeenSet') -> 'SeenSet':
+        """
+        Returns the posts any of these sets has seen
+        """
+        ids = set(self.ids).union(*(other.ids for other in others))
+        combined = SeenSet(others=self.others.union(*(other.others for other in others)))
+        combined._ids = array('q', sorted(ids))
+        return combined
+
+    def _has(self, number: int) -> bool:
+        """
+        Returns True if a numeric post ID has been seen
+        """
+        ids = self.ids
+        index = bisect_left(ids, number)
+        return index < len(ids) and ids[index] == number
+
+
+def post_number(post: str) -> int or None:
+    """
+    Returns the numeric ID of a post url, None if it doesn't have one that fits
+    """
+    number = parse_post_id(post)
+    if number is not None and number <= MAX_ID:
+        return number
@@ -0,0 +1,124 @@
+"""
+Contains Sender, which emails the listings search runs leave in the outbox
+"""
+import sys
+import threading
+from time import time
+
+from vehicular.config import Config
+from vehicular.database import Database
+from vehicular.message import Message, SMTPPool
+
+
+class Sender:
+    """
+    Drains the outbox, so notifying runs at its own pace rather than as part
+    of a search run.  A failed send leaves its listings queued, to be retried
+    with exponential backoff, and a slow SMTP server doesn't hold up the next
+    poll.  Hits are batched into digests, see Config.digest_interval.  Each
+    drain opens its own database connection, so it can run on any thread.
+    """
+
+    def __init__(self, database: str = Config.database, smtp: SMTPPool = None):
+        """
+        :param database: sqlite3 database file
+        :param smtp: SMTPPool to send over, shared with the caller
+        """
+        self.db_file = database
+        self.smtp = smtp or SMTPPool()
+        self._lock = threading.Lock()
+        self._state = threading.Lock()
+        self._thread = None
+        self._again = False
+        # Listings sent by background drains, see start
+        self.sent = 0
+        # Why sends failed, for the caller to report
+        self.errors = []
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({self.db_file})>'
+
+    def drain(self, force: bool = False) -> int:
+        """
+        Sends queued listings, Config.outbox_batch per email, until the outbox
+        is empty or a send fails.  Nothing is sent until the digest window
+        closes, see next_send.  Only one drain runs at a time, so listings
+        can't be sent twice.
+        :param force: send whatever's ready without waiting for the digest window
+        :return: number of listings sent
+        """
+        import smtplib
+        sent = 0
+        with self._lock, Database(self.db_file) as db:
+            credentials = db.credentials
+            if not credentials or not all(credentials):
+                return sent
+            next_send = self.next_send(db)
+            if next_send is None or not force and next_send > time():
+                return sent
+            user, password, recipient = credentials
+            session = self.smtp.session(user, password)
+            while True:
+                now = time()
+                queued = db.get_outbox(now, Config.outbox_batch)
+                if not queued:
+                    break
+                ids = [row_id for row_id, _ in queued]
+                try:
+                    Message(user, password, recipient, [listing for _, listing in queued]).send(session)
+                except (smtplib.SMTPException, OSError) as exc:
+                    print(f'Error sending notification, will retry: {exc}', file=sys.stderr)
+                    self.errors.append(str(exc))
+                    db.defer_outbox(now)
+                    break
+                db.remove_outbox(ids)
+                sent += len(ids)
+        return sent
+
+    @staticmethod
+    def next_send(db: Database) -> float or None:
+        """
+        Returns when the outbox should next be drained: once its oldest listing
+        has waited Config.digest_interval, or as soon as Config.digest_size
+        listings are queued, but not before a failed send's backoff is up.
+        :param db: open Database
+        :return: unix time, None if the outbox is empty
+        """
+        count, oldest, next_attempt = db.get_outbox_summary()
+        if not count:
+            return None
+        if count >= Config.digest_size:
+            return next_attempt
+        return max(oldest + Config.digest_interval, next_attempt)
+
+    def start(self) -> None:
+        """
+        Drains the outbox on a background thread.  If a background drain is
+        already running, it drains once more when it's done instead, so
+        listings a search run queues while it's sending aren't left behind.
+        """
+        with self._state:
+            self._again = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def _run(self) -> None:
+        """
+        Background thread of start
+        """
+        while True:
+            with self._state:
+                if not self._again:
+                    self._thread = None
+                    return
+                self._again = False
+            self.sent += self.drain()
+
+    def join(self) -> None:
+        """
+        Waits for background drains to finish
+        """
+        thread = self._thread
+        if thread is not None:
+            thread.join()
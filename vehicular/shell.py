@@ -2,16 +2,11 @@
 Contains classes that extend cmd.Cmd shell, implementing various search options
 storage and autocompletion of said options.
 """
-
-try:
-    import gnureadline
-except ImportError:
-    import readline
-    gnureadline = readline
+from bisect import bisect_left
 import cmd
 from os import path
 import sys
-from typing import List
+from typing import Iterable, List
 
 from vehicular.dicts import (CAR_SIZE,
                              CAR_TYPE,
@@ -21,14 +16,62 @@ from vehicular.dicts import (CAR_SIZE,
                              CYLINDER_COUNT,
                              DRIVETRAIN,
                              FUEL_TYPES,
+                             REGIONS,
                              TITLE_STATUS,
                              TRANSMISSION)
 
 
-sys.modules['readline'] = gnureadline
 PICKLE_FILE = path.join(path.dirname(__file__), 'cities.p')
 
 
+class PrefixIndex:
+    """
+    Fixed set of option values, indexed for tab completion and validation.
+    Completions come from a sorted copy searched with bisect, so a tab press
+    costs a binary search plus the matches rather than a scan of every value,
+    and membership tests go through a frozenset.  Iterates in the original
+    order, for help messages.
+    """
+
+    def __init__(self, options: Iterable[str]):
+        """
+        :param options: valid values
+        """
+        self.options = tuple(options)
+        self._sorted = tuple(sorted(self.options))
+        self._set = frozenset(self.options)
+
+    def __contains__(self, option: str) -> bool:
+        return option in self._set
+
+    def __iter__(self):
+        return iter(self.options)
+
+    def __len__(self) -> int:
+        return len(self.options)
+
+    def __repr__(self) -> str:
+        return f'<{self.__class__.__name__}({len(self)} options)>'
+
+    def complete(self, prefix: str) -> List[str]:
+        """
+        Returns every value that starts with prefix, in sorted order
+        """
+        completions = []
+        for option in self._sorted[bisect_left(self._sorted, prefix):]:
+            if not option.startswith(prefix):
+                break
+            completions.append(option)
+        return completions
+
+    def suggest(self, option: str, count: int = 3) -> List[str]:
+        """
+        Returns the values closest to a misspelt one, best match first
+        """
+        from difflib import get_close_matches
+        return get_close_matches(option, self._sorted, count)
+
+
 class BaseShell(cmd.Cmd):
     """
     Creates shell environment
@@ -60,14 +103,18 @@ class BaseShell(cmd.Cmd):
     """
 
     CITY_DICT = CITIES
-    CITIES = [city for city in CITY_DICT]
-    VEHICLE_TYPES = 'motorcycle', 'cars/trucks'
-    SELLER_TYPES = 'dealer', 'owner', 'both'
+    CITIES = PrefixIndex(CITY_DICT)
+    REGION_DICT = REGIONS
+    REGIONS = PrefixIndex(REGION_DICT)
+    VEHICLE_TYPES = PrefixIndex(('motorcycle', 'cars/trucks'))
+    SELLER_TYPES = PrefixIndex(('dealer', 'owner', 'both'))
 
     def __init__(self):
         super(BaseShell, self).__init__()
         #  Required args
         self.city = None
+        #  Set instead of city by searches spanning several cities
+        self.cities = None
         self.vehicle_type = None
         self.make_model = None
         self.seller_type = 'both'
@@ -86,6 +133,7 @@ class BaseShell(cmd.Cmd):
         self.max_price = None
         self.min_year = None
         self.max_year = None
+        self.exclude = None
         #  Options with specific possible values
         self.title_status = None
         self.condition = None
@@ -98,6 +146,18 @@ class BaseShell(cmd.Cmd):
         self.cage_type = None
         self.cage_size = None
 
+    def preloop(self) -> None:
+        """
+        Sets up readline, which cmd imports when the loop starts.  gnureadline
+        is preferred where it's installed.  Done here rather than at import time
+        so that commands which never start the loop don't pay for it.
+        """
+        try:
+            import gnureadline
+        except ImportError:
+            return
+        sys.modules['readline'] = gnureadline
+
     def __enter__(self):
         return self
 
@@ -130,10 +190,14 @@ class BaseShell(cmd.Cmd):
         """
         if city in self.CITIES:
             self.city = city
+            self.cities = None
             print(f'City set to {city}.')
         else:
             print(f'Invalid city: `{city}`.  Be sure to enter exactly what is '
                   f'suggested')
+            suggestions = self.CITIES.suggest(city)
+            if suggestions:
+                print(f'Did you mean: {", ".join(suggestions)}?')
 
     def complete_city(self,
                       text: str,
@@ -148,11 +212,7 @@ class BaseShell(cmd.Cmd):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.CITIES[:]
-        else:
-            completions = [city for city in self.CITIES if city.startswith(text)]
-        return completions
+        return self.CITIES.complete(text)
 
     @staticmethod
     def help_city() -> None:
@@ -167,6 +227,90 @@ class BaseShell(cmd.Cmd):
                      'what is in the list, it will be rejected.']
         help_message(initial_desc, usage, long_desc)
 
+    def do_cities(self, cities: str) -> None:
+        """
+        Sets self.cities, so that the search covers each of the cities
+        :param cities: city names, separated by spaces or commas
+        :return:
+        """
+        cities = list(dict.fromkeys(cities.replace(',', ' ').split()))
+        invalid = [city for city in cities if city not in self.CITIES]
+        if not cities:
+            print('Enter at least one city.')
+        elif invalid:
+            print(f'Invalid cities: `{" ".join(invalid)}`.  Be sure to enter exactly what is '
+                  f'suggested')
+            for city in invalid:
+                suggestions = self.CITIES.suggest(city)
+                if suggestions:
+                    print(f'Instead of {city}, did you mean: {", ".join(suggestions)}?')
+        else:
+            self.cities = cities
+            self.city = None
+            print(f'Cities set to {", ".join(cities)}.')
+
+    def complete_cities(self,
+                        text: str,
+                        line: str,
+                        start_index: int,
+                        end_index: int) -> List[str]:
+        """
+        Sets up auto completion for each of the cities
+        """
+        return self.CITIES.complete(text)
+
+    @staticmethod
+    def help_cities() -> None:
+        """
+        Prints help for cities command
+        """
+        initial_desc = 'Used to search several cities at once'
+        usage = 'Usage: `cities <city> <city> ...`', \
+                'ex: `cities denver boulder` searches both Denver and Boulder, CO.'
+        long_desc = ['The search is stored once, and new posts from every city are sent together.',
+                     'Cities autocomplete the same way as for the `city` command.  Replaces any',
+                     'city or region set before.']
+        help_message(initial_desc, usage, long_desc)
+
+    def do_region(self, region: str) -> None:
+        """
+        Sets self.cities to every city in a region
+        :param region: state, province or part of the world
+        :return:
+        """
+        if region in self.REGIONS:
+            self.cities = list(self.REGION_DICT[region])
+            self.city = None
+            print(f'Region set to {region}: {len(self.cities)} cities.')
+        else:
+            print(f'Invalid region: `{region}`.  Be sure to enter exactly what is '
+                  f'suggested')
+            suggestions = self.REGIONS.suggest(region)
+            if suggestions:
+                print(f'Did you mean: {", ".join(suggestions)}?')
+
+    def complete_region(self,
+                        text: str,
+                        line: str,
+                        start_index: int,
+                        end_index: int) -> List[str]:
+        """
+        Sets up auto completion for regions
+        """
+        return self.REGIONS.complete(text)
+
+    @staticmethod
+    def help_region() -> None:
+        """
+        Prints help for region command
+        """
+        initial_desc = 'Used to search every city in a state, province or part of the world'
+        usage = 'Usage: `region <region>`', 'ex: `region colorado` searches all 8 Colorado cities.'
+        long_desc = ['The search is stored once, and new posts from every city are sent together.',
+                     'Pressing <tab> autocompletes available regions.  Replaces any city or',
+                     'cities set before.']
+        help_message(initial_desc, usage, long_desc)
+
     def do_vehicle_type(self, vehicle_type) -> None:
         """
 
@@ -197,12 +341,7 @@ class BaseShell(cmd.Cmd):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.VEHICLE_TYPES[:]
-        else:
-            completions = [type_ for type_ in self.VEHICLE_TYPES if
-                           type_.startswith(text)]
-        return completions
+        return self.VEHICLE_TYPES.complete(text)
 
     @staticmethod
     def help_vehicle_type() -> None:
@@ -238,12 +377,7 @@ class BaseShell(cmd.Cmd):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.SELLER_TYPES[:]
-        else:
-            completions = [option for option in self.SELLER_TYPES if
-                           option.startswith(text)]
-        return completions
+        return self.SELLER_TYPES.complete(text)
 
     @staticmethod
     def help_seller_type() -> None:
@@ -571,17 +705,42 @@ class OpenEndedShell(BoolShell):
         usage = 'Usage: `make_model <make>`', 'ex: make_model toyota tacoma'
         help_message(initial_desc, usage, None)
 
+    def do_exclude(self, words: str) -> None:
+        """
+        Allows user to specify words that rule a post out.  Craigslist doesn't
+        filter on these, so they're checked against each post's title and
+        description as it comes in.
+        :param words: str, space separated words
+        :return: None
+        """
+        if words.split():
+            self.exclude = f'exclude={"+".join(words.split())}'
+            print(f'Excluding posts mentioning: {", ".join(words.split())}.')
+        else:
+            print('Be sure to enter at least one word to exclude')
+
+    @staticmethod
+    def help_exclude() -> None:
+        """
+        Prints help message for exclude
+        """
+        initial_desc = 'Used to skip posts that mention any of the given words.'
+        usage = 'Usage: `exclude <word> <word> ...`', 'ex: exclude salvage parts'
+        long_desc = 'Words are matched against the start of words in the post title and ' \
+                    'description, so `salvage` also excludes `salvaged`.',
+        help_message(initial_desc, usage, long_desc)
+
 
 class SpecificOptionsShell(OpenEndedShell):
     """
     Used to implement options that have specific options
     """
-    CONDITIONS = 'new', 'like-new', 'excellent', 'good', 'fair', 'salvage'
-    FUEL = 'gas', 'diesel', 'hybrid', 'electric', 'other'
-    COLOR = 'black', 'blue', 'brown', 'green', 'grey', 'orange', 'purple', \
-            'red', 'silver', 'white', 'yellow', 'other'
-    TRANSMISSION = 'manual', 'automatic', 'other'
-    TITLE_STATUS = 'clean', 'salvage', 'rebuilt', 'parts-only', 'lien', 'missing'
+    CONDITIONS = PrefixIndex(('new', 'like-new', 'excellent', 'good', 'fair', 'salvage'))
+    FUEL = PrefixIndex(('gas', 'diesel', 'hybrid', 'electric', 'other'))
+    COLOR = PrefixIndex(('black', 'blue', 'brown', 'green', 'grey', 'orange', 'purple',
+                         'red', 'silver', 'white', 'yellow', 'other'))
+    TRANSMISSION = PrefixIndex(('manual', 'automatic', 'other'))
+    TITLE_STATUS = PrefixIndex(('clean', 'salvage', 'rebuilt', 'parts-only', 'lien', 'missing'))
 
     def do_condition(self, condition) -> None:
         """
@@ -619,12 +778,7 @@ class SpecificOptionsShell(OpenEndedShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.CONDITIONS[:]
-        else:
-            completions = [option for option in self.CONDITIONS
-                           if option.startswith(text)]
-        return completions
+        return self.CONDITIONS.complete(text)
 
     def do_title_status(self, status: str) -> None:
         """
@@ -660,12 +814,7 @@ class SpecificOptionsShell(OpenEndedShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.TITLE_STATUS[:]
-        else:
-            completions = [option for option in self.TITLE_STATUS
-                           if option.startswith(text)]
-        return completions
+        return self.TITLE_STATUS.complete(text)
 
     def do_fuel(self, fuel: str) -> None:
         """
@@ -701,11 +850,7 @@ class SpecificOptionsShell(OpenEndedShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.FUEL[:]
-        else:
-            completions = [option for option in self.FUEL if option.startswith(text)]
-        return completions
+        return self.FUEL.complete(text)
 
     def do_color(self, color: str) -> None:
         """
@@ -741,11 +886,7 @@ class SpecificOptionsShell(OpenEndedShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.COLOR[:]
-        else:
-            completions = [option for option in self.COLOR if option.startswith(text)]
-        return completions
+        return self.COLOR.complete(text)
 
     def do_transmission(self, variant: str) -> None:
         """
@@ -781,12 +922,7 @@ class SpecificOptionsShell(OpenEndedShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.TRANSMISSION[:]
-        else:
-            completions = [option for option in self.TRANSMISSION
-                           if option.startswith(text)]
-        return completions
+        return self.TRANSMISSION.complete(text)
 
 
 class CarShell(SpecificOptionsShell):
@@ -794,11 +930,11 @@ class CarShell(SpecificOptionsShell):
     Used to implement options specific to cars/trucks.  Motorcycles share all other
     options with cars
     """
-    CYLINDERS = '3', '4', '5', '6', '8', '10', '12', 'other'
-    DRIVE = 'fwd', 'rwd', '4wd'
-    SUBTYPES = 'bus', 'convertible', 'coupe', 'hatchback', 'minivan', 'offroad', \
-               'pickup', 'sedan', 'truck', 'suv', 'wagon', 'van', 'other'
-    CAR_SIZE = 'compact', 'full-size', 'mid-size', 'sub-compact'
+    CYLINDERS = PrefixIndex(('3', '4', '5', '6', '8', '10', '12', 'other'))
+    DRIVE = PrefixIndex(('fwd', 'rwd', '4wd'))
+    SUBTYPES = PrefixIndex(('bus', 'convertible', 'coupe', 'hatchback', 'minivan', 'offroad',
+                            'pickup', 'sedan', 'truck', 'suv', 'wagon', 'van', 'other'))
+    CAR_SIZE = PrefixIndex(('compact', 'full-size', 'mid-size', 'sub-compact'))
 
     def do_cylinders(self, count: str) -> None:
         """
@@ -837,11 +973,7 @@ class CarShell(SpecificOptionsShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.CYLINDERS[:]
-        else:
-            completions = [option for option in self.CYLINDERS if option.startswith(text)]
-        return completions
+        return self.CYLINDERS.complete(text)
 
     def do_drive_train(self, variant: str) -> None:
         """
@@ -880,11 +1012,7 @@ class CarShell(SpecificOptionsShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.DRIVE[:]
-        else:
-            completions = [option for option in self.DRIVE if option.startswith(text)]
-        return completions
+        return self.DRIVE.complete(text)
 
     def do_type(self, variant: str) -> None:
         """
@@ -923,11 +1051,7 @@ class CarShell(SpecificOptionsShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.SUBTYPES[:]
-        else:
-            completions = [option for option in self.SUBTYPES if option.startswith(text)]
-        return completions
+        return self.SUBTYPES.complete(text)
 
     def do_car_size(self, variant: str) -> None:
         """
@@ -957,11 +1081,7 @@ class CarShell(SpecificOptionsShell):
         :param end_index:
         :return:
         """
-        if not text:
-            completions = self.CAR_SIZE[:]
-        else:
-            completions = [option for option in self.CAR_SIZE if option.startswith(text)]
-        return completions
+        return self.CAR_SIZE.complete(text)
 
     @staticmethod
     def help_car_size():
@@ -1,25 +1,145 @@
 """
 Contains utility functions
 """
-import smtplib
+import os
+from typing import Dict, List
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
 
-from vehicular.config import Config
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# Spellings of a switched on toggle in CSV files, where every value is a string
+TRUE = '1', 'true', 'yes', 'y', 'x', 'on'
+FALSE = '0', 'false', 'no', 'n', 'off'
 
 
 def credential_validation(user: str, pw: str) -> bool:
     """
-    Creates a simple smtp server and attempts to log in to server using the
-    provided credentials. If the login attempt was successful, returns True,
-    False otherwise
+    Attempts to log in to the smtp server using the provided credentials.  If
+    the login attempt was successful, returns True, False otherwise
     :return: bool
     """
-    server = smtplib.SMTP(host=Config.hostname, port=Config.port)
-    server.starttls()
-    try:
-        status_code, *_ = server.login(user=user, password=pw)
-        server.quit()
-        if status_code == 235:
+    import smtplib
+    from vehicular.message import SMTPSession
+    with SMTPSession(user, pw) as session:
+        try:
+            session.open()
+        except smtplib.SMTPAuthenticationError:
+            return False
+    return True
+
+
+def feed_url(url: str) -> str:
+    """
+    Strips the `feed:` pseudo-scheme, which feedparser accepts but HTTP doesn't.
+    `feed:https://host/path` becomes `https://host/path` and `feed://host/path`
+    becomes `http://host/path`
+    :param url: url to clean up
+    :return: plain http(s) url
+    """
+    if url.startswith('feed://'):
+        return 'http://' + url[len('feed://'):]
+    if url.startswith('feed:'):
+        return url[len('feed:'):]
+    return url
+
+
+def canonical_url(url: str) -> str:
+    """
+    Normalizes a search url so that equivalent searches compare equal: the
+    `feed:` prefix is dropped, scheme and host are lower-cased, default ports
+    removed and the query parameters de-duplicated and sorted.  Empty
+    parameters are dropped, and spaces are always encoded as `+`.
+
+    ex: `feed:https://Denver.craigslist.org/search/mca?format=rss&auto_make_model=drz`
+    becomes `https://denver.craigslist.org/search/mca?auto_make_model=drz&format=rss`
+
+    :param url: search url
+    :return: canonical url.  Strings that aren't absolute urls are returned unchanged.
+    """
+    parts = urlsplit(feed_url(url))
+    if not parts.scheme or not parts.hostname:
+        return url
+    scheme = parts.scheme.lower()
+    netloc = parts.hostname
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc = f'{netloc}:{parts.port}'
+    query = sorted({(key, value) for key, value in parse_qsl(parts.query) if value})
+    return urlunsplit((scheme, netloc, parts.path or '/', urlencode(query), ''))
+
+
+def read_searches(path: str) -> List[Dict[str, str or bool]]:
+    """
+    Reads searches to import from a CSV, JSON or TOML file, picked by extension.
+    Each search maps option names, the same as the shell commands, to their
+    values, plus an optional `name`.
+    CSV: a header row of option names, then one search per row.  Blank cells
+        are skipped.
+    Toggles are switched on by true or one of TRUE, such as `yes` or `x`, and
+    left off by false, one of FALSE or a blank, in every format.
+    JSON: a list of objects, or an object with a `searches` list.
+    TOML: an array of `[[searches]]` tables.
+
+    :param path: file to read
+    :return: list of searches, in file order
+    :raises ValueError: if the file type isn't supported, it can't be parsed or
+        a toggle's value isn't one of those above
+    """
+    from vehicular.cli import FLAG_OPTIONS
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.csv':
+        import csv
+        with open(path, newline='', encoding='utf-8-sig') as file:
+            rows = list(csv.DictReader(file))
+        for number, row in enumerate(rows, 1):
+            if None in row:
+                raise ValueError(f'Search {number} has more cells than the header.')
+            for key, value in row.items():
+                row[key] = (value or '').strip() or None
+    elif extension == '.json':
+        import json
+        with open(path, encoding='utf-8') as file:
+            try:
+                rows = json.load(file)
+            except json.JSONDecodeError as exc:
+                raise ValueError(f'Invalid JSON: {exc}')
+    elif extension == '.toml':
+        try:
+            import tomllib
+        except ImportError:
+            # Python < 3.11
+            try:
+                import tomli as tomllib
+            except ImportError:
+                raise ValueError('Reading TOML needs Python 3.11 or the tomli package.')
+        with open(path, 'rb') as file:
+            try:
+                rows = tomllib.load(file)
+            except tomllib.TOMLDecodeError as exc:
+                raise ValueError(f'Invalid TOML: {exc}')
+    else:
+        raise ValueError(f'Unsupported file type: `{extension}`.  Use .csv, .json or .toml.')
+    if isinstance(rows, dict):
+        rows = rows.get('searches', [])
+    if not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        raise ValueError('Expected a list of searches.')
+    searches = [{key.strip().lower().replace('-', '_'): value
+                 for key, value in row.items() if key} for row in rows]
+    for number, search in enumerate(searches, 1):
+        for option in FLAG_OPTIONS:
+            if option in search:
+                search[option] = _toggle(search[option], number, option)
+    return searches
+
+
+def _toggle(value, number: int, option: str) -> bool:
+    """
+    Reads a toggle's value, see read_searches
+    :raises ValueError: if it isn't a bool or one of TRUE or FALSE
+    """
+    if value is None or isinstance(value, bool):
+        return bool(value)
+    if isinstance(value, str):
+        if value.strip().lower() in TRUE:
             return True
-    except smtplib.SMTPAuthenticationError:
-        pass
-    return False
+        if value.strip().lower() in FALSE + ('',):
+            return False
+    raise ValueError(f'Search {number}: invalid value for `{option}`: `{value}`.')